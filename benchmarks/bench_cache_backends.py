@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark cache lookups of a batch of queries in each backend (see
+dnsdb.backends): one ResultCache.get per query against one get_many for the
+batch, as search_many does. Redis is measured when a URL is given; the gap
+between the two grows with the round trip time to the server.
+
+USAGE:::
+
+PYTHONPATH=. python benchmarks/bench_cache_backends.py [redis://host:port/db]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from dnsdb.cache import ResultCache
+
+from bench_topk import make_records
+
+QUERIES = 200
+RECORDS = 100
+
+
+def lookups(location):
+    cache = ResultCache(location, timeout=600)
+    data = {
+        "records": make_records(RECORDS),
+        "status_code": 200,
+        "error": None,
+        "quota": None,
+    }
+    items = [
+        ("uri-{}".format(number), {"remote_limit": 0}) for number in range(QUERIES)
+    ]
+    for key, options in items:
+        cache.set(key, data, options)
+
+    start = time.perf_counter()
+    for key, options in items:
+        assert cache.get(key, options, lazy=True) is not None
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    assert None not in cache.get_many(items, lazy=True)
+    bulk = time.perf_counter() - start
+
+    for key, _ in items:
+        cache.disk.delete(key)
+    cache.close()
+    return single, bulk
+
+
+def main():
+    print("queries={} records={}".format(QUERIES, RECORDS))
+    print("{:<8} {:>12} {:>12}".format("backend", "get", "get_many"))
+
+    with tempfile.TemporaryDirectory() as directory:
+        locations = [
+            ("disk", os.path.join(directory, "disk")),
+            ("sqlite", "sqlite:///" + os.path.join(directory, "cache.db")),
+        ]
+        if len(sys.argv) > 1:
+            locations.append(("redis", sys.argv[1]))
+
+        for label, location in locations:
+            single, bulk = lookups(location)
+            print(
+                "{:<8} {:>10.1f}ms {:>10.1f}ms".format(
+                    label, single * 1e3, bulk * 1e3
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark the latency a cache store adds to a search: ResultCache.set
+encoding, compressing and writing synchronously against queuing the store
+for the background writer (write_queue), and the time to flush the queue.
+
+USAGE:::
+
+PYTHONPATH=. python benchmarks/bench_cache_write.py [records]
+"""
+
+import sys
+import tempfile
+import time
+
+from dnsdb.cache import ResultCache
+
+from bench_topk import make_records
+
+RESULTS = 8
+
+
+def timed_sets(cache, data):
+    latencies = []
+    for index in range(RESULTS):
+        start = time.perf_counter()
+        cache.set("uri-{}".format(index), data)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    cache.flush()
+    return max(latencies), time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    data = {
+        "records": make_records(count),
+        "status_code": 200,
+        "error": None,
+        "quota": None,
+    }
+
+    print("records={} results={}".format(count, RESULTS))
+    print("{:<14} {:>14} {:>10}".format("store", "max set", "flush"))
+
+    for label, write_queue in (("synchronous", 0), ("write-behind", RESULTS)):
+        with tempfile.TemporaryDirectory() as location:
+            cache = ResultCache(location, write_queue=write_queue)
+            latency, flush = timed_sets(cache, data)
+            cache.close()
+        print("{:<14} {:>12.2f}ms {:>8.0f}ms".format(label, latency * 1e3, flush * 1e3))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark the cache codecs (see dnsdb.codecs): encode and decode time and
+stored size of results of typical DNSDB sizes, against json+gzip:9, the
+format written before codecs. The ratio is the size of the records as JSON
+over the stored size. Codecs whose optional library is not installed are
+skipped.
+
+USAGE:::
+
+PYTHONPATH=. python benchmarks/bench_codecs.py [records ...]
+"""
+
+import gc
+import json
+import sys
+import time
+
+from dnsdb.codecs import LEGACY, get_codec
+
+from bench_topk import make_records
+
+CODECS = (
+    LEGACY,
+    "json+gzip:6",
+    "json+gzip:1",
+    "json+zlib:1",
+    "json+none",
+    "json+zstd:3",
+    "json+lz4",
+    "msgpack+none",
+    "msgpack+zstd:3",
+    "records+none",
+    "records+zlib:1",
+    "records+gzip:6",
+    "records+zstd:3",
+    "records+lz4",
+)
+
+
+def best_of(func, repeat=5):
+    # collections triggered by other runs would be charged to this one
+    gc.collect()
+    gc.disable()
+    try:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func()
+            times.append(time.perf_counter() - start)
+        return min(times), result
+    finally:
+        gc.enable()
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 50000]
+
+    for count in sizes:
+        records = make_records(count)
+        json_size = len(json.dumps(records).encode("utf-8"))
+
+        print("records={}".format(count))
+        print(
+            "{:<16} {:>10} {:>10} {:>12} {:>7}".format(
+                "codec", "encode", "decode", "bytes", "ratio"
+            )
+        )
+
+        for name in CODECS:
+            try:
+                codec = get_codec(name)
+            except ImportError:
+                continue
+
+            encode_time, (body, _) = best_of(lambda: codec.encode(records))
+            decode_time, (decoded, _) = best_of(lambda: codec.decode(body))
+            assert decoded == records, name
+
+            print(
+                "{:<16} {:>8.1f}ms {:>8.1f}ms {:>12,} {:>6.1f}x".format(
+                    name,
+                    encode_time * 1e3,
+                    decode_time * 1e3,
+                    len(body),
+                    json_size / len(body),
+                )
+            )
+        print()
+
+
+if __name__ == "__main__":
+    main()
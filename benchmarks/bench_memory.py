@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark the memory held by a post-processed result: the default list of
+dictionaries against the columnar RecordSet used with compact=True.
+Allocations are measured with tracemalloc while each representation is
+built from freshly decoded records.
+
+USAGE:::
+
+PYTHONPATH=. python benchmarks/bench_memory.py [records]
+"""
+
+import gc
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+from dnsdb import Result
+from dnsdb import utils
+
+
+def make_lines(count):
+    """ NDJSON lines shaped like a wildcard lookup: names and rdata repeat """
+    rng = random.Random(count)
+    lines = []
+    for index in range(count):
+        time_first = rng.randint(1262304000, 1546300800)
+        record = {
+            "count": rng.randint(1, 100000),
+            "time_first": time_first,
+            "time_last": time_first + rng.randint(0, 86400 * 365),
+            "rrname": "host{}.fsi.io.".format(index % (count // 8 + 1)),
+            "rrtype": rng.choice(("A", "AAAA", "NS", "MX")),
+            "bailiwick": "fsi.io.",
+            "rdata": ["104.244.{}.{}".format(rng.randint(0, 15), rng.randint(0, 255))],
+        }
+        lines.append(json.dumps(record))
+    return lines
+
+
+def measure(lines, compact):
+    options = {
+        "sort": False,
+        "epoch": False,
+        "return_limit": len(lines),
+        "compact": compact,
+    }
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    records = [json.loads(line) for line in lines]
+    result = utils.post_process(options, Result(records=records))
+    del records
+
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak, elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    lines = make_lines(count)
+
+    print("records={}".format(count))
+    print("{:>10} {:>10} {:>10} {:>9}".format("", "retained", "peak", "time"))
+
+    retained = dict()
+    for compact in (False, True):
+        result, current, peak, elapsed = measure(lines, compact)
+        label = "RecordSet" if compact else "dicts"
+        retained[compact] = current
+        print(
+            "{:>10} {:>8.1f}MB {:>8.1f}MB {:>8.3f}s".format(
+                label, current / 2 ** 20, peak / 2 ** 20, elapsed
+            )
+        )
+        del result
+
+    print("retained ratio {:.1f}x".format(retained[False] / retained[True]))
+
+
+if __name__ == "__main__":
+    main()
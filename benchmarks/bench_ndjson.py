@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark parsing of a large NDJSON response: the previous
+resp.iter_lines() + decode + json.loads loop against ndjson.read_ndjson (as
+used by Dnsdb.search) with each installed decoder.
+
+USAGE:::
+
+PYTHONPATH=. python benchmarks/bench_ndjson.py [records]
+"""
+
+import io
+import json
+import sys
+import time
+
+from requests.models import Response
+
+from dnsdb import ndjson
+
+
+def make_body(count):
+    lines = []
+    for index in range(count):
+        record = {
+            "count": index,
+            "time_first": 1381267249 + index,
+            "time_last": 1538006017 + index,
+            "rrname": "host{}.fsi.io.".format(index),
+            "rrtype": "A",
+            "bailiwick": "fsi.io.",
+            "rdata": ["104.244.{}.{}".format(index % 256, index // 256 % 256)],
+        }
+        lines.append(json.dumps(record))
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def make_response(body):
+    resp = Response()
+    resp.status_code = 200
+    resp.raw = io.BytesIO(body)
+    return resp
+
+
+def iter_lines_loop(body):
+    """ the parsing loop used before ndjson """
+    records = []
+    for line in make_response(body).iter_lines():
+        if line:
+            decoded_line = line.decode("utf-8")
+            records.append(json.loads(decoded_line))
+    return records
+
+
+def ndjson_loop(body, decoder):
+    resp = make_response(body)
+    chunks = resp.iter_content(chunk_size=ndjson.READ_SIZE)
+    return ndjson.read_ndjson(chunks, decoder)
+
+
+def timed(label, func, *args):
+    start = time.perf_counter()
+    records = func(*args)
+    elapsed = time.perf_counter() - start
+    print(
+        "{:<24} {:>8.3f}s {:>10.0f} records/s".format(
+            label, elapsed, len(records) / elapsed
+        )
+    )
+    return records
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    body = make_body(count)
+    print("{} records, {:.1f} MB".format(count, len(body) / 1e6))
+
+    expected = timed("iter_lines + json", iter_lines_loop, body)
+
+    for decoder in ("json", "orjson", "simdjson"):
+        try:
+            ndjson.get_decoder(decoder)
+        except ImportError:
+            print("{:<24} not installed".format("ndjson + " + decoder))
+            continue
+        records = timed("ndjson + " + decoder, ndjson_loop, body, decoder)
+        assert records == expected
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark CLI output throughput: the former print-per-record json output
+and two-pass csv output against the streaming cli.utils.Writer, writing
+post-processed records to /dev/null.
+
+USAGE:::
+
+PYTHONPATH=. python benchmarks/bench_output.py [records]
+"""
+
+import contextlib
+import csv
+import json
+import os
+import sys
+import time
+
+from dnsdb import Result
+from dnsdb import utils
+from dnsdb.cli.utils import Writer
+
+from bench_topk import make_records
+
+
+def json_before(records):
+    """ json output as done before the streaming writer """
+    for record in records:
+        print(json.dumps(record))
+
+
+def csv_before(records):
+    """ csv output as done before the streaming writer """
+    ordered_fieldname = (
+        "time_last",
+        "time_first",
+        "source",
+        "count",
+        "bailiwick",
+        "rrname",
+        "rrtype",
+        "rdata",
+    )
+    fieldnames = []
+    for record in records:
+        for key in list(record.keys()):
+            if key not in fieldnames:
+                fieldnames.append(key)
+    fieldnames = sorted(fieldnames, key=ordered_fieldname.index)
+
+    flattened_records = []
+    for record in records:
+        for rdata in record["rdata"]:
+            r = record
+            r["rdata"] = rdata
+            flattened_records.append(r)
+
+    writer = csv.DictWriter(sys.stdout, fieldnames)
+    for record in flattened_records:
+        writer.writerow(record)
+
+
+def streaming(oformat):
+    def write(records):
+        writer = Writer(oformat)
+        writer.write(records)
+        writer.flush()
+
+    return write
+
+
+def timed(func, records, devnull):
+    with contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        func(records)
+        sys.stdout.flush()
+        return time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    options = {"sort": False, "epoch": False, "return_limit": count}
+
+    print("records={}".format(count))
+    print("{:<8} {:>10} {:>10} {:>12} {:>8}".format(
+        "format", "before", "after", "records/s", "speedup"
+    ))
+
+    with open(os.devnull, "w") as devnull:
+        for oformat, before in (("json", json_before), ("csv", csv_before)):
+            # csv_before flattens rdata in place, so each run gets new records
+            records = utils.post_process(options, Result(records=make_records(count)))
+            before_time = timed(before, records.records, devnull)
+            records = utils.post_process(options, Result(records=make_records(count)))
+            after_time = timed(streaming(oformat), records.records, devnull)
+            print(
+                "{:<8} {:>9.3f}s {:>9.3f}s {:>12,.0f} {:>7.1f}x".format(
+                    oformat,
+                    before_time,
+                    after_time,
+                    count / after_time,
+                    before_time / after_time,
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark each stage of post processing: normalization, timestamp
+conversion and the whole pipeline, comparing the former three-pass
+implementation with the fused single pass of utils.iter_post_process.
+
+USAGE:::
+
+PYTHONPATH=. python benchmarks/bench_postprocess.py [records]
+"""
+
+import copy
+import gc
+import sys
+import time
+from datetime import datetime
+
+from dnsdb import Result
+from dnsdb import utils
+
+from bench_topk import make_records
+
+
+def normalize_before(records):
+    """ normalization as done before the fused pipeline """
+    normalized_records = []
+    for record in records:
+        normalized_record = dict()
+        normalized_record["source"] = "sensor"
+        for key in record.keys():
+            if key == "zone_time_first":
+                normalized_record["time_first"] = record[key]
+                normalized_record["source"] = "zone"
+            elif key == "zone_time_last":
+                normalized_record["time_last"] = record[key]
+                normalized_record["source"] = "zone"
+            else:
+                normalized_record[key] = record[key]
+        normalized_records.append(normalized_record)
+    return normalized_records
+
+
+def convert_before(records):
+    """ timestamp conversion as done before memoization """
+    for record in records:
+        for key in ["time_first", "time_last"]:
+            if key in record:
+                record[key] = datetime.fromtimestamp(record[key]).isoformat() + "Z"
+    return records
+
+
+def convert_after(records):
+    for record in records:
+        utils.record_to_timestamp(record)
+    return records
+
+
+def pipeline_before(options, records):
+    records = normalize_before(records)
+    if options["sort"]:
+        records = utils.sort(records)
+    records = records[0 : options["return_limit"]]
+    return convert_before(records)
+
+
+def pipeline_after(options, records):
+    return utils.post_process(options, Result(records=records)).records
+
+
+def timed(func, *args):
+    """ time a call with the garbage collector paused, as in read_ndjson """
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        value = func(*args)
+        return time.perf_counter() - start, value
+    finally:
+        gc.enable()
+
+
+def report(stage, before, after):
+    print(
+        "{:<24} {:>9.3f}s {:>9.3f}s {:>7.1f}x".format(
+            stage, before, after, before / after
+        )
+    )
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    records = make_records(count)
+    # repeat timestamps the way records of one lookup share observation times
+    for index, record in enumerate(records):
+        record["time_first"] = records[index // 4]["time_first"]
+        if index % 3 == 0:
+            record["zone_time_last"] = record.pop("time_last")
+
+    print("records={}".format(count))
+    print("{:<24} {:>10} {:>10} {:>8}".format("stage", "before", "after", "speedup"))
+
+    before, expected = timed(normalize_before, records)
+    after, actual = timed(utils.normalize, records)
+    assert actual == expected
+    report("normalize", before, after)
+
+    utils.format_timestamp.cache_clear()
+    before, expected = timed(convert_before, copy.deepcopy(expected))
+    after, actual = timed(convert_after, actual)
+    assert actual == expected
+    report("timestamps", before, after)
+
+    for sort in (False, True):
+        options = {"sort": sort, "epoch": False, "return_limit": count}
+        utils.format_timestamp.cache_clear()
+        before, expected = timed(pipeline_before, options, records)
+        after, actual = timed(pipeline_after, options, records)
+        assert actual == expected
+        assert [list(record) for record in actual] == [
+            list(record) for record in expected
+        ]
+        report("post_process sort={}".format(sort), before, after)
+
+
+if __name__ == "__main__":
+    main()
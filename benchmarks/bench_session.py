@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark per-query latency of a pooled session against a bare requests.get
+per query, using a local stand-in DNSDB server. With --tls the stand-in
+server uses a throwaway self-signed certificate (requires the openssl
+binary) so the TLS handshake cost is included, as it is for api.dnsdb.info.
+
+USAGE:::
+
+PYTHONPATH=. python benchmarks/bench_session.py [--tls] [queries]
+"""
+
+import json
+import os
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dnsdb import Dnsdb
+from dnsdb.dnsdb import _query
+
+RECORD = {
+    "count": 4838,
+    "time_first": 1433657594,
+    "time_last": 1538006017,
+    "rrname": "www.fsi.io.",
+    "rrtype": "A",
+    "bailiwick": "fsi.io.",
+    "rdata": ["104.244.13.104"],
+}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    body = (json.dumps(RECORD) + "\n").encode("utf-8") * 10
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+def run(label, func, queries):
+    start = time.perf_counter()
+    for _ in range(queries):
+        func()
+    elapsed = time.perf_counter() - start
+    print("{:<24} {:>8.3f} ms/query".format(label, elapsed / queries * 1000))
+    return elapsed
+
+
+def wrap_tls(server, directory):
+    cert = os.path.join(directory, "cert.pem")
+    key = os.path.join(directory, "key.pem")
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+            "-keyout", key, "-out", cert, "-days", "1",
+            "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1",
+        ],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    # trusted by both requests.get and the pooled session
+    os.environ["REQUESTS_CA_BUNDLE"] = cert
+
+
+def main():
+    args = sys.argv[1:]
+    tls = "--tls" in args
+    args = [arg for arg in args if arg != "--tls"]
+    queries = int(args[0]) if args else 500
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    directory = tempfile.TemporaryDirectory()
+    if tls:
+        wrap_tls(server, directory.name)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    scheme = "https" if tls else "http"
+    url = "{}://127.0.0.1:{}".format(scheme, server.server_address[1])
+
+    options = {"api_key": "12345"}
+    uri = url + "/lookup/rrset/name/www.fsi.io/ANY?limit=50000"
+
+    print("{} queries against {}".format(queries, url))
+
+    bare = run("requests.get per query", lambda: _query(options, uri), queries)
+
+    with Dnsdb("12345", server=url) as dnsdb:
+        pooled = run(
+            "pooled session", lambda: _query(options, uri, session=dnsdb.session),
+            queries,
+        )
+
+    saved = (bare - pooled) / queries * 1000
+    print("{:<24} {:>8.3f} ms/query".format("saved", saved))
+
+    server.shutdown()
+    directory.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark the per-call cost of parsing time filters: dateutil, as used
+before, against utils.parse_time, cold (first parse of a value) and
+memoized (repeated values, as in a batch of queries).
+
+USAGE:::
+
+PYTHONPATH=. python benchmarks/bench_timeparse.py [calls]
+"""
+
+import sys
+import time
+
+from dateutil.parser import parse
+
+from dnsdb import utils
+
+VALUES = (
+    ("epoch", "1546300800"),
+    ("ISO date", "2019-01-01"),
+    ("ISO UTC", "2018-06-13T02:05:36Z"),
+    ("ISO offset", "2018-06-13T04:05:36+02:00"),
+    ("relative", "-7d"),
+    ("fallback", "20160101T12"),
+)
+
+
+def per_call(func, values):
+    start = time.perf_counter()
+    for value in values:
+        func(value)
+    return (time.perf_counter() - start) / len(values) * 1e6
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    now = int(time.time())
+
+    print("calls={}".format(calls))
+    print("{:<12} {:>12} {:>12} {:>12}".format("form", "dateutil", "cold", "memoized"))
+
+    for label, value in VALUES:
+        try:
+            before = per_call(lambda v: int(parse(v).timestamp()), [value] * calls)
+        except (ValueError, OverflowError):
+            # dateutil cannot parse epoch or relative values at all
+            before = float("nan")
+
+        def cold_call(v):
+            utils._parse_absolute.cache_clear()
+            utils.parse_time(v, now)
+
+        cold = per_call(cold_call, [value] * calls)
+
+        memoized = per_call(lambda v: utils.parse_time(v, now), [value] * calls)
+
+        print(
+            "{:<12} {:>12} {:>12} {:>12}".format(
+                label, cell(before), cell(cold), cell(memoized)
+            )
+        )
+
+
+def cell(microseconds):
+    if microseconds != microseconds:
+        return "n/a"
+    return "{:.2f}us".format(microseconds)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark post-processing of large results with a small return_limit:
+a full sort with timestamp conversion of every record against the bounded
+top-k selection used by utils.post_process.
+
+USAGE:::
+
+PYTHONPATH=. python benchmarks/bench_topk.py [return_limit]
+"""
+
+import random
+import sys
+import time
+
+from dnsdb import Result
+from dnsdb import utils
+
+
+def make_records(count):
+    rng = random.Random(count)
+    records = []
+    for index in range(count):
+        time_first = rng.randint(1262304000, 1546300800)
+        records.append(
+            {
+                "count": rng.randint(1, 100000),
+                "time_first": time_first,
+                "time_last": time_first + rng.randint(0, 86400 * 365),
+                "rrname": "host{}.fsi.io.".format(index),
+                "rrtype": "A",
+                "bailiwick": "fsi.io.",
+                "rdata": ["104.244.{}.{}".format(index % 256, index // 256 % 256)],
+            }
+        )
+    return records
+
+
+def full_sort(options, records):
+    """ post processing as done before top-k selection """
+    records = utils.normalize(records)
+    records = utils.sort(records)
+    records = utils.epoch_to_timestamp(records)
+    return records[0 : options["return_limit"]]
+
+
+def top_k(options, records):
+    return utils.post_process(options, Result(records=records)).records
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    value = func(*args)
+    return time.perf_counter() - start, value
+
+
+def main():
+    return_limit = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    options = {"sort": True, "epoch": False, "return_limit": return_limit}
+
+    print("return_limit={}".format(return_limit))
+    print(
+        "{:>9} {:>12} {:>12} {:>8}".format("records", "full sort", "top-k", "speedup")
+    )
+
+    for count in (10000, 100000, 1000000):
+        records = make_records(count)
+        full_time, expected = timed(full_sort, options, records)
+        top_time, actual = timed(top_k, options, records)
+        assert actual == expected
+        print(
+            "{:>9} {:>10.3f}s {:>10.3f}s {:>7.1f}x".format(
+                count, full_time, top_time, full_time / top_time
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
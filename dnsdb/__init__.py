@@ -6,5 +6,30 @@ __author__ = 'Gabriel Iovino'
 __license__ = 'MIT'
 __copyright__ = 'Copyright (C) 2019 Gabriel Iovino'
 
-from .dnsdb import Dnsdb
-from .dnsdb import Result
+__all__ = ["Dnsdb", "Result", "AsyncDnsdb", "RateLimiter", "RecordSet"]
+
+# public names are imported from their modules on first use, so importing
+# the package (e.g. for the CLI) does not load the HTTP and parsing stacks
+_LAZY = {
+    "Dnsdb": ".dnsdb",
+    "Result": ".dnsdb",
+    "AsyncDnsdb": ".aio",
+    "RateLimiter": ".ratelimit",
+    "RecordSet": ".records",
+}
+
+
+def __getattr__(name):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+    from importlib import import_module
+
+    value = getattr(import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
@@ -0,0 +1,564 @@
+# -*- coding: utf-8 -*-
+""" Asyncio client for Farsight Security's DNSDB API
+
+AsyncDnsdb mirrors Dnsdb for asyncio applications. It requires the optional
+aiohttp dependency (pip install dnsdb[async]).
+
+INITIALIZE EXAMPLE::
+
+from dnsdb import AsyncDnsdb
+
+async with AsyncDnsdb(api_key) as dnsdb:
+    result = await dnsdb.search(name="fsi.io")
+    result = await dnsdb.quota()
+
+    result = await dnsdb.iter_search(name="fsi.io", sort=False)
+    async for record in result:
+        print(record)
+"""
+
+import asyncio
+from functools import partial
+from dnsdb import ndjson
+from dnsdb import utils
+from dnsdb.cache import DEFAULT_CODEC, ResultCache
+from dnsdb.flight import AsyncSingleFlight
+from dnsdb.dnsdb import (
+    Result,
+    _aiter,
+    _cache_get,
+    _cache_set,
+    _copy,
+    _finish,
+    _learn_results_max,
+    _limiter,
+    _options,
+    _read_limit,
+    _refresh_query,
+    _refreshed,
+    _retry,
+    _search_params,
+)
+
+
+class AsyncDnsdb:
+    """
+    An asyncio dnsdb object for the Farsight Security DNSDB API
+    """
+
+    def __init__(
+        self,
+        api_key=None,
+        server="https://api.dnsdb.info",
+        cache=False,
+        cache_location="/tmp/dnsdb-cache",
+        cache_timeout=900,
+        pool_maxsize=10,
+        keep_alive=True,
+        max_concurrency=None,
+        memory_cache_entries=0,
+        memory_cache_bytes=64 * 1024 * 1024,
+        coalesce=True,
+        rate_limit=False,
+        json_decoder="json",
+        compact=False,
+        cache_refresh=False,
+        cache_refresh_window=86400,
+        cache_write_queue=0,
+        cache_codec=DEFAULT_CODEC,
+        cache_size_limit=None,
+        cache_eviction_policy=None,
+        results_max=None,
+    ):
+        """
+        :param api_key: string (required)
+        :param server: string (optional: default='https://api.dnsdb.info')
+        :param cache: boolean (optional)
+            enable caching of dnsdb results to disk
+        :param cache_location: string (optional: default='/tmp/dnsdb-cache')
+            directory to store cached results, or a cache shared between
+            clients: sqlite:///path of a SQLite database or
+            redis://host:port/db of a Redis server (see dnsdb.backends)
+        :param cache_timeout: integer (optional: default=900)
+            seconds until the cached result expires
+        :param cache_refresh: boolean (optional: default=False)
+            refresh an expired cached result incrementally, see Dnsdb
+        :param cache_refresh_window: integer (optional: default=86400)
+            seconds an expired result is kept for cache_refresh
+        :param cache_write_queue: integer (optional: default=0)
+            write cached results in a background thread, see Dnsdb
+        :param cache_codec: string (optional: default="records+zlib:1")
+            codec cached records are stored with (see dnsdb.codecs)
+        :param cache_size_limit: integer (optional: default=None)
+            maximum size of the cache directory in bytes, see Dnsdb
+        :param cache_eviction_policy: string (optional: default=None)
+            eviction policy of the cache directory, see Dnsdb
+        :param results_max: integer (optional: default=None)
+            maximum number of results for the API key, see Dnsdb
+        :param pool_maxsize: integer (optional: default=10)
+            maximum number of connections kept open per host
+        :param keep_alive: boolean (optional: default=True)
+            reuse connections between queries
+        :param max_concurrency: integer (optional: default=None)
+            maximum number of requests in flight at once for search and quota
+        :param memory_cache_entries: integer (optional: default=0)
+            number of decoded results kept in an in-process LRU in front of
+            the disk cache; 0 disables the memory tier
+        :param memory_cache_bytes: integer (optional: default=64 MiB)
+            maximum size of the results kept in memory
+        :param coalesce: boolean (optional: default=True)
+            share one request (and one cache write) between tasks making an
+            identical query at the same time
+        :param rate_limit: boolean or RateLimiter (optional: default=False)
+            pace requests from the quota reported by DNSDB and retry 429
+            and 503 responses with jittered backoff
+        :param json_decoder: string (optional: default="json")
+            decoder of response records: json, orjson, simdjson or auto
+        :param compact: boolean (optional: default=False)
+            return the records of search and search_many in a columnar
+            RecordSet (see dnsdb.records) rather than a list of dictionaries
+        :return: object
+        """
+
+        self.api_key = api_key
+        self.server = server
+        self.cache = cache
+        self.cache_location = cache_location
+        self.cache_timeout = cache_timeout
+        self.pool_maxsize = pool_maxsize
+        self.keep_alive = keep_alive
+        self.max_concurrency = max_concurrency
+        self.memory_cache_entries = memory_cache_entries
+        self.memory_cache_bytes = memory_cache_bytes
+        self.coalesce = coalesce
+        self.limiter = _limiter(rate_limit)
+        self.json_decoder = json_decoder
+        self.compact = compact
+        self.cache_refresh = cache_refresh
+        self.cache_refresh_window = cache_refresh_window
+        self.cache_write_queue = cache_write_queue
+        self.cache_codec = cache_codec
+        self.cache_size_limit = cache_size_limit
+        self.cache_eviction_policy = cache_eviction_policy
+        self.results_max = results_max
+
+        ndjson.get_decoder(json_decoder)
+
+        self._flight = AsyncSingleFlight()
+        self._cache = ResultCache(
+            cache_location,
+            timeout=cache_timeout,
+            memory_entries=memory_cache_entries,
+            memory_bytes=memory_cache_bytes,
+            stale_timeout=cache_refresh_window if cache_refresh else 0,
+            write_queue=cache_write_queue,
+            codec=cache_codec,
+            size_limit=cache_size_limit,
+            eviction_policy=cache_eviction_policy,
+        )
+        self._session = None
+        self._slots = None
+
+        if api_key is None:
+            raise Exception("You must supply a DNSDB API key.")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    @property
+    def session(self):
+        """
+        The pooled aiohttp session shared by every query of this object,
+        created on first use from within the running event loop.
+
+        :return: aiohttp.ClientSession
+        """
+
+        if self._session is None:
+            import aiohttp
+
+            connector = aiohttp.TCPConnector(
+                limit=0,
+                limit_per_host=self.pool_maxsize,
+                force_close=not self.keep_alive,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def close(self):
+        """
+        Close all pooled connections and the cache
+
+        :return: None
+        """
+
+        if self._session is not None:
+            session, self._session = self._session, None
+            await session.close()
+
+        await _in_thread(self._cache.close)
+
+    def cache_stats(self):
+        """
+        Return the hit and miss counters of each cache tier
+
+        :return: dictionary
+        """
+
+        return self._cache.stats()
+
+    async def search(self, **params):
+        """
+        Search the DNSDB API; takes the same arguments as Dnsdb.search.
+
+        :return: Object
+        """
+
+        options = _options(self, **_search_params(params))
+        uri = utils.build_uri(options)
+
+        results = await self._cached(options, uri)
+
+        if results is None:
+            if self.coalesce:
+                fetch = partial(self._fetch, options, uri)
+                key = (uri, _read_limit(options))
+                results = _copy(await self._flight.do(key, fetch))
+            else:
+                results = await self._fetch(options, uri)
+
+        return _finish(options, results)
+
+    async def iter_search(self, **params):
+        """
+        A streaming variant of search; takes the same arguments as
+        Dnsdb.search. Returns a Result as soon as the response headers
+        arrive; its records attribute is an async generator yielding
+        normalized records as they are read off the wire.
+
+        :return: Object
+        """
+
+        options = _options(self, **_search_params(params))
+        uri = utils.build_uri(options)
+
+        results = await self._cached(options, uri)
+
+        if results is not None:
+            if results.status_code == 200:
+                results.records = _aiter_post_process(
+                    options, _aiter(results.records)
+                )
+            return results
+
+        if self.limiter is None:
+            resp, results = await _request(self.session, options, uri)
+        else:
+            # the limiter paces the request; the stream is read outside it
+            await self.limiter.acquire_async()
+            try:
+                resp, results = await _request(self.session, options, uri)
+            finally:
+                self.limiter.release(slot=False)
+            self.limiter.update(results.quota)
+
+        if results.status_code == 200:
+            records = _iter_records(resp, self.json_decoder)
+            if options["cache"] is True:
+                records = self._cache_on_exhaust(options, uri, results, records)
+            results.records = _aiter_post_process(options, records)
+        elif results.status_code == 404:
+            await self._cache_set(options, uri, results)
+
+        return results
+
+    async def quota(self):
+        """
+        Query DNSDB API for the current quota of the given API key
+
+        :return: object
+        """
+
+        options = dict()
+        options["api_key"] = self.api_key
+        options["server"] = self.server
+
+        uri = "".join((options["server"], "/lookup/rate_limit"))
+
+        results = await self._send(options, uri, quota=True)
+        _learn_results_max(self, results)
+        return results
+
+    async def _send(self, options, uri, quota=False):
+        """
+        Send one query through the concurrency bound and the rate limiter
+        and read its response
+
+        :param options: dictionary
+        :param uri: string
+        :param quota: boolean (default: False)
+        :return: object
+        """
+
+        async with self._limit():
+            if self.limiter is not None:
+                await self.limiter.acquire_async()
+            try:
+                resp, results = await _request(self.session, options, uri)
+
+                if results.status_code == 200:
+                    if quota:
+                        response = await resp.json(content_type=None)
+                        results.quota = utils.get_quota(rate_limit=response["rate"])
+                    else:
+                        results.records = await _read_records(
+                            resp, self.json_decoder, _read_limit(options)
+                        )
+            finally:
+                if self.limiter is not None:
+                    self.limiter.release(slot=False)
+
+        if self.limiter is not None:
+            self.limiter.update(results.quota)
+
+        return results
+
+    async def _fetch(self, options, uri):
+        """
+        Query the DNSDB API and cache the result when caching is enabled.
+        An expired result kept for cache_refresh is refreshed rather than
+        fetched again.
+
+        :param options: dictionary
+        :param uri: string
+        :return: object
+        """
+
+        refresh = None
+        if self.cache_refresh and options["cache"] is True:
+            refresh = await _in_thread(_refresh_query, self._cache, uri, options)
+
+        query_uri = uri if refresh is None else refresh[0]
+
+        attempt = 0
+        while True:
+            results = await self._send(options, query_uri)
+
+            # the limiter pauses the next attempt for the backoff delay
+            if not _retry(self.limiter, results, attempt):
+                break
+            attempt += 1
+
+        if refresh is not None:
+            results = _refreshed(refresh, results)
+
+        if results.status_code == 200 or results.status_code == 404:
+            await self._cache_set(options, uri, results)
+
+        return results
+
+    def _limit(self):
+        """
+        The semaphore bounding requests in flight, see max_concurrency
+
+        :return: asynchronous context manager
+        """
+
+        if self._slots is None:
+            if self.max_concurrency:
+                self._slots = asyncio.Semaphore(self.max_concurrency)
+            else:
+                self._slots = _Unlimited()
+        return self._slots
+
+    async def _cached(self, options, uri):
+        """
+        Look up a search in the cache without blocking the event loop
+
+        :param options: dictionary
+        :param uri: string
+        :return: object (None when caching is disabled or on a miss)
+        """
+
+        if options["cache"] is not True:
+            return None
+
+        return await _in_thread(_cache_get, self._cache, uri, options)
+
+    async def _cache_set(self, options, uri, results):
+        """
+        Store a result in the cache without blocking the event loop
+
+        :param options: dictionary
+        :param uri: string
+        :param results: object
+        :return: None
+        """
+
+        if options["cache"] is not True:
+            return
+
+        await _in_thread(_cache_set, self._cache, uri, results, options)
+
+    async def _cache_on_exhaust(self, options, uri, results, records):
+        """
+        Pass records through and cache the complete result once the stream
+        has been read to the end
+
+        :return: async generator
+        """
+
+        seen = []
+        async for record in records:
+            seen.append(record)
+            yield record
+
+        stored = Result(
+            records=seen,
+            status_code=results.status_code,
+            error=results.error,
+            quota=results.quota,
+            cached=False,
+        )
+        await self._cache_set(options, uri, stored)
+
+
+class _Unlimited:
+    """
+    A stand-in for a semaphore when concurrency is not limited
+    """
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+async def _in_thread(func, *args):
+    """
+    An internal function to run blocking work in the default executor
+
+    :return: the return value of func
+    """
+
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, partial(func, *args))
+
+
+async def _request(session, options, uri):
+    """
+    An internal HTTP function to send a query to the DNSDB API; the body of a
+    successful response is left unread on the returned response.
+
+    :param session: aiohttp.ClientSession
+    :param options: dictionary
+    :param uri: string
+    :return: tuple (aiohttp.ClientResponse, object)
+    """
+
+    results = Result()
+    error = dict()
+    error.update({"code": None, "message": None})
+
+    headers = {"Accept": "application/json", "X-API-Key": options["api_key"]}
+
+    resp = await session.get(uri, headers=headers)
+    results.status_code = resp.status
+    results.quota = utils.get_quota(response_headers=resp.headers)
+    results.cached = False
+
+    if resp.status != 200:
+        error["code"] = resp.status
+
+        content = await resp.read()
+        resp.release()
+
+        if content:
+            error["message"] = content.decode("utf-8").rstrip()
+        else:
+            error["message"] = "Unavailable"
+
+        results.error = error
+
+    return resp, results
+
+
+async def _iter_records(resp, decoder=None):
+    """
+    An internal async generator yielding decoded records from a streamed
+    response. The connection is released once the stream is exhausted or
+    abandoned.
+
+    :param resp: aiohttp.ClientResponse
+    :param decoder: string (default: None)
+        JSON decoder, see ndjson.get_decoder
+    :return: async generator
+    """
+
+    try:
+        chunks = resp.content.iter_chunked(ndjson.READ_SIZE)
+        async for record in ndjson.aiter_ndjson(chunks, decoder):
+            yield record
+    finally:
+        resp.release()
+
+
+async def _read_records(resp, decoder=None, limit=None):
+    """
+    An internal function reading the records of a response into a list;
+    the connection is released as soon as limit records are read.
+
+    :param resp: aiohttp.ClientResponse
+    :param decoder: string (default: None)
+    :param limit: integer (default: None)
+    :return: list (of dictionaries)
+    """
+
+    records = []
+    stream = _iter_records(resp, decoder)
+
+    try:
+        async for record in stream:
+            records.append(record)
+            if limit is not None and len(records) >= limit:
+                break
+    finally:
+        await stream.aclose()
+
+    return records
+
+
+async def _aiter_post_process(options, records):
+    """
+    An internal async variant of utils.iter_post_process
+
+    :param options: dictionary
+    :param records: async iterable (of dictionaries)
+    :return: async generator (of dictionaries)
+    """
+
+    if options["sort"]:
+        collected = [record async for record in records]
+        for record in utils.iter_post_process(options, collected):
+            yield record
+        return
+
+    remaining = options["return_limit"]
+    try:
+        async for record in records:
+            if remaining is not None:
+                if remaining <= 0:
+                    break
+                remaining -= 1
+
+            record = utils.normalize_record(record)
+            if not options["epoch"]:
+                record = utils.record_to_timestamp(record)
+            yield record
+    finally:
+        if hasattr(records, "aclose"):
+            await records.aclose()
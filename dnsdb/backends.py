@@ -0,0 +1,897 @@
+# -*- coding: utf-8 -*-
+"""
+Storage backends of the result cache
+
+ResultCache keeps its entries, indexes and counters in a backend, chosen by
+the cache location:
+
+  * a directory: a diskcache store on the local disk (the default)
+  * sqlite:///path/to/cache.db: a SQLite database, which the workers of a
+    cluster can share on a common volume
+  * redis://[:password@]host[:port][/db]: a Redis server (or any server
+    speaking its protocol), shared by every worker connecting to it
+
+Every backend has the interface of the diskcache calls made by ResultCache:
+get, set, delete, incr, transact, expire, cull, volume, close, iteration
+over the keys and the size_limit and eviction_policy settings, plus get_many
+and set_many, which read and write many keys in one round trip. Expiry is
+given in seconds from now, as by diskcache, and an expired key is missing.
+
+The SQLite and Redis backends store values as bytes: integers as decimal
+digits (so Redis can increment counters), entries as their JSON metadata
+followed by their body, and other values as JSON. Nothing shared is
+unpickled.
+"""
+
+import json
+import socket
+import sqlite3
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import unquote, urlsplit
+
+DEFAULT_SIZE_LIMIT = 2 ** 30
+DEFAULT_EVICTION_POLICY = "least-recently-stored"
+REDIS_PREFIX = "dnsdb:cache:"
+
+_ENTRY = b"E"
+_JSON = b"J"
+_BYTES = b"B"
+_HEADER = struct.Struct("<I")
+# entries read or written per statement, below the SQLite variable limit
+_CHUNK = 500
+# changes of the total size of the stored values, see SQLiteBackend
+_TRIGGERS = (
+    ("insert", "INSERT", "NEW.size"),
+    ("delete", "DELETE", "-OLD.size"),
+    ("update", "UPDATE OF size", "NEW.size - OLD.size"),
+)
+_ORDER = {
+    "least-recently-stored": "store_time",
+    "least-recently-used": "access_time",
+    "least-frequently-used": "access_count",
+}
+
+
+class RedisError(Exception):
+    """
+    An error reply of a Redis server
+    """
+
+
+def open_backend(location, size_limit=None, eviction_policy=None):
+    """
+    Open the backend of a cache location, see the module documentation
+
+    :param location: string (or a backend, returned as is)
+    :param size_limit: integer (optional)
+        maximum size of the store in bytes; None keeps the setting of the
+        store. Redis bounds its memory itself (maxmemory).
+    :param eviction_policy: string (optional)
+        see ResultCache; None keeps the setting of the store
+    :return: DiskBackend, SQLiteBackend or RedisBackend
+    """
+
+    if not isinstance(location, str):
+        return location
+
+    scheme = urlsplit(location).scheme
+
+    if scheme == "sqlite":
+        # sqlite:///relative.db and sqlite:////absolute.db, as SQLAlchemy
+        path = location[len("sqlite:///") :]
+        return SQLiteBackend(path, size_limit, eviction_policy)
+
+    if scheme in ("redis", "rediss"):
+        return RedisBackend(location)
+
+    return DiskBackend(location, size_limit, eviction_policy)
+
+
+class DiskBackend:
+    """
+    A diskcache store in a local directory
+    """
+
+    def __init__(self, directory, size_limit=None, eviction_policy=None):
+        """
+        :param directory: string
+        :param size_limit: integer (optional)
+        :param eviction_policy: string (optional)
+        """
+
+        from diskcache import Cache
+
+        settings = dict()
+        if size_limit is not None:
+            settings["size_limit"] = size_limit
+        if eviction_policy is not None:
+            settings["eviction_policy"] = eviction_policy
+
+        self._cache = Cache(directory, **settings)
+
+    def __getattr__(self, name):
+        if name == "_cache":
+            raise AttributeError(name)
+        return getattr(self._cache, name)
+
+    def __iter__(self):
+        return iter(self._cache)
+
+    def get_many(self, keys, expire_time=False):
+        """
+        Read many keys
+
+        :param keys: list (of strings)
+        :param expire_time: boolean (default: False)
+            return (value, expire time) tuples
+        :return: dictionary (of the keys found)
+        """
+
+        found = dict()
+        for key in keys:
+            value, expires = self._cache.get(key, expire_time=True)
+            if value is not None:
+                found[key] = (value, expires) if expire_time else value
+        return found
+
+    def set_many(self, items, expire=None):
+        """
+        Write many keys in one transaction
+
+        :param items: list (of tuples (string key, value))
+        :param expire: float (optional)
+            seconds until the keys expire
+        :return: None
+        """
+
+        with self._cache.transact():
+            for key, value in items:
+                self._cache.set(key, value, expire=expire)
+
+
+class SQLiteBackend:
+    """
+    A SQLite database, safe to share between processes and hosts. The
+    database uses the rollback journal rather than WAL, whose shared memory
+    index does not work over network filesystems; writers wait up to
+    timeout seconds for the lock. The total size of the stored values is
+    kept in the settings table by triggers, so checking the size limit does
+    not scan the values.
+    """
+
+    def __init__(self, path, size_limit=None, eviction_policy=None, timeout=60):
+        """
+        :param path: string
+        :param size_limit: integer (optional)
+            maximum total size of the stored values in bytes, enforced as
+            values are stored; None keeps the setting of the database
+            (1 GiB for a new database)
+        :param eviction_policy: string (optional)
+            see ResultCache; None keeps the setting of the database
+            (least-recently-stored for a new database)
+        :param timeout: integer (default: 60)
+            seconds to wait for the lock of the database
+        """
+
+        self.path = path
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(
+            path, timeout=timeout, isolation_level=None, check_same_thread=False
+        )
+        # INSERT OR REPLACE fires the delete trigger for the replaced row
+        self._db.execute("PRAGMA recursive_triggers = ON")
+
+        with self.transact():
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY,"
+                " value BLOB NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " store_time REAL NOT NULL,"
+                " access_time REAL NOT NULL,"
+                " access_count INTEGER NOT NULL DEFAULT 0,"
+                " expire_time REAL)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS settings ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+            self.size_limit = int(
+                self._setting("size_limit", size_limit, DEFAULT_SIZE_LIMIT)
+            )
+            self.eviction_policy = self._setting(
+                "eviction_policy", eviction_policy, DEFAULT_EVICTION_POLICY
+            )
+
+            self._db.execute(
+                "INSERT OR IGNORE INTO settings (key, value)"
+                " SELECT 'stored', COALESCE(SUM(size), 0) FROM cache"
+            )
+            for name, event, change in _TRIGGERS:
+                self._db.execute(
+                    "CREATE TRIGGER IF NOT EXISTS cache_{} AFTER {} ON cache"
+                    " BEGIN UPDATE settings SET value = value + {}"
+                    " WHERE key = 'stored'; END".format(name, event, change)
+                )
+
+    def __iter__(self):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT key FROM cache WHERE expire_time IS NULL OR expire_time > ?",
+                (time.time(),),
+            ).fetchall()
+        return iter([row[0] for row in rows])
+
+    def get(self, key, default=None, expire_time=False):
+        """
+        Read a key
+
+        :param key: string
+        :param default: object (default: None)
+        :param expire_time: boolean (default: False)
+            return a (value, expire time) tuple
+        :return: object
+        """
+
+        found = self.get_many([key], expire_time=True)
+        value, expires = found.get(key, (default, None))
+        return (value, expires) if expire_time else value
+
+    def get_many(self, keys, expire_time=False):
+        """
+        Read many keys
+
+        :param keys: list (of strings)
+        :param expire_time: boolean (default: False)
+            return (value, expire time) tuples
+        :return: dictionary (of the keys found)
+        """
+
+        now = time.time()
+        found = dict()
+
+        with self._lock:
+            for start in range(0, len(keys), _CHUNK):
+                chunk = keys[start : start + _CHUNK]
+                rows = self._db.execute(
+                    "SELECT key, value, expire_time FROM cache WHERE key IN ({})"
+                    " AND (expire_time IS NULL OR expire_time > ?)".format(
+                        ",".join("?" * len(chunk))
+                    ),
+                    chunk + [now],
+                ).fetchall()
+
+                for key, value, expires in rows:
+                    value = _loads(value)
+                    found[key] = (value, expires) if expire_time else value
+
+                if rows and self.eviction_policy in (
+                    "least-recently-used",
+                    "least-frequently-used",
+                ):
+                    self._db.executemany(
+                        "UPDATE cache SET access_time = ?,"
+                        " access_count = access_count + 1 WHERE key = ?",
+                        [(now, row[0]) for row in rows],
+                    )
+
+        return found
+
+    def set(self, key, value, expire=None):
+        """
+        Write a key
+
+        :param key: string
+        :param value: object
+        :param expire: float (optional)
+            seconds until the key expires
+        :return: None
+        """
+
+        self.set_many([(key, value)], expire=expire)
+
+    def set_many(self, items, expire=None):
+        """
+        Write many keys in one transaction, then evict values by the eviction
+        policy until the database fits its size limit
+
+        :param items: list (of tuples (string key, value))
+        :param expire: float (optional)
+            seconds until the keys expire
+        :return: None
+        """
+
+        now = time.time()
+        expire_time = None if expire is None else now + expire
+        rows = []
+        for key, value in items:
+            value = _dumps(value)
+            rows.append((key, value, len(value), now, now, expire_time))
+
+        with self.transact():
+            self._db.executemany(
+                "INSERT OR REPLACE INTO cache"
+                " (key, value, size, store_time, access_time, expire_time)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._cull()
+
+    def delete(self, key):
+        """
+        Remove a key
+
+        :param key: string
+        :return: boolean (whether the key was found)
+        """
+
+        with self._lock:
+            cursor = self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+        return cursor.rowcount > 0
+
+    def incr(self, key, delta=1):
+        """
+        Add to the integer stored under a key, starting from 0
+
+        :param key: string
+        :param delta: integer (default: 1)
+        :return: integer
+        """
+
+        with self.transact():
+            value = self.get(key, 0) + delta
+            self._db.execute(
+                "INSERT OR REPLACE INTO cache"
+                " (key, value, size, store_time, access_time, expire_time)"
+                " VALUES (?, ?, 0, ?, ?, NULL)",
+                (key, _dumps(value), time.time(), time.time()),
+            )
+        return value
+
+    @contextmanager
+    def transact(self):
+        """
+        Hold the write lock of the database, for reads followed by writes
+
+        :return: context manager
+        """
+
+        with self._lock:
+            if self._db.in_transaction:
+                yield
+                return
+
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def expire(self):
+        """
+        Remove the expired keys
+
+        :return: integer (number of keys removed)
+        """
+
+        with self._lock:
+            cursor = self._db.execute(
+                "DELETE FROM cache WHERE expire_time <= ?", (time.time(),)
+            )
+        return cursor.rowcount
+
+    def cull(self):
+        """
+        Remove the expired keys, then evict values by the eviction policy
+        until the database fits its size limit
+
+        :return: integer (number of values evicted)
+        """
+
+        with self.transact():
+            self.expire()
+            return self._cull()
+
+    def _cull(self):
+        """
+        Evict values until the database fits its size limit, see cull
+
+        :return: integer
+        """
+
+        column = _ORDER.get(self.eviction_policy)
+        if column is None:
+            return 0
+
+        total = self._stored()
+        if total <= self.size_limit:
+            return 0
+
+        evicted = []
+        # counters have no size and are never evicted
+        rows = self._db.execute(
+            "SELECT key, size FROM cache WHERE size > 0 ORDER BY {}".format(column)
+        )
+        for key, size in rows:
+            if total <= self.size_limit:
+                break
+            evicted.append((key,))
+            total -= size
+
+        self._db.executemany("DELETE FROM cache WHERE key = ?", evicted)
+        return len(evicted)
+
+    def _stored(self):
+        """
+        The total size of the stored values, kept by triggers
+
+        :return: integer (bytes)
+        """
+
+        with self._lock:
+            (total,) = self._db.execute(
+                "SELECT value FROM settings WHERE key = 'stored'"
+            ).fetchone()
+        return int(total)
+
+    def volume(self):
+        """
+        The size of the database file
+
+        :return: integer (bytes)
+        """
+
+        with self._lock:
+            (pages,) = self._db.execute("PRAGMA page_count").fetchone()
+            (page_size,) = self._db.execute("PRAGMA page_size").fetchone()
+        return pages * page_size
+
+    def close(self):
+        """
+        Close the database
+
+        :return: None
+        """
+
+        with self._lock:
+            self._db.close()
+
+    def _setting(self, name, value, default):
+        """
+        Store a setting of the database, or read it when value is None
+
+        :param name: string
+        :param value: object (or None)
+        :param default: object
+            the setting of a new database
+        :return: string
+        """
+
+        if value is None:
+            row = self._db.execute(
+                "SELECT value FROM settings WHERE key = ?", (name,)
+            ).fetchone()
+            if row is not None:
+                return row[0]
+            value = default
+
+        self._db.execute(
+            "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+            (name, str(value)),
+        )
+        return str(value)
+
+
+class RedisBackend:
+    """
+    A Redis server, over a minimal client of its protocol (RESP) so no
+    Redis library is needed. Keys are namespaced by prefix and expire on
+    the server. The size of the store is bounded by the maxmemory settings
+    of the server rather than by the client: size_limit and eviction_policy
+    are None, and expire and cull remove nothing.
+
+    The indexes of cached results are read and rewritten without a lock
+    across clients: of two clients indexing the same lookup at once, one
+    may lose its index entry, which leaves its result answering exact
+    queries only.
+    """
+
+    size_limit = None
+    eviction_policy = None
+
+    def __init__(self, url, prefix=REDIS_PREFIX, timeout=30):
+        """
+        :param url: string
+            redis://[:password@]host[:port][/db], rediss:// for TLS
+        :param prefix: string (default: REDIS_PREFIX)
+            prefix of every key of the cache on the server
+        :param timeout: integer (default: 30)
+            seconds to wait for the server
+        """
+
+        parts = urlsplit(url)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 6379
+        self.db = int(parts.path.strip("/") or 0)
+        self.password = unquote(parts.password) if parts.password else None
+        self.username = unquote(parts.username) if parts.username else None
+        self.tls = parts.scheme == "rediss"
+        self.prefix = prefix
+        self.timeout = timeout
+
+        self._lock = threading.RLock()
+        self._socket = None
+        self._reader = None
+
+    def __iter__(self):
+        cursor = b"0"
+        pattern = self.prefix.encode("utf-8") + b"*"
+        start = len(self.prefix)
+
+        while True:
+            ((cursor, keys),) = self._execute(
+                ("SCAN", cursor, "MATCH", pattern, "COUNT", 1000)
+            )
+            for key in keys:
+                yield key[start:].decode("utf-8")
+            if cursor == b"0":
+                return
+
+    def get(self, key, default=None, expire_time=False):
+        """
+        Read a key
+
+        :param key: string
+        :param default: object (default: None)
+        :param expire_time: boolean (default: False)
+            return a (value, expire time) tuple
+        :return: object
+        """
+
+        found = self.get_many([key], expire_time=expire_time)
+        if key in found:
+            return found[key]
+        return (default, None) if expire_time else default
+
+    def get_many(self, keys, expire_time=False):
+        """
+        Read many keys in one round trip
+
+        :param keys: list (of strings)
+        :param expire_time: boolean (default: False)
+            return (value, expire time) tuples
+        :return: dictionary (of the keys found)
+        """
+
+        if not keys:
+            return dict()
+
+        names = [self._key(key) for key in keys]
+
+        if not expire_time:
+            (values,) = self._execute(["MGET"] + names)
+            return {
+                key: _loads(value)
+                for key, value in zip(keys, values)
+                if value is not None
+            }
+
+        commands = []
+        for name in names:
+            commands.append(("GET", name))
+            commands.append(("PTTL", name))
+
+        now = time.time()
+        replies = self._execute(*commands)
+        found = dict()
+
+        for index, key in enumerate(keys):
+            value, ttl = replies[2 * index : 2 * index + 2]
+            if value is None:
+                continue
+            expires = now + ttl / 1000 if ttl >= 0 else None
+            found[key] = (_loads(value), expires)
+
+        return found
+
+    def set(self, key, value, expire=None):
+        """
+        Write a key
+
+        :param key: string
+        :param value: object
+        :param expire: float (optional)
+            seconds until the key expires
+        :return: None
+        """
+
+        self.set_many([(key, value)], expire=expire)
+
+    def set_many(self, items, expire=None):
+        """
+        Write many keys in one round trip
+
+        :param items: list (of tuples (string key, value))
+        :param expire: float (optional)
+            seconds until the keys expire
+        :return: None
+        """
+
+        commands = []
+
+        for key, value in items:
+            name = self._key(key)
+            if expire is None:
+                commands.append(("SET", name, _dumps(value)))
+            elif expire <= 0:
+                # already expired, as stored by diskcache
+                commands.append(("DEL", name))
+            else:
+                milliseconds = max(int(expire * 1000), 1)
+                commands.append(("SET", name, _dumps(value), "PX", milliseconds))
+
+        if commands:
+            self._execute(*commands)
+
+    def delete(self, key):
+        """
+        Remove a key
+
+        :param key: string
+        :return: boolean (whether the key was found)
+        """
+
+        (removed,) = self._execute(("DEL", self._key(key)))
+        return removed > 0
+
+    def incr(self, key, delta=1):
+        """
+        Add to the integer stored under a key, starting from 0
+
+        :param key: string
+        :param delta: integer (default: 1)
+        :return: integer
+        """
+
+        (value,) = self._execute(("INCRBY", self._key(key), delta))
+        return value
+
+    @contextmanager
+    def transact(self):
+        """
+        Serialize reads followed by writes within this process, see the
+        class documentation
+
+        :return: context manager
+        """
+
+        with self._lock:
+            yield
+
+    def expire(self):
+        """
+        Expired keys are removed by the server
+
+        :return: integer (0)
+        """
+
+        return 0
+
+    def cull(self):
+        """
+        Keys are evicted by the server
+
+        :return: integer (0)
+        """
+
+        return 0
+
+    def volume(self):
+        """
+        The memory used by the server, for every database and client
+
+        :return: integer (bytes)
+        """
+
+        (info,) = self._execute(("INFO", "memory"))
+        for line in info.decode("utf-8").splitlines():
+            if line.startswith("used_memory:"):
+                return int(line.split(":", 1)[1])
+        return None
+
+    def close(self):
+        """
+        Close the connection to the server
+
+        :return: None
+        """
+
+        with self._lock:
+            if self._reader is not None:
+                self._reader.close()
+            if self._socket is not None:
+                self._socket.close()
+            self._socket = None
+            self._reader = None
+
+    def _key(self, key):
+        return (self.prefix + key).encode("utf-8")
+
+    def _connect(self):
+        """
+        Connect, authenticate and select the database
+
+        :return: None
+        """
+
+        self._socket = socket.create_connection(
+            (self.host, self.port), timeout=self.timeout
+        )
+
+        # a connection failing to authenticate or select is not kept
+        try:
+            self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if self.tls:
+                import ssl
+
+                self._socket = ssl.create_default_context().wrap_socket(
+                    self._socket, server_hostname=self.host
+                )
+            self._reader = self._socket.makefile("rb")
+
+            commands = []
+            if self.password is not None:
+                if self.username:
+                    commands.append(("AUTH", self.username, self.password))
+                else:
+                    commands.append(("AUTH", self.password))
+            if self.db:
+                commands.append(("SELECT", self.db))
+            if commands:
+                self._send(commands)
+        except BaseException:
+            self.close()
+            raise
+
+    def _execute(self, *commands):
+        """
+        Send commands in one round trip (pipelined) and return their replies.
+        The connection is opened on first use and after a failure.
+
+        :param commands: tuples (of strings, bytes and integers)
+        :return: list
+        """
+
+        with self._lock:
+            if self._socket is None:
+                self._connect()
+            try:
+                return self._send(commands)
+            except (OSError, ConnectionError):
+                self.close()
+                raise
+
+    def _send(self, commands):
+        """
+        Write commands and read one reply per command. An error reply is
+        raised once every reply has been read.
+
+        :param commands: list (of tuples)
+        :return: list
+        """
+
+        self._socket.sendall(b"".join(_command(command) for command in commands))
+
+        replies = [_reply(self._reader) for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+
+def _command(args):
+    """
+    Encode a command as a RESP array of bulk strings
+
+    :param args: tuple (of strings, bytes and integers)
+    :return: bytes
+    """
+
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode("utf-8")
+        elif isinstance(arg, int):
+            arg = str(arg).encode("ascii")
+        parts.append(b"$%d\r\n" % len(arg))
+        parts.append(arg)
+        parts.append(b"\r\n")
+    return b"".join(parts)
+
+
+def _reply(reader):
+    """
+    Read a RESP reply. Error replies are returned as RedisError.
+
+    :param reader: binary file
+    :return: object
+    """
+
+    line = reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("Connection closed by the Redis server")
+
+    kind, rest = line[:1], line[1:-2]
+
+    if kind == b"+":
+        return rest
+    if kind == b"-":
+        return RedisError(rest.decode("utf-8", "replace"))
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        size = int(rest)
+        if size < 0:
+            return None
+        data = reader.read(size + 2)
+        if len(data) != size + 2:
+            raise ConnectionError("Connection closed by the Redis server")
+        return data[:-2]
+    if kind == b"*":
+        size = int(rest)
+        if size < 0:
+            return None
+        return [_reply(reader) for _ in range(size)]
+
+    raise RedisError("Unexpected reply from the Redis server: {!r}".format(line))
+
+
+def _dumps(value):
+    """
+    Serialize a value of the cache, see the module documentation
+
+    :param value: integer, entry dictionary, bytes or JSON value
+    :return: bytes
+    """
+
+    if isinstance(value, int) and not isinstance(value, bool):
+        return str(value).encode("ascii")
+
+    if isinstance(value, bytes):
+        return _BYTES + value
+
+    if isinstance(value, dict) and isinstance(value.get("body"), bytes):
+        meta = json.dumps(value["meta"]).encode("utf-8")
+        return b"".join((_ENTRY, _HEADER.pack(len(meta)), meta, value["body"]))
+
+    return _JSON + json.dumps(value).encode("utf-8")
+
+
+def _loads(data):
+    """
+    Deserialize a value stored by _dumps
+
+    :param data: bytes
+    :return: object
+    """
+
+    kind = data[:1]
+
+    if kind == _ENTRY:
+        (size,) = _HEADER.unpack_from(data, 1)
+        start = 1 + _HEADER.size
+        meta = json.loads(data[start : start + size])
+        return {"meta": meta, "body": bytes(data[start + size :])}
+
+    if kind == _JSON:
+        return json.loads(data[1:])
+
+    if kind == _BYTES:
+        return bytes(data[1:])
+
+    return int(data)
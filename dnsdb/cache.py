@@ -0,0 +1,1304 @@
+# -*- coding: utf-8 -*-
+"""
+Caching of DNSDB results
+
+ResultCache keeps one backend open for the lifetime of a client: a diskcache
+directory, or a SQLite database or Redis server shared by many clients (see
+dnsdb.backends). It optionally fronts it with MemoryCache, a bounded
+in-process LRU holding already decoded results. Results are cached as
+dictionaries in the format of Result.to_dict.
+
+On disk each result is an entry dictionary of metadata (status, quota,
+record count, the remote limit and time filters of the query, and whether
+the result was truncated by its limit) and the records encoded by the
+codec of the cache (see dnsdb.codecs), which is named in the metadata. The
+metadata lets a cached, non-truncated result answer queries for the same
+lookup with a smaller limit or a narrower time window.
+
+With a stale_timeout, expired results are kept on disk for that much
+longer so a client can refresh them incrementally (see get_stale): they
+are no longer answered by get, but their records and the time they were
+stored remain available.
+
+With a write_queue, stores are written behind: set queues the result and
+returns, and a background thread encodes, compresses and writes it. Queued
+results are answered by get until they are written; when the queue is full
+the result is not cached (see the dropped counter). flush and close wait
+for every queued write.
+
+get_many answers many queries with one bulk read of the backend, and the
+background writer stores the queued results in one bulk write.
+
+The size of the store is bounded by the backend: size_limit and
+eviction_policy are settings of the store, kept between processes.
+summary, prune, dump and load administer a store (see the dnsdb cache
+command); the hits and misses of every client are added to counters in the
+store when it is closed.
+"""
+
+import base64
+import gzip
+import ipaddress
+import json
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+from dnsdb import utils
+from dnsdb.backends import open_backend
+from dnsdb.codecs import LEGACY, get_codec
+
+logger = logging.getLogger(__name__)
+
+INTERNAL_PREFIX = "dnsdb:"
+INDEX_PREFIX = "dnsdb:index:"
+STATS_PREFIX = "dnsdb:stats:"
+EVICTION_POLICIES = (
+    "least-recently-stored",
+    "least-recently-used",
+    "least-frequently-used",
+    "none",
+)
+AGE_BUCKETS = (
+    ("<15m", 900),
+    ("<1h", 3600),
+    ("<6h", 6 * 3600),
+    ("<1d", 86400),
+    ("<7d", 7 * 86400),
+    (">=7d", None),
+)
+DEFAULT_CODEC = "records+zlib:1"
+# queued stores written per bulk write
+WRITE_BATCH = 64
+NOT_FOUND = "Error: no results found for query."
+
+
+class MemoryCache:
+    """
+    A thread safe LRU cache bounded by entry count and (estimated) bytes
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024):
+        """
+        :param max_entries: integer
+            maximum number of entries held
+        :param max_bytes: integer
+            maximum total size of the held entries
+        """
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Return a cached value, or None when missing or expired
+
+        :param key: string
+        :return: object
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and entry[2] is not None and entry[2] <= time.time():
+                self._remove(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, size, expire_time=None):
+        """
+        Store a value, evicting the least recently used entries to stay
+        within the bounds. Values larger than max_bytes are not stored.
+
+        :param key: string
+        :param value: object
+        :param size: integer
+            estimated size of value in bytes
+        :param expire_time: float (optional)
+            epoch time after which the entry is expired
+        :return: None
+        """
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            if size > self.max_bytes or self.max_entries <= 0:
+                return
+
+            self._entries[key] = (value, size, expire_time)
+            self.bytes += size
+
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Remove all entries
+
+        :return: None
+        """
+
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """
+        Return the counters of the cache
+
+        :return: dictionary
+        """
+
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+            }
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.bytes -= size
+
+
+class ResultCache:
+    """
+    A two tier cache of DNSDB results: an optional MemoryCache in front of a
+    backend, which is opened once on first use.
+    """
+
+    def __init__(
+        self,
+        location,
+        timeout=900,
+        memory_entries=0,
+        memory_bytes=64 * 1024 * 1024,
+        stale_timeout=0,
+        write_queue=0,
+        codec=DEFAULT_CODEC,
+        size_limit=None,
+        eviction_policy=None,
+    ):
+        """
+        :param location: string
+            directory of a diskcache store, sqlite:///path of a SQLite
+            database or redis://host:port/db of a Redis server, see
+            dnsdb.backends (or a backend)
+        :param timeout: integer
+            seconds until a cached result expires
+        :param memory_entries: integer (default: 0)
+            maximum number of decoded results kept in memory, 0 disables the
+            memory tier
+        :param memory_bytes: integer (default: 64 MiB)
+            maximum size of the results kept in memory (uncompressed JSON)
+        :param stale_timeout: integer (default: 0)
+            seconds expired results are kept in the backend for get_stale
+        :param write_queue: integer (default: 0)
+            maximum number of stores waiting for the background writer, 0
+            stores synchronously
+        :param codec: string (default: DEFAULT_CODEC)
+            codec the records of stored results are encoded with, see
+            dnsdb.codecs; entries written with other codecs stay readable
+        :param size_limit: integer (optional)
+            maximum size of the store in bytes, enforced by evicting entries
+            as results are stored; None keeps the setting of the store
+            (1 GiB for a new store)
+        :param eviction_policy: string (optional)
+            least-recently-stored, least-recently-used (every hit is also
+            a write), least-frequently-used or none; None keeps the setting
+            of the store (least-recently-stored for a new store)
+        """
+
+        if eviction_policy is not None and eviction_policy not in EVICTION_POLICIES:
+            raise ValueError(
+                "Unknown eviction policy {}, expected one of {}".format(
+                    eviction_policy, ", ".join(EVICTION_POLICIES)
+                )
+            )
+
+        self.location = location
+        self.timeout = timeout
+        self.stale_timeout = stale_timeout
+        self.write_queue = write_queue
+        self.codec = get_codec(codec)
+        self.size_limit = size_limit
+        self.eviction_policy = eviction_policy
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.disk_misses = 0
+        self.subsumed = 0
+        self.contained = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.max_depth = 0
+
+        self.memory = None
+        if memory_entries:
+            self.memory = MemoryCache(memory_entries, memory_bytes)
+
+        self._disk = None
+        self._lock = threading.Lock()
+        self._saved = (0, 0)
+
+        self._pending = dict()
+        self._queue = None
+        self._writer = None
+        self._write_lock = threading.Lock()
+
+    @property
+    def disk(self):
+        """
+        The backend, opened on first use
+
+        :return: object (see dnsdb.backends)
+        """
+
+        if self._disk is None:
+            with self._lock:
+                if self._disk is None:
+                    self._disk = open_backend(
+                        self.location, self.size_limit, self.eviction_policy
+                    )
+        return self._disk
+
+    def get(self, key, options=None, lazy=False):
+        """
+        Return a cached result. When options are given and the key is not
+        cached, a cached result for the same lookup that covers the query
+        (see covers) answers it by filtering and truncating client side.
+
+        :param key: string
+            the URI of the query
+        :param options: dictionary (optional)
+        :param lazy: boolean (default: False)
+            leave the records of an exact disk hit encoded: the result has
+            records None, the record count and a load function decoding the
+            records. Ignored when the memory tier is enabled.
+        :return: dictionary (None on a miss)
+        """
+
+        data = self._get(key, lazy)
+
+        if data is None and options is not None:
+            data = self._get_subsumed(key, options)
+
+        if data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return data
+
+    def get_many(self, items, lazy=False):
+        """
+        Return the cached results of many queries, see get. Results not
+        queued or held in memory are read from the backend at once;
+        queries missing there are answered from covering results.
+
+        :param items: list (of tuples (string key, dictionary options))
+        :param lazy: boolean (default: False)
+        :return: list (of dictionaries, None on a miss)
+        """
+
+        found = [self._get_local(key) for key, _ in items]
+        missing = [position for position, data in enumerate(found) if data is None]
+
+        if missing:
+            entries = self.disk.get_many(
+                [items[position][0] for position in missing], expire_time=True
+            )
+
+            for position in missing:
+                key, options = items[position]
+                entry, expire_time = entries.get(key, (None, None))
+                data = self._from_disk(key, entry, expire_time, lazy)
+
+                if data is None and options is not None:
+                    data = self._get_subsumed(key, options)
+                found[position] = data
+
+        for data in found:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return found
+
+    def set(self, key, data, options=None):
+        """
+        Store a result in both tiers, or queue it for the background writer
+        when write_queue is set. The records of data must not be modified
+        once queued.
+
+        :param key: string
+            the URI of the query
+        :param data: dictionary
+        :param options: dictionary (optional)
+            options of the query, recorded so the result can answer
+            narrower queries
+        :return: None
+        """
+
+        if self.write_queue:
+            self._enqueue(key, data, options)
+        else:
+            self._store(key, data, options)
+
+    def flush(self):
+        """
+        Wait until every queued store has been written
+
+        :return: None
+        """
+
+        if self._queue is not None:
+            self._queue.join()
+
+    def _store(self, key, data, options=None):
+        """
+        Encode and store a result in both tiers, see set
+
+        :param key: string
+        :param data: dictionary
+        :param options: dictionary (optional)
+        :return: None
+        """
+
+        self._store_many([(key, data, options)])
+
+    def _store_many(self, items):
+        """
+        Encode results and store them in both tiers, with one bulk write of
+        the results and one of the indexes they are added to
+
+        :param items: list (of tuples (string key, dictionary data,
+            dictionary options))
+        :return: None
+        """
+
+        entries = []
+        indexed = []
+
+        for key, data, options in items:
+            body, size = self.codec.encode(data["records"])
+            meta = _meta(data, options)
+            meta["codec"] = self.codec.name
+            meta["bytes"] = size
+            entries.append((key, {"meta": meta, "body": body}))
+
+            if options is not None:
+                indexed.append((key, meta))
+
+        self.disk.set_many(entries, expire=self.timeout + self.stale_timeout)
+
+        if indexed:
+            self._index(indexed)
+
+        if self.memory is not None:
+            expire_time = time.time() + self.timeout
+            for (key, data, _), (_, entry) in zip(items, entries):
+                self.memory.set(key, data, entry["meta"]["bytes"], expire_time)
+
+    def _get(self, key, lazy=False):
+        """
+        Return the result cached under exactly this key
+
+        :param key: string
+        :param lazy: boolean (default: False)
+        :return: dictionary (None on a miss)
+        """
+
+        data = self._get_local(key)
+        if data is not None:
+            return data
+
+        entry, expire_time = self.disk.get(key, expire_time=True)
+        return self._from_disk(key, entry, expire_time, lazy)
+
+    def _get_local(self, key):
+        """
+        Return a result queued for the writer or held in memory
+
+        :param key: string
+        :return: dictionary (None when neither holds the key)
+        """
+
+        # a queued store is newer than anything cached under its key
+        if self._pending:
+            data = self._pending.get(key)
+            if data is not None:
+                return data
+
+        if self.memory is not None:
+            return self.memory.get(key)
+
+        return None
+
+    def _from_disk(self, key, entry, expire_time, lazy=False):
+        """
+        Decode an entry read from the backend, keeping it in memory
+
+        :param key: string
+        :param entry: dictionary (or bytes written by older versions, or
+            None when missing)
+        :param expire_time: float (or None)
+        :param lazy: boolean (default: False)
+        :return: dictionary (None on a miss)
+        """
+
+        if not entry or self._stale(entry) or not _readable(entry):
+            self.disk_misses += 1
+            return None
+
+        self.disk_hits += 1
+
+        if self.stale_timeout and isinstance(entry, dict):
+            expire_time = entry["meta"]["stored"] + self.timeout
+
+        if lazy and self.memory is None and isinstance(entry, dict):
+            return _defer(entry)
+
+        data, size = _decode(entry)
+
+        if self.memory is not None:
+            self.memory.set(key, data, size, expire_time)
+
+        return data
+
+    def _enqueue(self, key, data, options):
+        """
+        Queue a store for the background writer, starting it on first use.
+        The store is dropped when the queue is full.
+
+        :param key: string
+        :param data: dictionary
+        :param options: dictionary
+        :return: None
+        """
+
+        with self._write_lock:
+            if self._writer is None:
+                self._queue = queue.Queue(self.write_queue)
+                self._writer = threading.Thread(
+                    target=self._write,
+                    args=(self._queue,),
+                    name="dnsdb-cache-writer",
+                    daemon=True,
+                )
+                self._writer.start()
+
+            # pending before queued: the writer may finish before put returns
+            previous = self._pending.get(key)
+            self._pending[key] = data
+            try:
+                self._queue.put_nowait((key, data, options))
+            except queue.Full:
+                if previous is None:
+                    del self._pending[key]
+                else:
+                    self._pending[key] = previous
+                self.dropped += 1
+                return
+
+            self.max_depth = max(self.max_depth, self._queue.qsize())
+
+    def _write(self, items):
+        """
+        The loop of the background writer, stopped by a None item. The
+        stores queued meanwhile are written together, up to WRITE_BATCH.
+
+        :param items: queue.Queue
+        :return: None
+        """
+
+        while True:
+            batch = [items.get()]
+            while batch[-1] is not None and len(batch) < WRITE_BATCH:
+                try:
+                    batch.append(items.get_nowait())
+                except queue.Empty:
+                    break
+
+            stores = [item for item in batch if item is not None]
+            try:
+                if stores:
+                    self._write_batch(stores)
+            finally:
+                for _ in batch:
+                    items.task_done()
+
+            if batch[-1] is None:
+                return
+
+    def _write_batch(self, stores):
+        """
+        Store a batch of queued results, see _write
+
+        :param stores: list (of tuples (string key, dictionary data,
+            dictionary options))
+        :return: None
+        """
+
+        try:
+            self._store_many(stores)
+            self.written += len(stores)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception(
+                "cache write failed: %s", ", ".join(key for key, _, _ in stores)
+            )
+            self.failed += len(stores)
+        finally:
+            with self._write_lock:
+                for key, data, _ in stores:
+                    if self._pending.get(key) is data:
+                        del self._pending[key]
+
+    def _stop_writer(self):
+        """
+        Write every queued store and stop the background writer
+
+        :return: None
+        """
+
+        with self._write_lock:
+            writer, self._writer = self._writer, None
+            items = self._queue
+
+        if writer is not None:
+            items.put(None)
+            writer.join()
+
+    def get_stale(self, key):
+        """
+        Return a result cached under exactly this key whether or not it has
+        expired, with its metadata, for an incremental refresh. Only the
+        backend is read.
+
+        :param key: string
+            the URI of the query
+        :return: tuple (dictionary, dictionary metadata) (None on a miss)
+        """
+
+        entry = self.disk.get(key)
+
+        if not isinstance(entry, dict) or not _readable(entry):
+            return None
+
+        data, _ = _decode(entry)
+        return data, entry["meta"]
+
+    def _stale(self, entry):
+        """
+        Whether a disk entry kept for refreshing has expired
+
+        :param entry: dictionary (or bytes written by older versions)
+        :return: boolean
+        """
+
+        if not self.stale_timeout or not isinstance(entry, dict):
+            return False
+
+        return entry["meta"]["stored"] + self.timeout <= time.time()
+
+    def _get_subsumed(self, key, options):
+        """
+        Answer a query from a cached result covering it: a result for the
+        same lookup, or for a broader CIDR or wildcard lookup containing it
+        (see containers), with the same type and bailiwick.
+
+        :param key: string
+        :param options: dictionary
+        :return: dictionary (None when no cached result covers the query)
+        """
+
+        wanted = _filters(options)
+        if wanted is None:
+            return None
+
+        base = key.split("?", 1)[0]
+        candidates = [(base, None)] + list(containers(base))
+        # the indexes of every candidate lookup in one read
+        indexes = self.disk.get_many(
+            [INDEX_PREFIX + container for container, _ in candidates]
+        )
+
+        for container, match in candidates:
+            index = indexes.get(INDEX_PREFIX + container) or dict()
+
+            for candidate, meta in index.items():
+                if candidate == key or not covers(meta, wanted):
+                    continue
+
+                data = self._get(candidate)
+                if data is None:
+                    continue
+
+                if match is None:
+                    self.subsumed += 1
+                else:
+                    self.contained += 1
+                return _narrow(data, wanted, options["remote_limit"], match)
+
+        return None
+
+    def _index(self, items):
+        """
+        Record the limit and filters of cached results in the indexes of
+        their lookups
+
+        :param items: list (of tuples (string key, dictionary metadata))
+        :return: None
+        """
+
+        summaries = dict()
+        for key, meta in items:
+            summaries.setdefault(_index_key(key), dict())[key] = {
+                "limit": meta["limit"],
+                "filters": meta["filters"],
+                "truncated": meta["truncated"],
+            }
+
+        with self.disk.transact():
+            indexes = self.disk.get_many(list(summaries))
+            for index_key, summary in summaries.items():
+                indexes.setdefault(index_key, dict()).update(summary)
+            self.disk.set_many(list(indexes.items()), expire=self.timeout)
+
+    def stats(self):
+        """
+        Return hit and miss counters per tier
+
+        :return: dictionary
+        """
+
+        stats = dict()
+        if self.memory is not None:
+            stats["memory"] = self.memory.stats()
+        stats["disk"] = {"hits": self.disk_hits, "misses": self.disk_misses}
+        stats["subsumed"] = self.subsumed
+        stats["contained"] = self.contained
+        stats["hits"] = self.hits
+        stats["misses"] = self.misses
+        if self.write_queue:
+            stats["writes"] = {
+                "depth": self._queue.qsize() if self._queue is not None else 0,
+                "max_depth": self.max_depth,
+                "written": self.written,
+                "dropped": self.dropped,
+                "failed": self.failed,
+            }
+        return stats
+
+    def close(self):
+        """
+        Write the queued stores and close the backend
+
+        :return: None
+        """
+
+        self._stop_writer()
+        self._save_stats()
+
+        with self._lock:
+            if self._disk is not None:
+                self._disk.close()
+                self._disk = None
+
+    def summary(self, now=None):
+        """
+        Describe the results in the store: entries by status, records,
+        sizes, codecs, an age histogram (time since stored), the settings
+        of the store and the hit ratio over every client that used it
+
+        :param now: float (optional)
+            time ages are measured at (default: the current time)
+        :return: dictionary
+        """
+
+        if now is None:
+            now = time.time()
+
+        self._save_stats()
+
+        summary = dict(
+            entries=0,
+            found=0,
+            not_found=0,
+            legacy=0,
+            expired=0,
+            records=0,
+            stored_bytes=0,
+        )
+        codecs = dict()
+        ages = OrderedDict((label, 0) for label, _ in AGE_BUCKETS)
+
+        for _, entry, _ in self._entries():
+            summary["entries"] += 1
+
+            if not isinstance(entry, dict):
+                summary["legacy"] += 1
+                continue
+
+            meta = entry["meta"]
+            if meta["status_code"] == 200:
+                summary["found"] += 1
+            else:
+                summary["not_found"] += 1
+            summary["records"] += meta["count"]
+            summary["stored_bytes"] += len(entry["body"])
+
+            codec = meta.get("codec", LEGACY)
+            codecs[codec] = codecs.get(codec, 0) + 1
+
+            age = now - meta["stored"]
+            # kept past the timeout for incremental refreshes
+            if age >= self.timeout:
+                summary["expired"] += 1
+            for label, bound in AGE_BUCKETS:
+                if bound is None or age < bound:
+                    ages[label] += 1
+                    break
+
+        hits = self.disk.get(STATS_PREFIX + "hits", 0)
+        misses = self.disk.get(STATS_PREFIX + "misses", 0)
+
+        summary["disk_bytes"] = self.disk.volume()
+        summary["size_limit"] = self.disk.size_limit
+        summary["eviction_policy"] = self.disk.eviction_policy
+        summary["hits"] = hits
+        summary["misses"] = misses
+        summary["hit_ratio"] = None
+        if hits + misses:
+            summary["hit_ratio"] = round(hits / (hits + misses), 4)
+        summary["codecs"] = codecs
+        summary["ages"] = ages
+        return summary
+
+    def prune(self, older_than=None, now=None):
+        """
+        Remove expired results, results stored more than older_than seconds
+        ago, then evict results by the eviction policy until the store fits
+        its size limit
+
+        :param older_than: integer (optional)
+        :param now: float (optional)
+            time ages are measured at (default: the current time)
+        :return: dictionary (counts of removed entries and the size left)
+        """
+
+        if now is None:
+            now = time.time()
+
+        pruned = {"expired": self.disk.expire(), "aged": 0}
+
+        if older_than is not None:
+            aged = [
+                key
+                for key, entry, _ in self._entries()
+                if not isinstance(entry, dict)
+                or now - entry["meta"]["stored"] > older_than
+            ]
+            for key in aged:
+                if self.disk.delete(key):
+                    pruned["aged"] += 1
+
+        pruned["evicted"] = self.disk.cull()
+        pruned["disk_bytes"] = self.disk.volume()
+        return pruned
+
+    def dump(self, stream):
+        """
+        Write the results in the store to a stream as JSON lines, one per
+        result with its key, expiry time, metadata and encoded records, to be
+        read by load. Entries from versions without metadata are skipped.
+
+        :param stream: text file
+        :return: integer (number of results written)
+        """
+
+        written = 0
+
+        for key, entry, expire_time in self._entries():
+            if not isinstance(entry, dict):
+                continue
+
+            line = {
+                "key": key,
+                "expire_time": expire_time,
+                "meta": entry["meta"],
+                "body": base64.b64encode(entry["body"]).decode("ascii"),
+            }
+            stream.write(json.dumps(line) + "\n")
+            written += 1
+
+        return written
+
+    def load(self, stream, now=None):
+        """
+        Store the results written by dump, keeping their expiry time and
+        indexing them for narrower queries. Results which have expired since
+        are skipped.
+
+        :param stream: text file
+        :param now: float (optional)
+            time expiry is measured at (default: the current time)
+        :return: dictionary (counts of loaded and skipped results)
+        """
+
+        if now is None:
+            now = time.time()
+
+        loaded = {"loaded": 0, "skipped": 0}
+
+        for line in stream:
+            if not line.strip():
+                continue
+
+            item = json.loads(line)
+            expire = item["expire_time"]
+            if expire is not None:
+                expire -= now
+                if expire <= 0:
+                    loaded["skipped"] += 1
+                    continue
+
+            meta = item["meta"]
+            entry = {"meta": meta, "body": base64.b64decode(item["body"])}
+            self.disk.set(item["key"], entry, expire=expire)
+
+            if meta.get("filters") is not None:
+                self._index([(item["key"], meta)])
+            loaded["loaded"] += 1
+
+        return loaded
+
+    def _entries(self):
+        """
+        The results in the store, skipping its indexes and counters
+
+        :return: generator (of tuples (string key, entry, float expire time))
+        """
+
+        for key in self.disk:
+            if isinstance(key, str) and key.startswith(INTERNAL_PREFIX):
+                continue
+
+            entry, expire_time = self.disk.get(key, expire_time=True)
+            # expired or removed since the keys were listed
+            if entry is None:
+                continue
+
+            yield key, entry, expire_time
+
+    def _save_stats(self):
+        """
+        Add the hits and misses since the last save to the counters of the
+        store
+
+        :return: None
+        """
+
+        hits, misses = self.hits, self.misses
+        saved_hits, saved_misses = self._saved
+        if hits == saved_hits and misses == saved_misses:
+            return
+
+        self._saved = (hits, misses)
+        self.disk.incr(STATS_PREFIX + "hits", hits - saved_hits)
+        self.disk.incr(STATS_PREFIX + "misses", misses - saved_misses)
+
+
+def covers(meta, filters):
+    """
+    Whether a cached result answers a query for the same lookup: the cached
+    result must not have been truncated by its limit and its time window
+    must contain the window of the query.
+
+    :param meta: dictionary
+        metadata of the cached result
+    :param filters: dictionary
+        time filters of the query (see _filters)
+    :return: boolean
+    """
+
+    if meta.get("truncated", True) or meta.get("filters") is None:
+        return False
+
+    cached = meta["filters"]
+
+    for key, value in filters.items():
+        bound = cached.get(key)
+        if bound is None:
+            continue
+        if value is None:
+            return False
+        if key.endswith("_after") and value < bound:
+            return False
+        if key.endswith("_before") and value > bound:
+            return False
+
+    return True
+
+
+def containers(base):
+    """
+    The broader lookups whose results contain the results of a lookup, with
+    a predicate selecting the contained records from them:
+
+      * an IP address or CIDR is contained in each of its supernets
+      * an rrset name is contained in the left hand wildcard of each of its
+        parent zones (www.fsi.io in *.fsi.io and *.io) and the right hand
+        wildcard of each of its leading labels (www.fsi.io in www.* and
+        www.fsi.*)
+
+    rdata name lookups have no containers: the name they match is only
+    part of the rdata of most record types (10 mail.fsi.io. for MX), so
+    the contained records cannot be selected from a wildcard result.
+
+    Containers keep the lookup type, record type and bailiwick of the
+    query.
+
+    :param base: string
+        URI of the lookup without its parameters
+    :return: generator (of tuples (string, function))
+    """
+
+    prefix, separator, path = base.partition("/lookup/")
+    if not separator:
+        return
+
+    parts = path.split("/")
+
+    if parts[:2] == ["rdata", "ip"] and len(parts) == 3:
+        try:
+            network = ipaddress.ip_network(parts[2].replace(",", "/"), strict=False)
+        except ValueError:
+            return
+
+        match = _ip_match(network)
+        for prefixlen in range(network.prefixlen - 1, -1, -1):
+            supernet = str(network.supernet(new_prefix=prefixlen))
+            yield prefix + "/lookup/rdata/ip/" + supernet.replace("/", ","), match
+
+    elif parts[:2] == ["rrset", "name"] and len(parts) >= 4:
+        name = parts[2].lower().rstrip(".")
+        rest = "/".join(parts[3:])
+
+        if name.endswith(".*"):
+            return
+
+        bare = name[2:] if name.startswith("*.") else name
+        labels = bare.split(".")
+        match = _name_match(name)
+
+        def container(wildcard):
+            return "{}/lookup/rrset/name/{}/{}".format(prefix, wildcard, rest)
+
+        for index in range(1, len(labels)):
+            yield container("*." + ".".join(labels[index:])), match
+
+        if not name.startswith("*."):
+            for index in range(len(labels) - 1, 0, -1):
+                yield container(".".join(labels[:index]) + ".*"), match
+
+
+def _ip_match(network):
+    """
+    A predicate selecting rdata records with an address inside a network
+
+    :param network: ipaddress.IPv4Network or ipaddress.IPv6Network
+    :return: function
+    """
+
+    def match(record):
+        values = record.get("rdata")
+        if not isinstance(values, list):
+            values = [values]
+        for value in values:
+            try:
+                if ipaddress.ip_address(value) in network:
+                    return True
+            except ValueError:
+                continue
+        return False
+
+    return match
+
+
+def _name_match(name):
+    """
+    A predicate selecting records by the owner name of a name or left hand
+    wildcard query
+
+    :param name: string
+        lower case name without the trailing dot
+    :return: function
+    """
+
+    if name.startswith("*."):
+        suffix = name[1:]
+
+        def matches(value):
+            return value.endswith(suffix)
+
+    else:
+
+        def matches(value):
+            return value == name
+
+    def match(record):
+        value = record.get("rrname")
+        return isinstance(value, str) and matches(value.lower().rstrip("."))
+
+    return match
+
+
+def _filters(options):
+    """
+    The time filters of a query as absolute epoch integers
+
+    :param options: dictionary
+    :return: dictionary (None when a filter is relative or not an integer)
+    """
+
+    filters = dict()
+
+    for key in utils.TIME_FILTERS:
+        value = options.get(key)
+        if value is None:
+            filters[key] = None
+            continue
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            return None
+        # negative values are relative to the time of the query
+        if value < 0:
+            return None
+        filters[key] = value
+
+    return filters
+
+
+def _meta(data, options):
+    """
+    Build the metadata stored with a cached result
+
+    :param data: dictionary
+    :param options: dictionary (optional)
+    :return: dictionary
+    """
+
+    records = data["records"] or []
+
+    meta = {
+        "status_code": data["status_code"],
+        "error": data["error"],
+        "quota": data["quota"],
+        "count": len(records),
+        "limit": None,
+        "filters": None,
+        "truncated": True,
+        "stored": time.time(),
+    }
+
+    if options is not None:
+        limit = options["remote_limit"]
+        meta["limit"] = limit
+        meta["filters"] = _filters(options)
+        results_max = _results_max(data, options)
+        meta["truncated"] = _truncated(len(records), limit, results_max)
+
+    return meta
+
+
+def _results_max(data, options):
+    """
+    The maximum number of results the server returns for the API key of a
+    result: from the options of the query, or from its quota
+
+    :param data: dictionary
+    :param options: dictionary
+    :return: integer (None when unknown)
+    """
+
+    value = options.get("results_max")
+    if value is None and isinstance(data["quota"], dict):
+        value = data["quota"].get("results_max")
+
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _truncated(count, limit, results_max):
+    """
+    Whether a result may have been cut short: the server returns at most
+    limit records, and at most results_max whatever the limit. A result
+    with fewer records than both is complete.
+
+    :param count: integer
+    :param limit: integer (or None)
+    :param results_max: integer (None when unknown)
+    :return: boolean
+    """
+
+    # without a limit the server applies its own maximum, and without
+    # results_max a limit above it cannot be told apart
+    if not limit or results_max is None:
+        return True
+
+    return count >= min(limit, results_max)
+
+
+def _readable(entry):
+    """
+    Whether the codec of a disk entry is available: entries written with a
+    codec whose optional library is not installed are treated as misses
+
+    :param entry: dictionary (or bytes written by older versions)
+    :return: boolean
+    """
+
+    if not isinstance(entry, dict):
+        return True
+
+    name = entry["meta"].get("codec", LEGACY)
+    try:
+        get_codec(name)
+    except (ImportError, ValueError):
+        logger.warning("cache entry codec unavailable: %s", name)
+        return False
+    return True
+
+
+def _decode(entry):
+    """
+    Decode a disk entry into a result dictionary
+
+    :param entry: dictionary (or bytes written by older versions)
+    :return: tuple (dictionary, integer size of the serialized records)
+    """
+
+    if isinstance(entry, bytes):
+        encoded = gzip.decompress(entry)
+        return json.loads(encoded.decode("utf-8")), len(encoded)
+
+    meta = entry["meta"]
+    records, size = get_codec(meta.get("codec", LEGACY)).decode(entry["body"])
+
+    data = {
+        "records": records,
+        "status_code": meta["status_code"],
+        "error": meta["error"],
+        "quota": meta["quota"],
+    }
+    return data, size
+
+
+def _defer(entry):
+    """
+    Describe a disk entry from its metadata, deferring the decoding of its
+    records
+
+    :param entry: dictionary
+    :return: dictionary
+    """
+
+    meta = entry["meta"]
+
+    data = {
+        "records": None,
+        "status_code": meta["status_code"],
+        "error": meta["error"],
+        "quota": meta["quota"],
+        "count": meta["count"],
+        "load": partial(_load, entry["body"], meta.get("codec", LEGACY)),
+    }
+    return data
+
+
+def _load(body, codec=LEGACY):
+    """
+    Decode the records of a disk entry
+
+    :param body: bytes
+    :param codec: string (default: LEGACY)
+        name of the codec of the entry
+    :return: list (of dictionaries)
+    """
+
+    return get_codec(codec).decode(body)[0]
+
+
+def _narrow(data, filters, limit, match=None):
+    """
+    Filter a covering result down to the time window and limit of a query
+
+    :param data: dictionary
+    :param filters: dictionary
+    :param limit: integer
+    :param match: function (optional)
+        predicate selecting the records of a contained query
+    :return: dictionary
+    """
+
+    records = utils.filter_records(data["records"] or [], filters)
+
+    if match is not None:
+        records = [record for record in records if match(record)]
+
+    if limit:
+        records = records[0:limit]
+
+    narrowed = dict(data)
+
+    if records:
+        narrowed["status_code"] = 200
+        narrowed["error"] = None
+        narrowed["records"] = records
+    else:
+        narrowed["status_code"] = 404
+        narrowed["error"] = {"code": 404, "message": NOT_FOUND}
+        narrowed["records"] = None
+
+    return narrowed
+
+
+def _index_key(key):
+    """
+    The key of the index of cached results for the lookup of a URI
+
+    :param key: string
+    :return: string
+    """
+
+    return INDEX_PREFIX + key.split("?", 1)[0]
@@ -6,14 +6,19 @@ Command line client for Python DNSDB module
 
 import argparse
 import configparser
+import json
 import logging
 import os
 import sys
+import time
 from dnsdb import __version__
 from dnsdb.cli import utils
-from dnsdb import Dnsdb
 
 DEFAULT_CONFIG_FILE = os.path.expanduser("~/.dnsdb.ini")
+DEFAULT_CACHE_LOCATION = "/tmp/dnsdb-cache"
+CACHE_LOCATION_HELP = (
+    "Path to cache, or sqlite:///path or redis://host:port/db of a shared cache"
+)
 
 
 def main():
@@ -22,6 +27,14 @@ def main():
     :return: Shell exit code (0 or 1)
     """
 
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        serve(sys.argv[2:])
+        return
+
+    if len(sys.argv) > 1 and sys.argv[1] == "cache":
+        cache(sys.argv[2:])
+        return
+
     dnsdb_param = dict(api_key=None)
     dnsdb_search_param = dict()
     epilog_text = utils.epilog()
@@ -39,6 +52,13 @@ def main():
         dest="hexadecimal",
         help="hexadecimal digits specifying a raw octet string",
     )
+    group.add_argument(
+        "--batch",
+        dest="batch",
+        metavar="FILE",
+        help="run the queries of FILE (- for stdin) concurrently, one per line: "
+        "a name, an IP address or CIDR, or a JSON object of search options",
+    )
     parser.add_argument(
         "-t",
         "--type",
@@ -73,6 +93,12 @@ def main():
     parser.add_argument(
         "--sort", action="store_true", default=True, help="sort results by time last"
     )
+    parser.add_argument(
+        "--no-sort",
+        dest="sort",
+        action="store_false",
+        help="stream records unsorted, stopping at the return limit",
+    )
     parser.add_argument(
         "--epoch", action="store_true", default=False, help="return timestamps in epoch"
     )
@@ -119,10 +145,33 @@ def main():
     parser.add_argument(
         "--cache", action="store_true", default=False, help="Use cached results"
     )
-    parser.add_argument("--cache-location", dest="cache_location", help="Path to cache")
+    parser.add_argument(
+        "--cache-location",
+        dest="cache_location",
+        help=CACHE_LOCATION_HELP,
+    )
     parser.add_argument(
         "--cache-timeout", dest="cache_timeout", type=int, help="Timeout in seconds"
     )
+    parser.add_argument(
+        "--cache-refresh",
+        dest="cache_refresh",
+        action="store_true",
+        help="refresh expired cached results with only the records seen since",
+    )
+    parser.add_argument(
+        "--cache-write-queue",
+        dest="cache_write_queue",
+        type=int,
+        help="number of cache writes queued for a background writer",
+    )
+    parser.add_argument(
+        "--max-workers",
+        dest="max_workers",
+        type=int,
+        default=10,
+        help="number of concurrent batch queries",
+    )
     parser.add_argument("--apikey", dest="api_key", help="DNSDB API key")
     parser.add_argument("--server", dest="server", help="Server URL")
     parser.add_argument(
@@ -150,27 +199,10 @@ def main():
 
     logger.debug("args: %s", vars(args))
 
-    if os.path.isfile(args.config):
-        config = configparser.ConfigParser()
-        config.read(args.config)
-
-        if config["api.dnsdb.info"].get("api_key"):
-            dnsdb_param["api_key"] = config["api.dnsdb.info"].get("api_key")
-        if config["api.dnsdb.info"].get("server"):
-            dnsdb_param["server"] = config["api.dnsdb.info"].get("server")
-        if config["api.dnsdb.info"].getboolean("cache"):
-            dnsdb_param["cache"] = config["api.dnsdb.info"].getboolean("cache")
-        if config["api.dnsdb.info"].get("cache_location"):
-            dnsdb_param["cache_location"] = config["api.dnsdb.info"].get(
-                "cache_location"
-            )
-        if config["api.dnsdb.info"].get("cache_timeout"):
-            dnsdb_param["cache_timeout"] = config["api.dnsdb.info"].getint(
-                "cache_timeout"
-            )
-        logger.debug("config: %s", dnsdb_param)
-    else:
-        logger.debug("Config file not found: %s", args.config)
+    config = read_config(args.config, logger)
+    # the upstream server is only used by dnsdb serve
+    config.pop("upstream", None)
+    dnsdb_param.update(config)
 
     # command line arguments take precedent over values specified in conf file
     valid_dnsdb_parameters = [
@@ -179,6 +211,8 @@ def main():
         "cache",
         "cache_location",
         "cache_timeout",
+        "cache_refresh",
+        "cache_write_queue",
     ]
 
     for dnsdb_parameter in valid_dnsdb_parameters:
@@ -210,9 +244,28 @@ def main():
                 args, dnsdb_search_parameter
             )
 
+    # --no-sort is falsy and would be skipped above
+    dnsdb_search_param["sort"] = args.sort
+
+    # imported once the arguments are parsed: --help and --version stay fast
+    from dnsdb import Dnsdb
+
+    if args.batch:
+        if dnsdb_param["api_key"] is None:
+            logger.critical("Error: API key not specified")
+            sys.exit(1)
+
+        dnsdb_param["pool_maxsize"] = args.max_workers
+        with Dnsdb(**dnsdb_param) as dnsdb:
+            failed = batch(dnsdb, args, dnsdb_search_param, logger)
+        sys.exit(1 if failed else 0)
+
     if dnsdb_param["api_key"] is not None:
         dnsdb = Dnsdb(**dnsdb_param)
-        result = dnsdb.search(**dnsdb_search_param)
+        if args.sort:
+            result = dnsdb.search(**dnsdb_search_param)
+        else:
+            result = dnsdb.iter_search(**dnsdb_search_param)
         logger.debug("status_code: %s", result.status_code)
         logger.debug("error: %s", result.error)
         logger.debug("cached: %s", result.cached)
@@ -226,12 +279,512 @@ def main():
         sys.exit(1)
 
     if result.records:
-        utils.output(args.oformat, result.records)
+        try:
+            utils.output(args.oformat, result.records)
+        except BrokenPipeError:
+            # the reader went away (e.g. | head): stop quietly
+            utils.close_stdout()
+            dnsdb.close()
+            sys.exit(0)
     else:
         logger.info("No records found")
 
+    # written behind the output with --cache-write-queue
+    dnsdb.close()
     sys.exit(0)
 
 
+def serve(argv):
+    """
+    Run the local caching gateway, see dnsdb.gateway
+
+    :param argv: list (of strings)
+        the arguments following "serve"
+    :return: None
+    """
+
+    parser = argparse.ArgumentParser(
+        prog="dnsdb serve",
+        description="Local caching gateway to DNSDB; point clients at it with "
+        "--server or the server setting of the configuration file",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8053, help="port to listen on")
+    parser.add_argument(
+        "--upstream",
+        dest="server",
+        help="DNSDB server URL (default: upstream in the config file, "
+        "or https://api.dnsdb.info)",
+    )
+    parser.add_argument("--apikey", dest="api_key", help="DNSDB API key")
+    parser.add_argument(
+        "--cache-location",
+        dest="cache_location",
+        help=CACHE_LOCATION_HELP,
+    )
+    parser.add_argument(
+        "--cache-timeout", dest="cache_timeout", type=int, help="Timeout in seconds"
+    )
+    parser.add_argument(
+        "--memory-cache-entries",
+        dest="memory_cache_entries",
+        type=int,
+        default=1024,
+        help="number of results kept in memory",
+    )
+    parser.add_argument(
+        "--pool-maxsize",
+        dest="pool_maxsize",
+        type=int,
+        default=20,
+        help="number of connections kept open to DNSDB",
+    )
+    parser.add_argument(
+        "--cache-refresh",
+        dest="cache_refresh",
+        action="store_true",
+        help="refresh expired cached results with only the records seen since",
+    )
+    parser.add_argument(
+        "--cache-write-queue",
+        dest="cache_write_queue",
+        type=int,
+        default=256,
+        help="number of cache writes queued for a background writer, 0 writes "
+        "before answering",
+    )
+    parser.add_argument(
+        "--no-cache", dest="cache", action="store_false", help="do not cache results"
+    )
+    parser.add_argument(
+        "--no-rate-limit",
+        dest="rate_limit",
+        action="store_false",
+        help="do not pace requests from the DNSDB quota",
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="count", default=0, help="Set the verbosity level"
+    )
+    parser.add_argument(
+        "-c",
+        "--config",
+        dest="config",
+        help="Path to config file",
+        default=DEFAULT_CONFIG_FILE,
+    )
+    args = parser.parse_args(argv)
+
+    log_levels = [logging.WARNING, logging.INFO, logging.DEBUG]
+    log_level = log_levels[min(len(log_levels) - 1, args.verbose)]
+
+    logging.basicConfig(level=log_level, format="%(message)s")
+    logger = logging.getLogger()
+
+    dnsdb_param = read_config(args.config, logger)
+    # server may point clients at this gateway: upstream names the real API
+    dnsdb_param.pop("server", None)
+    if dnsdb_param.get("upstream"):
+        dnsdb_param["server"] = dnsdb_param.pop("upstream")
+
+    for key in (
+        "api_key",
+        "server",
+        "cache_location",
+        "cache_timeout",
+        "cache_refresh",
+    ):
+        if getattr(args, key):
+            dnsdb_param[key] = getattr(args, key)
+
+    if dnsdb_param.get("api_key") is None:
+        logger.critical("Error: API key not specified")
+        sys.exit(1)
+
+    from dnsdb import Dnsdb
+    from dnsdb.gateway import serve as serve_gateway
+
+    dnsdb_param.update(
+        cache=args.cache,
+        cache_write_queue=args.cache_write_queue,
+        memory_cache_entries=args.memory_cache_entries,
+        pool_maxsize=args.pool_maxsize,
+        rate_limit=args.rate_limit,
+    )
+    serve_gateway(Dnsdb(**dnsdb_param), host=args.host, port=args.port)
+
+
+def cache(argv):
+    """
+    Administer the cache directory: stats, prune, warm, export and import
+
+    :param argv: list (of strings)
+        the arguments following "cache"
+    :return: None
+    """
+
+    from dnsdb.cache import EVICTION_POLICIES, ResultCache
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
+        "--cache-location",
+        dest="cache_location",
+        help=CACHE_LOCATION_HELP,
+    )
+    common.add_argument(
+        "-v", "--verbose", action="count", default=0, help="Set the verbosity level"
+    )
+    common.add_argument(
+        "-c",
+        "--config",
+        dest="config",
+        help="Path to config file",
+        default=DEFAULT_CONFIG_FILE,
+    )
+
+    parser = argparse.ArgumentParser(
+        prog="dnsdb cache", description="Administer the DNSDB cache directory"
+    )
+    actions = parser.add_subparsers(dest="action", metavar="ACTION")
+    actions.required = True
+
+    actions.add_parser(
+        "stats",
+        parents=[common],
+        help="print entries, sizes, hit ratio and an age histogram as JSON",
+    )
+
+    prune = actions.add_parser(
+        "prune",
+        parents=[common],
+        help="remove expired and old results and evict down to the size limit",
+    )
+    prune.add_argument(
+        "--size-limit",
+        dest="cache_size_limit",
+        type=utils.parse_size,
+        metavar="SIZE",
+        help="maximum size of the cache, e.g. 500M or 2G; kept for later use",
+    )
+    prune.add_argument(
+        "--eviction-policy",
+        dest="cache_eviction_policy",
+        choices=EVICTION_POLICIES,
+        help="results evicted first; kept for later use",
+    )
+    prune.add_argument(
+        "--older-than",
+        dest="older_than",
+        type=int,
+        metavar="SECONDS",
+        help="also remove results stored more than SECONDS ago",
+    )
+
+    warm = actions.add_parser(
+        "warm",
+        parents=[common],
+        help="run the queries of FILE concurrently to cache their results",
+    )
+    warm.add_argument(
+        "file", help="queries, one per line as for --batch (- for stdin)"
+    )
+    warm.add_argument(
+        "--max-workers",
+        dest="max_workers",
+        type=int,
+        default=10,
+        help="number of concurrent queries",
+    )
+    warm.add_argument("--apikey", dest="api_key", help="DNSDB API key")
+    warm.add_argument("--server", dest="server", help="Server URL")
+
+    export = actions.add_parser(
+        "export", parents=[common], help="write the cached results to FILE"
+    )
+    export.add_argument("file", help="JSON lines file (- for stdout)")
+
+    load = actions.add_parser(
+        "import", parents=[common], help="add the results exported to FILE"
+    )
+    load.add_argument("file", help="JSON lines file (- for stdin)")
+
+    args = parser.parse_args(argv)
+
+    log_levels = [logging.WARNING, logging.INFO, logging.DEBUG]
+    log_level = log_levels[min(len(log_levels) - 1, args.verbose)]
+
+    logging.basicConfig(level=log_level, format="%(message)s")
+    logger = logging.getLogger()
+
+    settings = read_config(args.config, logger)
+    settings.pop("upstream", None)
+
+    for key in (
+        "api_key",
+        "server",
+        "cache_location",
+        "cache_size_limit",
+        "cache_eviction_policy",
+    ):
+        if getattr(args, key, None):
+            settings[key] = getattr(args, key)
+
+    if args.action == "warm":
+        sys.exit(warm_cache(settings, args, logger))
+
+    results = ResultCache(
+        settings.get("cache_location", DEFAULT_CACHE_LOCATION),
+        timeout=settings.get("cache_timeout", 900),
+        size_limit=settings.get("cache_size_limit"),
+        eviction_policy=settings.get("cache_eviction_policy"),
+    )
+
+    try:
+        if args.action == "stats":
+            print(json.dumps(results.summary(), indent=2))
+        elif args.action == "prune":
+            print(json.dumps(results.prune(older_than=args.older_than)))
+        elif args.action == "export":
+            if args.file == "-":
+                written = results.dump(sys.stdout)
+            else:
+                with open(args.file, "w") as stream:
+                    written = results.dump(stream)
+            print(json.dumps({"exported": written}), file=sys.stderr)
+        else:
+            if args.file == "-":
+                loaded = results.load(sys.stdin)
+            else:
+                with open(args.file) as stream:
+                    loaded = results.load(stream)
+            print(json.dumps(loaded), file=sys.stderr)
+    finally:
+        results.close()
+
+
+def warm_cache(settings, args, logger):
+    """
+    Run the queries of a file concurrently with caching enabled, printing a
+    JSON summary
+
+    :param settings: dictionary
+        Dnsdb arguments
+    :param args: argparse.Namespace
+    :param logger: logging.Logger
+    :return: integer (1 when a query failed, 0 otherwise)
+    """
+
+    if settings.get("api_key") is None:
+        logger.critical("Error: API key not specified")
+        return 1
+
+    from dnsdb import Dnsdb
+
+    settings.update(cache=True, pool_maxsize=args.max_workers)
+    summary = dict(queries=0, cached=0, fetched=0, not_found=0, failed=0)
+
+    # only the full result is cached: skip sorting it
+    queries = _read_queries(args.file, {"sort": False}, summary, logger)
+    start = time.perf_counter()
+
+    with Dnsdb(**settings) as dnsdb:
+        for query, result in dnsdb.search_many(queries, max_workers=args.max_workers):
+            if result.status_code not in (200, 404):
+                summary["failed"] += 1
+                logger.error("%s: %s", query, result.error["message"])
+            elif result.cached:
+                summary["cached"] += 1
+            else:
+                summary["fetched"] += 1
+                if result.status_code == 404:
+                    summary["not_found"] += 1
+
+    summary["seconds"] = round(time.perf_counter() - start, 3)
+    print(json.dumps(summary))
+    return 1 if summary["failed"] else 0
+
+
+def read_config(path, logger):
+    """
+    Read the client settings of a configuration file
+
+    :param path: string
+    :param logger: logging.Logger
+    :return: dictionary
+    """
+
+    dnsdb_param = dict()
+
+    if not os.path.isfile(path):
+        logger.debug("Config file not found: %s", path)
+        return dnsdb_param
+
+    config = configparser.ConfigParser()
+    config.read(path)
+
+    if config["api.dnsdb.info"].get("api_key"):
+        dnsdb_param["api_key"] = config["api.dnsdb.info"].get("api_key")
+    if config["api.dnsdb.info"].get("server"):
+        dnsdb_param["server"] = config["api.dnsdb.info"].get("server")
+    if config["api.dnsdb.info"].get("upstream"):
+        dnsdb_param["upstream"] = config["api.dnsdb.info"].get("upstream")
+    if config["api.dnsdb.info"].getboolean("cache"):
+        dnsdb_param["cache"] = config["api.dnsdb.info"].getboolean("cache")
+    if config["api.dnsdb.info"].get("cache_location"):
+        dnsdb_param["cache_location"] = config["api.dnsdb.info"].get("cache_location")
+    if config["api.dnsdb.info"].get("cache_timeout"):
+        dnsdb_param["cache_timeout"] = config["api.dnsdb.info"].getint(
+            "cache_timeout"
+        )
+    if config["api.dnsdb.info"].getboolean("cache_refresh"):
+        dnsdb_param["cache_refresh"] = True
+    if config["api.dnsdb.info"].get("cache_codec"):
+        dnsdb_param["cache_codec"] = config["api.dnsdb.info"].get("cache_codec")
+    if config["api.dnsdb.info"].get("cache_size_limit"):
+        dnsdb_param["cache_size_limit"] = utils.parse_size(
+            config["api.dnsdb.info"].get("cache_size_limit")
+        )
+    if config["api.dnsdb.info"].get("cache_eviction_policy"):
+        dnsdb_param["cache_eviction_policy"] = config["api.dnsdb.info"].get(
+            "cache_eviction_policy"
+        )
+    if config["api.dnsdb.info"].get("results_max"):
+        dnsdb_param["results_max"] = config["api.dnsdb.info"].getint("results_max")
+    logger.debug("config: %s", dnsdb_param)
+
+    return dnsdb_param
+
+
+def batch(dnsdb, args, defaults, logger):
+    """
+    Run the queries of a batch file concurrently, printing the records of
+    each query as it completes and a summary to stderr
+
+    :param dnsdb: Dnsdb
+    :param args: argparse.Namespace
+    :param defaults: dictionary
+        search arguments of the command line, applied to every query
+    :param logger: logging.Logger
+    :return: integer (number of failed queries)
+    """
+
+    defaults = dict(defaults)
+    for key in ("name", "ip", "hexadecimal"):
+        defaults.pop(key, None)
+
+    tags = dict()
+    summary = dict(
+        queries=0,
+        found=0,
+        not_found=0,
+        failed=0,
+        records=0,
+        cached=0,
+        requests=0,
+        refreshed=0,
+        bytes_saved=0,
+    )
+
+    queries = _read_queries(args.batch, defaults, summary, logger, tags)
+    writer = utils.Writer(args.oformat, tagged=True)
+    quota = None
+    start = time.perf_counter()
+
+    try:
+        for query, result in dnsdb.search_many(queries, max_workers=args.max_workers):
+            tag = tags.pop(id(query))
+
+            if result.cached:
+                summary["cached"] += 1
+            elif result.status_code is not None:
+                summary["requests"] += 1
+            if result.refresh is not None:
+                summary["refreshed"] += 1
+                summary["bytes_saved"] += result.refresh["bytes_saved"]
+            # completion order is not send order: keep the lowest quota
+            if _remaining(result.quota) is not None:
+                if quota is None or _remaining(result.quota) < _remaining(quota):
+                    quota = result.quota
+
+            if result.status_code == 200:
+                summary["found"] += 1
+                summary["records"] += len(result.records)
+                writer.write(result.records, tag)
+                writer.flush()
+            elif result.status_code == 404:
+                summary["not_found"] += 1
+            else:
+                summary["failed"] += 1
+                logger.error("%s: %s", tag, result.error["message"])
+        writer.flush()
+    except BrokenPipeError:
+        utils.close_stdout()
+        return 0
+
+    summary["seconds"] = round(time.perf_counter() - start, 3)
+    if quota is not None:
+        summary["quota_limit"] = quota["limit"]
+        summary["quota_remaining"] = quota["remaining"]
+
+    print(json.dumps(summary), file=sys.stderr)
+    return summary["failed"]
+
+
+def _read_queries(path, defaults, summary, logger, tags=None):
+    """
+    Read the queries of a file, one per line, merging each with the
+    defaults; invalid lines are logged and counted as failed
+
+    :param path: string
+        file to read (- for stdin)
+    :param defaults: dictionary
+        search arguments applied to every query
+    :param summary: dictionary
+        its queries and failed counts are incremented
+    :param logger: logging.Logger
+    :param tags: dictionary (optional)
+        filled with the line of each query, keyed by the id of its search
+        arguments
+    :return: generator (of dictionaries)
+    """
+
+    if path == "-":
+        lines = sys.stdin
+    else:
+        lines = open(path)
+
+    with lines:
+        for number, line in enumerate(lines, 1):
+            try:
+                query = utils.parse_query(line)
+            except ValueError as exc:
+                summary["queries"] += 1
+                summary["failed"] += 1
+                logger.error("line %s: invalid query: %s", number, exc)
+                continue
+            if query is None:
+                continue
+
+            summary["queries"] += 1
+            search = dict(defaults)
+            search.update(query)
+            if tags is not None:
+                tags[id(search)] = line.strip()
+            yield search
+
+
+def _remaining(quota):
+    """
+    The remaining quota of a result as an integer
+
+    :param quota: dictionary (or None)
+    :return: integer (None when unknown)
+    """
+
+    try:
+        return int(quota["remaining"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
 if __name__ == "__main__":
     main()
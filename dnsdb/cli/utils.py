@@ -3,10 +3,28 @@
 Utility functions needed by the DNSDB module
 """
 
+import argparse
 import json
 import csv
+import ipaddress
+import os
 import sys
 
+FIELDNAMES = (
+    "time_last",
+    "time_first",
+    "source",
+    "count",
+    "bailiwick",
+    "rrname",
+    "rrtype",
+    "rdata",
+)
+BATCH_FIELDNAMES = ("query",) + FIELDNAMES
+
+# number of records formatted before the buffered output is written
+BUFFER_RECORDS = 4096
+
 
 def epilog():
     """
@@ -22,114 +40,203 @@ def epilog():
     yyyy-mm-dd (2016-01-01),
     yyyymmdd (20160101),
     yyyymmddThh (20160101T12),
-    yyyy-mm-ddThh:mm:ss-hh:mm (2016-01-01T00:00:00-00:00)
+    yyyy-mm-ddThh:mm:ss-hh:mm (2016-01-01T00:00:00-00:00),
+    epoch (1451606400),
+    relative (-30s, -15m, -24h, -7d, -2w)
     """
     return epilog_text
 
 
-def get_fieldnames(records):
+class Writer:
     """
-    Extract fieldnames for CSV headers from list of results
-
-    :param records: list
-    :return: list
+    A streaming writer of records in json, jsonp or csv. Records are read
+    from any iterable and written in large blocks; the csv header has a
+    fixed column order and each rdata value is written as its own row.
     """
 
-    fieldnames = []
-
-    ordered_fieldname = (
-        "time_last",
-        "time_first",
-        "source",
-        "count",
-        "bailiwick",
-        "rrname",
-        "rrtype",
-        "rdata",
-    )
-
-    # build a list of unique keys from all returned records
-    for record in records:
-        keys = list(record.keys())
-        for key in keys:
-            if key not in fieldnames:
-                fieldnames.append(key)
-
-    # sort fieldnames based on order in ordered_fieldname
-    fieldnames = sorted(fieldnames, key=lambda x: ordered_fieldname.index(x))
-
-    return fieldnames
-
-
-def flatten_record(records):
+    def __init__(self, oformat, stream=None, tagged=False):
+        """
+        :param oformat: string
+            json, jsonp or csv
+        :param stream: file object (default: sys.stdout)
+        :param tagged: boolean (default: False)
+            tag each record with the batch query it answers
+        """
+
+        self.oformat = oformat
+        self.stream = stream if stream is not None else sys.stdout
+        self.tagged = tagged
+        self.records = 0
+
+        self._buffer = []
+        self._pending = 0
+        self._rows = None
+
+        if oformat == "csv":
+            # csv writes each row with one call to the write method
+            self._rows = csv.writer(_Appender(self._buffer))
+            self._rows.writerow(BATCH_FIELDNAMES if tagged else FIELDNAMES)
+
+    def write(self, records, tag=None):
+        """
+        Format and buffer records, writing the buffer whenever it is full
+
+        :param records: iterable (of dictionaries), RecordSet or None
+        :param tag: string (optional)
+            the batch query of the records when tagged
+        :return: None
+        """
+
+        if not records:
+            return
+
+        if self.oformat == "csv":
+            write = self._write_csv
+        elif self.oformat == "jsonp":
+            write = self._write_jsonp
+        else:
+            write = self._write_json
+
+        for record in records:
+            if not isinstance(record, dict):
+                record = record.to_dict()
+            write(record, tag)
+
+            self.records += 1
+            self._pending += 1
+            if self._pending >= BUFFER_RECORDS:
+                self.flush()
+
+    def flush(self):
+        """
+        Write the buffered output to the stream
+
+        :return: None
+        """
+
+        if self._buffer:
+            self.stream.write("".join(self._buffer))
+            del self._buffer[:]
+        self._pending = 0
+        self.stream.flush()
+
+    def _write_json(self, record, tag):
+        line = json.dumps(record)
+        if self.tagged:
+            # splice the tag in front of the record instead of copying it
+            line = '{"query": ' + json.dumps(tag) + ", " + line[1:]
+        self._buffer.append(line + "\n")
+
+    def _write_jsonp(self, record, tag):
+        if self.tagged:
+            tagged = {"query": tag}
+            tagged.update(record)
+            record = tagged
+        self._buffer.append(json.dumps(record, indent=4) + "\n")
+
+    def _write_csv(self, record, tag):
+        row = [record.get(field, "") for field in FIELDNAMES]
+        if self.tagged:
+            row.insert(0, tag)
+
+        rdata = row[-1]
+        if not isinstance(rdata, list):
+            # rdata lookups return a single value rather than a list
+            self._rows.writerow(row)
+            return
+
+        for value in rdata:
+            row[-1] = value
+            self._rows.writerow(row)
+
+
+class _Appender:
     """
-    Flatten record objects by rdata field to support line delimited (CSV) output
-
-    :param records: list
-    :return: list
+    A file-like object appending writes to a list
     """
 
-    flattened_records = []
+    __slots__ = ("write",)
 
-    for record in records:
-        for rdata in record["rdata"]:
-            r = record
-            r["rdata"] = rdata
-            flattened_records.append(r)
+    def __init__(self, buffer):
+        self.write = buffer.append
 
-    return flattened_records
 
-
-def out_json(records):
+def output(oformat, records):
     """
-    Print results in json to stdout
+    Write records to stdout
 
-    :param records: list
+    :param oformat: string
+        json, jsonp or csv
+    :param records: iterable (of dictionaries) or RecordSet
     :return: None
     """
 
-    for record in records:
-        print(json.dumps(record))
+    writer = Writer(oformat)
+    writer.write(records)
+    writer.flush()
 
 
-def out_jsonp(records):
+def close_stdout():
     """
-    Print results in json (pretty print) to stdout
+    Point stdout at devnull after the reader of a pipe went away, so the
+    interpreter does not fail flushing it again at exit
 
-    :param records: list
     :return: None
     """
 
-    for record in records:
-        print(json.dumps(record, indent=4))
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, sys.stdout.fileno())
 
 
-def out_csv(records):
+def parse_query(line):
     """
-    Print results in csv to stdout
+    Parse one line of a batch file: a JSON object of search arguments, or a
+    plain indicator searched as an IP address or CIDR when it is one and as
+    a name otherwise. A leading "*." or trailing ".*" makes a name lookup a
+    left or right wildcard search.
 
-    :param records: list
-    :return: None
+    :param line: string
+    :return: dictionary (None for blank lines and # comments)
     """
 
-    fieldnames = get_fieldnames(records)
-    flat_records = flatten_record(records)
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
 
-    writer = csv.DictWriter(sys.stdout, fieldnames)
-    for record in flat_records:
-        writer.writerow(record)
+    if line.startswith("{"):
+        query = json.loads(line)
+        if not isinstance(query, dict):
+            raise ValueError("expected a JSON object")
+        return query
 
+    try:
+        ipaddress.ip_network(line, strict=False)
+    except ValueError:
+        pass
+    else:
+        return {"ip": line}
 
-def output(oformat, records):
+    if line.startswith("*."):
+        return {"name": line, "wildcard_left": True}
+    if line.endswith(".*"):
+        return {"name": line, "wildcard_right": True}
+    return {"name": line}
+
+
+def parse_size(value):
     """
+    Parse a size in bytes with an optional K, M or G suffix (powers of 1024)
 
-    :param oformat: string
-    :param records: list
-    :return:
+    :param value: string
+    :return: integer
     """
-    if oformat == "json":
-        out_json(records)
-    elif oformat == "jsonp":
-        out_jsonp(records)
-    elif oformat == "csv":
-        out_csv(records)
+
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    value = value.strip().upper().rstrip("B")
+
+    try:
+        if value and value[-1] in units:
+            return int(float(value[:-1]) * units[value[-1]])
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid size: {}".format(value))
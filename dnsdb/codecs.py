@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+"""
+Codecs of cached results
+
+A codec turns the records of a result into the body of a cache entry: a
+serializer followed by a compressor. Codecs are named
+"<serializer>+<compressor>[:<level>]", e.g. "json+gzip:6" or
+"records+zstd:3"; a bare compressor ("zlib:1") serializes to JSON. The name
+of the codec is stored with each entry, so entries written with any codec
+stay readable whatever codec the cache writes.
+
+Serializers:
+  * json: the standard library
+  * msgpack: https://pypi.org/project/msgpack/ (if installed)
+  * records: a compact binary encoding of the record structure: a table of
+    distinct strings, a table of record layouts and the integers of every
+    record (counts, timestamps and string indexes) in one array, column by
+    column. Results holding values the layouts cannot describe are stored
+    as JSON.
+
+Compressors:
+  * none
+  * gzip: level 0-9
+  * zlib: level 0-9
+  * zstd: https://pypi.org/project/zstandard/ (if installed), level 1-22
+  * lz4: https://pypi.org/project/lz4/ (if installed), level 0-16
+"""
+
+import gc
+import gzip
+import json
+import struct
+import sys
+import zlib
+from array import array
+from collections import defaultdict
+from functools import lru_cache
+from itertools import chain, count, islice, repeat
+
+SERIALIZERS = ("json", "msgpack", "records")
+COMPRESSORS = ("none", "gzip", "zlib", "zstd", "lz4")
+
+# the codec of entries written before codecs were tagged
+LEGACY = "json+gzip:9"
+
+_PACKED = b"R"
+_JSON = b"J"
+_HEADER = struct.Struct("<I")
+_KINDS = {int: "i", str: "s", list: "l", type(None): "n"}
+
+
+class Codec:
+    """
+    A serializer and a compressor for the records of cached results
+    """
+
+    def __init__(self, serializer="json", compressor="gzip", level=None):
+        """
+        :param serializer: string (default: "json")
+            json, msgpack or records
+        :param compressor: string (default: "gzip")
+            none, gzip, zlib, zstd or lz4
+        :param level: integer (optional)
+            compression level, the default of the compressor when None
+        """
+
+        if serializer not in SERIALIZERS:
+            raise ValueError(
+                "Unknown cache serializer {}, expected one of {}".format(
+                    serializer, ", ".join(SERIALIZERS)
+                )
+            )
+        if compressor not in COMPRESSORS:
+            raise ValueError(
+                "Unknown cache compressor {}, expected one of {}".format(
+                    compressor, ", ".join(COMPRESSORS)
+                )
+            )
+
+        self.serializer = serializer
+        self.compressor = compressor
+        self.level = level
+
+        self._dumps, self._loads = _serializer(serializer)
+        self._compress, self._decompress = _compressor(compressor, level)
+
+    @property
+    def name(self):
+        """
+        The name the codec is tagged with, see get_codec
+
+        :return: string
+        """
+
+        name = "{}+{}".format(self.serializer, self.compressor)
+        if self.level is not None:
+            name += ":{}".format(self.level)
+        return name
+
+    def encode(self, records):
+        """
+        Serialize and compress records
+
+        :param records: list (of dictionaries) or None
+        :return: tuple (bytes body, integer size of the serialized records)
+        """
+
+        serialized = self._dumps(records)
+        return self._compress(serialized), len(serialized)
+
+    def decode(self, body):
+        """
+        Decompress and deserialize records, with the cyclic garbage
+        collector paused (see ndjson.read_ndjson)
+
+        :param body: bytes
+        :return: tuple (list (of dictionaries) or None, integer size of the
+            serialized records)
+        """
+
+        serialized = self._decompress(body)
+
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self._loads(serialized), len(serialized)
+        finally:
+            if enabled:
+                gc.enable()
+
+
+@lru_cache(maxsize=None)
+def get_codec(name=None):
+    """
+    Return a codec by name
+
+    :param name: string (optional: default=LEGACY)
+        "<serializer>+<compressor>[:<level>]" or "<compressor>[:<level>]"
+    :return: Codec
+    """
+
+    if name is None:
+        name = LEGACY
+
+    serializer, _, compressor = name.rpartition("+")
+    compressor, _, level = compressor.partition(":")
+
+    try:
+        level = int(level) if level else None
+    except ValueError:
+        raise ValueError("Invalid cache codec level: {}".format(name))
+
+    return Codec(serializer or "json", compressor, level)
+
+
+def _serializer(name):
+    """
+    The dumps and loads functions of a serializer
+
+    :param name: string
+    :return: tuple (function, function)
+    """
+
+    if name == "json":
+        return _json_dumps, json.loads
+
+    if name == "msgpack":
+        import msgpack
+
+        def loads(data):
+            return msgpack.unpackb(data, raw=False)
+
+        return msgpack.packb, loads
+
+    return _pack_records, _unpack_records
+
+
+def _compressor(name, level):
+    """
+    The compress and decompress functions of a compressor
+
+    :param name: string
+    :param level: integer (or None)
+    :return: tuple (function, function)
+    """
+
+    if name == "none":
+        return bytes, bytes
+
+    if name == "gzip":
+        level = 9 if level is None else level
+
+        def compress(data):
+            return gzip.compress(data, compresslevel=level)
+
+        return compress, gzip.decompress
+
+    if name == "zlib":
+        level = -1 if level is None else level
+        return lambda data: zlib.compress(data, level), zlib.decompress
+
+    if name == "zstd":
+        import zstandard
+
+        compressor = zstandard.ZstdCompressor(level=3 if level is None else level)
+        decompressor = zstandard.ZstdDecompressor()
+        return compressor.compress, decompressor.decompress
+
+    import lz4.frame
+
+    level = 0 if level is None else level
+    return (
+        lambda data: lz4.frame.compress(data, compression_level=level),
+        lz4.frame.decompress,
+    )
+
+
+def _json_dumps(records):
+    """
+    Serialize records to JSON
+
+    :param records: list (of dictionaries) or None
+    :return: bytes
+    """
+
+    return json.dumps(records).encode("utf-8")
+
+
+def _pack_records(records):
+    """
+    Serialize records with the records encoding, see the module
+    documentation. Records are grouped by layout: their keys and the kind
+    of each value (i an integer, s a string, l a list of strings or n None).
+    Each group is stored column by column, so records are split and rebuilt
+    with zip and map rather than value by value. Results mixing kinds under
+    one key are stored as JSON.
+
+    :param records: list (of dictionaries) or None
+    :return: bytes
+    """
+
+    if records is None:
+        return _JSON + _json_dumps(records)
+
+    layout_keys = list(map(tuple, records))
+    rows = list(map(tuple, map(dict.values, records)))
+    groups = dict.fromkeys(layout_keys)
+    order = []
+
+    if len(groups) == 1:
+        groups[layout_keys[0]] = (0, rows)
+    else:
+        for number, keys in enumerate(groups):
+            groups[keys] = (number, [])
+        for keys, row in zip(layout_keys, rows):
+            group = groups[keys]
+            order.append(group[0])
+            group[1].append(row)
+
+    ids = defaultdict(count().__next__)
+    ints = array("q")
+    layouts = []
+
+    try:
+        if len(groups) > 1:
+            ints.extend(order)
+
+        for keys, (_, rows) in groups.items():
+            columns = list(zip(*rows))
+            kinds = ""
+            for column in columns:
+                types = set(map(type, column))
+                if len(types) != 1 or not types <= _KINDS.keys():
+                    return _JSON + _json_dumps(records)
+                kinds += _KINDS[types.pop()]
+            layouts.append([keys, kinds, len(rows)])
+
+            for kind, column in zip(kinds, columns):
+                if kind == "i":
+                    ints.extend(column)
+                elif kind == "s":
+                    ints.extend(map(ids.__getitem__, column))
+                elif kind == "l":
+                    items = list(chain.from_iterable(column))
+                    if not set(map(type, items)) <= {str}:
+                        return _JSON + _json_dumps(records)
+                    ints.extend(map(len, column))
+                    ints.extend(map(ids.__getitem__, items))
+    except OverflowError:
+        # integers beyond 64 bits
+        return _JSON + _json_dumps(records)
+
+    if sys.byteorder == "big":
+        ints.byteswap()
+
+    header = json.dumps([list(ids), layouts]).encode("utf-8")
+    return b"".join((_PACKED, _HEADER.pack(len(header)), header, ints.tobytes()))
+
+
+def _unpack_records(data):
+    """
+    Deserialize records encoded by _pack_records
+
+    :param data: bytes
+    :return: list (of dictionaries) or None
+    """
+
+    if data[:1] == _JSON:
+        return json.loads(data[1:])
+
+    start = 1 + _HEADER.size
+    (size,) = _HEADER.unpack_from(data, 1)
+    strings, layouts = json.loads(data[start : start + size])
+
+    ints = array("q")
+    ints.frombytes(data[start + size :])
+    if sys.byteorder == "big":
+        ints.byteswap()
+    ints = ints.tolist()
+
+    string = strings.__getitem__
+    position = 0
+    order = None
+    if len(layouts) > 1:
+        position = sum(layout[2] for layout in layouts)
+        order = ints[:position]
+
+    groups = []
+
+    for keys, kinds, rows in layouts:
+        columns = []
+
+        for kind in kinds:
+            if kind == "i":
+                columns.append(ints[position : position + rows])
+                position += rows
+            elif kind == "s":
+                columns.append(map(string, ints[position : position + rows]))
+                position += rows
+            elif kind == "l":
+                lengths = ints[position : position + rows]
+                position += rows
+                total = sum(lengths)
+                items = map(string, ints[position : position + total])
+                position += total
+                columns.append([list(islice(items, length)) for length in lengths])
+            else:
+                columns.append(repeat(None, rows))
+
+        if keys:
+            groups.append([dict(zip(keys, row)) for row in zip(*columns)])
+        else:
+            # zip over no columns yields no rows
+            groups.append([{} for _ in range(rows)])
+
+    if order is None:
+        return groups[0] if groups else []
+
+    iterators = [iter(group) for group in groups]
+    return [next(iterators[layout]) for layout in order]
@@ -42,6 +42,33 @@ result = dnsdb.search(name="fsi.io",
                       cache_location="/tmp/dnsdb-cache")
 result = dnsdb.quota()
 
+INCREMENTAL REFRESH EXAMPLE:::
+
+dnsdb = Dnsdb(api_key, cache=True, cache_refresh=True)
+result = dnsdb.search(name="fsi.io")
+# once the cached result expires, only records seen since it was stored
+# are fetched and merged into it
+result = dnsdb.search(name="fsi.io")
+print(result.refresh)
+
+STREAMING EXAMPLE:::
+
+result = dnsdb.iter_search(name="fsi.io", sort=False)
+for record in result:
+    print(record)
+
+BULK EXAMPLE:::
+
+queries = [{"name": "fsi.io"}, {"ip": "104.244.14.108"}]
+for query, result in dnsdb.search_many(queries, max_workers=8):
+    print(query, result.status_code)
+
+POOLED CONNECTIONS EXAMPLE:::
+
+with Dnsdb(api_key, pool_maxsize=20) as dnsdb:
+    result = dnsdb.search(name="fsi.io")
+    result = dnsdb.search(ip="104.244.14.108")
+
 print(result.records)
 print(result.status_code)
 print(result.error)
@@ -51,9 +78,40 @@ print(result.cached)
 
 import json
 import gzip
-import requests
-from diskcache import Cache
+import threading
+import time
+from functools import partial
+from itertools import islice
+from dnsdb import ndjson
 from dnsdb import utils
+from dnsdb.cache import DEFAULT_CODEC, ResultCache, _filters
+from dnsdb.flight import SingleFlight
+from dnsdb.ratelimit import RETRY_STATUS, RateLimiter
+from dnsdb.records import RecordSet
+
+
+SEARCH_DEFAULTS = dict(
+    name=None,
+    ip=None,
+    hexadecimal=None,
+    type="ANY",
+    bailiwick=None,
+    wildcard_left=None,
+    wildcard_right=None,
+    inverse=False,
+    sort=True,
+    return_limit=10000,
+    remote_limit=50000,
+    epoch=False,
+    time_first_before=None,
+    time_first_after=None,
+    time_last_before=None,
+    time_last_after=None,
+)
+
+# seconds before the previous fetch an incremental refresh starts from,
+# covering records that reach DNSDB late
+REFRESH_OVERLAP = 300
 
 
 class Dnsdb:
@@ -68,6 +126,24 @@ class Dnsdb:
         cache=False,
         cache_location="/tmp/dnsdb-cache",
         cache_timeout=900,
+        pool_connections=10,
+        pool_maxsize=10,
+        pool_block=False,
+        keep_alive=True,
+        max_concurrency=None,
+        memory_cache_entries=0,
+        memory_cache_bytes=64 * 1024 * 1024,
+        coalesce=True,
+        rate_limit=False,
+        json_decoder="json",
+        compact=False,
+        cache_refresh=False,
+        cache_refresh_window=86400,
+        cache_write_queue=0,
+        cache_codec=DEFAULT_CODEC,
+        cache_size_limit=None,
+        cache_eviction_policy=None,
+        results_max=None,
     ):
         """
         :param api_key: string (required)
@@ -75,9 +151,67 @@ class Dnsdb:
         :param cache: boolean (optional)
             enable caching of dnsdb results to disk
         :param cache_location: string (optional: default='/tmp/dnsdb-cache')
-            directory to store cached results
+            directory to store cached results, or a cache shared between
+            clients: sqlite:///path of a SQLite database or
+            redis://host:port/db of a Redis server (see dnsdb.backends)
         :param cache_timeout: integer (optional: default=900)
             seconds until the cached result expires
+        :param cache_refresh: boolean (optional: default=False)
+            refresh an expired cached result incrementally: only records
+            seen since it was stored are fetched (time_last_after) and
+            merged into it, see Result.refresh
+        :param cache_refresh_window: integer (optional: default=86400)
+            seconds an expired result is kept for cache_refresh
+        :param cache_write_queue: integer (optional: default=0)
+            encode and write cached results in a background thread instead
+            of before search returns, queuing up to this many; results are
+            not cached while the queue is full. close writes the queue.
+            0 writes synchronously
+        :param cache_codec: string (optional: default="records+zlib:1")
+            codec cached records are stored with, e.g. json+gzip:6 or
+            records+zstd:3 (see dnsdb.codecs)
+        :param cache_size_limit: integer (optional: default=None)
+            maximum size of the cache in bytes, kept by evicting results;
+            None keeps the setting of the cache (1 GiB when new)
+        :param cache_eviction_policy: string (optional: default=None)
+            least-recently-stored, least-recently-used,
+            least-frequently-used or none; None keeps the setting of the
+            cache (least-recently-stored when new)
+        :param results_max: integer (optional: default=None)
+            maximum number of results DNSDB returns for the API key, learned
+            from quota when None. A cached result is only used to answer
+            narrower queries when it is known not to have been cut short by
+            its limit or by results_max.
+        :param pool_connections: integer (optional: default=10)
+            number of per-host connection pools to keep
+        :param pool_maxsize: integer (optional: default=10)
+            maximum number of connections kept open per host
+        :param pool_block: boolean (optional: default=False)
+            block when no free connection is available instead of opening
+            a new, non-pooled connection
+        :param keep_alive: boolean (optional: default=True)
+            reuse connections between queries
+        :param max_concurrency: integer (optional: default=None)
+            maximum number of requests in flight at once across all threads
+            using this object for search, search_many and quota
+        :param memory_cache_entries: integer (optional: default=0)
+            number of decoded results kept in an in-process LRU in front of
+            the disk cache; 0 disables the memory tier
+        :param memory_cache_bytes: integer (optional: default=64 MiB)
+            maximum size of the results kept in memory
+        :param coalesce: boolean (optional: default=True)
+            share one request (and one cache write) between threads making
+            an identical query at the same time
+        :param rate_limit: boolean or RateLimiter (optional: default=False)
+            pace requests from the quota reported by DNSDB and retry 429
+            and 503 responses with jittered backoff; True uses a RateLimiter
+            with default settings
+        :param json_decoder: string (optional: default="json")
+            decoder of response records: json, orjson, simdjson or auto
+            (the fastest installed)
+        :param compact: boolean (optional: default=False)
+            return the records of search and search_many in a columnar
+            RecordSet (see dnsdb.records) rather than a list of dictionaries
         :return: object
 
         EXAMPLE USAGE:::
@@ -90,10 +224,102 @@ class Dnsdb:
         self.cache = cache
         self.cache_location = cache_location
         self.cache_timeout = cache_timeout
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.keep_alive = keep_alive
+        self.max_concurrency = max_concurrency
+        self.memory_cache_entries = memory_cache_entries
+        self.memory_cache_bytes = memory_cache_bytes
+        self.coalesce = coalesce
+        self.limiter = _limiter(rate_limit)
+        self.json_decoder = json_decoder
+        self.compact = compact
+        self.cache_refresh = cache_refresh
+        self.cache_refresh_window = cache_refresh_window
+        self.cache_write_queue = cache_write_queue
+        self.cache_codec = cache_codec
+        self.cache_size_limit = cache_size_limit
+        self.cache_eviction_policy = cache_eviction_policy
+        self.results_max = results_max
+
+        # fail early on an unknown or missing decoder
+        ndjson.get_decoder(json_decoder)
+
+        self._flight = SingleFlight()
+        self._cache = ResultCache(
+            cache_location,
+            timeout=cache_timeout,
+            memory_entries=memory_cache_entries,
+            memory_bytes=memory_cache_bytes,
+            stale_timeout=cache_refresh_window if cache_refresh else 0,
+            write_queue=cache_write_queue,
+            codec=cache_codec,
+            size_limit=cache_size_limit,
+            eviction_policy=cache_eviction_policy,
+        )
+        self._session = None
+        self._session_lock = threading.Lock()
+
+        if max_concurrency:
+            self._slots = threading.BoundedSemaphore(max_concurrency)
+        else:
+            self._slots = _Unlimited()
 
         if api_key is None:
             raise Exception("You must supply a DNSDB API key.")
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def session(self):
+        """
+        The pooled HTTP session shared by every query of this object. The
+        session is created on first use; connections are reused between
+        queries and are safe to share across threads.
+
+        :return: requests.Session
+        """
+
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = _build_session(
+                        pool_connections=self.pool_connections,
+                        pool_maxsize=self.pool_maxsize,
+                        pool_block=self.pool_block,
+                        keep_alive=self.keep_alive,
+                    )
+        return self._session
+
+    def close(self):
+        """
+        Close all pooled connections and the cache, once the queued cache
+        writes (see cache_write_queue) are written
+
+        :return: None
+        """
+
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+        self._cache.close()
+
+    def cache_stats(self):
+        """
+        Return the hit and miss counters of each cache tier
+
+        :return: dictionary
+        """
+
+        return self._cache.stats()
+
     def search(
         self,
         name=None,
@@ -145,59 +371,311 @@ class Dnsdb:
         :return: Object
         """
 
-        options = dict()
+        options = _options(
+            self,
+            name=name,
+            ip=ip,
+            hexadecimal=hexadecimal,
+            type=type,
+            bailiwick=bailiwick,
+            wildcard_left=wildcard_left,
+            wildcard_right=wildcard_right,
+            inverse=inverse,
+            sort=sort,
+            return_limit=return_limit,
+            remote_limit=remote_limit,
+            epoch=epoch,
+            time_first_before=time_first_before,
+            time_first_after=time_first_after,
+            time_last_before=time_last_before,
+            time_last_after=time_last_after,
+        )
 
-        options["name"] = name
-        options["ip"] = ip
-        options["hex"] = hexadecimal
-        options["type"] = type
-        options["bailiwick"] = bailiwick
-        options["wildcard_left"] = wildcard_left
-        options["wildcard_right"] = wildcard_right
-        options["inverse"] = inverse
-        options["sort"] = sort
-        options["return_limit"] = return_limit
-        options["remote_limit"] = remote_limit
-        options["epoch"] = epoch
-        options["time_first_before"] = time_first_before
-        options["time_first_after"] = time_first_after
-        options["time_last_before"] = time_last_before
-        options["time_last_after"] = time_last_after
-        options["api_key"] = self.api_key
-        options["server"] = self.server
-        options["cache"] = self.cache
-        options["cache_location"] = self.cache_location
-        options["cache_timeout"] = self.cache_timeout
+        uri = utils.build_uri(options)
+
+        results = self._cached(options, uri)
+
+        if results is None:
+            results = self._fetch(options, uri)
+
+        return _finish(options, results)
 
-        options = utils.pre_process(options)
+    def search_many(self, queries, max_workers=None):
+        """
+        Run many searches concurrently over the pooled session.
+
+        Each query is a dictionary of search arguments. Queries are read
+        max_workers at a time and looked up in the cache with one bulk
+        read; cached results are answered before a worker is taken and the
+        rest are run by a pool of max_workers threads. (query, Result)
+        pairs are yielded in completion order. A query that fails is
+        yielded with a Result whose error describes the failure and does
+        not affect the other queries.
+
+        USAGE:::
+
+        queries = [{"name": "fsi.io"}, {"ip": "104.244.14.108", "sort": False}]
+        for query, result in dnsdb.search_many(queries, max_workers=8):
+            print(query, result.status_code)
+
+        :param queries: iterable (of dictionaries)
+        :param max_workers: integer (optional: default=pool_maxsize)
+        :return: generator (of tuples)
+        """
+
+        from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+        if max_workers is None:
+            max_workers = self.pool_maxsize
+
+        pending = dict()
+        # relative time filters of every query resolve against the same now,
+        # so identical queries share cache keys across the batch
+        now = int(time.time())
+
+        def completed(return_when):
+            done, _ = wait(pending, return_when=return_when)
+            for future in done:
+                query = pending.pop(future)
+                try:
+                    yield query, future.result()
+                except Exception as exc:  # pylint: disable=broad-except
+                    yield query, _error_result(exc)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            try:
+                for chunk in _chunks(queries, max_workers):
+                    searches = []
+                    for query in chunk:
+                        try:
+                            options = _options(self, now=now, **_search_params(query))
+                            uri = utils.build_uri(options)
+                        except Exception as exc:  # pylint: disable=broad-except
+                            yield query, _error_result(exc)
+                            continue
+                        searches.append((query, options, uri))
+
+                    try:
+                        cached = self._cached_many(searches)
+                    except Exception as exc:  # pylint: disable=broad-except
+                        for query, _, _ in searches:
+                            yield query, _error_result(exc)
+                        continue
+
+                    for (query, options, uri), results in zip(searches, cached):
+                        if results is not None:
+                            yield query, _finish(options, results)
+                            continue
+
+                        future = executor.submit(self._fetch_finish, options, uri)
+                        pending[future] = query
+
+                        # bound the backlog instead of queuing every query at once
+                        if len(pending) >= max_workers * 2:
+                            yield from completed(FIRST_COMPLETED)
+
+                while pending:
+                    yield from completed(FIRST_COMPLETED)
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def _cached(self, options, uri):
+        """
+        Look up a search in the cache
+
+        :param options: dictionary
+        :param uri: string
+        :return: object (None when caching is disabled or on a miss)
+        """
+
+        if options["cache"] is not True:
+            return None
+
+        return _cache_get(self._cache, uri, options, lazy=True)
+
+    def _cached_many(self, searches):
+        """
+        Look up many searches in the cache with one bulk read
+
+        :param searches: list (of tuples (query, dictionary options, string
+            uri))
+        :return: list (of objects, None when caching is disabled or on a
+            miss)
+        """
+
+        cached = [options["cache"] is True for _, options, _ in searches]
+        if not any(cached):
+            return [None] * len(searches)
+
+        items = [
+            (uri, options)
+            for (_, options, uri), enabled in zip(searches, cached)
+            if enabled
+        ]
+        found = iter(self._cache.get_many(items, lazy=True))
+
+        return [
+            _cache_result(next(found)) if enabled else None for enabled in cached
+        ]
+
+    def _fetch(self, options, uri):
+        """
+        Query the DNSDB API and cache the result when caching is enabled.
+        Identical queries in flight at the same time share one request.
+
+        :param options: dictionary
+        :param uri: string
+        :return: object
+        """
+
+        if not self.coalesce:
+            return self._fetch_once(options, uri)
+
+        # a search reading part of a response shares only with its peers
+        key = (uri, _read_limit(options))
+        results = self._flight.do(key, partial(self._fetch_once, options, uri))
+        return _copy(results)
+
+    def _fetch_once(self, options, uri):
+        """
+        Query the DNSDB API and cache the result, see _fetch. An expired
+        result kept for cache_refresh is refreshed rather than fetched again.
+
+        :param options: dictionary
+        :param uri: string
+        :return: object
+        """
+
+        refresh = None
+        if self.cache_refresh and options["cache"] is True:
+            refresh = _refresh_query(self._cache, uri, options)
+
+        query_uri = uri if refresh is None else refresh[0]
+
+        attempt = 0
+        while True:
+            with self._slots:
+                results = _limited_query(
+                    self.limiter, options, query_uri, session=self.session
+                )
+
+            # the limiter pauses the next attempt for the backoff delay
+            if not _retry(self.limiter, results, attempt):
+                break
+            attempt += 1
+
+        if refresh is not None:
+            results = _refreshed(refresh, results)
+
+        if options["cache"] is True:
+            if results.status_code == 200 or results.status_code == 404:
+                _cache_set(self._cache, uri, results, options)
+
+        return results
+
+    def _fetch_finish(self, options, uri):
+        """
+        Fetch and post process a search, see _fetch
+
+        :param options: dictionary
+        :param uri: string
+        :return: object
+        """
+
+        return _finish(options, self._fetch(options, uri))
+
+    def iter_search(
+        self,
+        name=None,
+        ip=None,
+        hexadecimal=None,
+        type="ANY",
+        bailiwick=None,
+        wildcard_left=None,
+        wildcard_right=None,
+        inverse=False,
+        sort=True,
+        return_limit=10000,
+        remote_limit=50000,
+        epoch=False,
+        time_first_before=None,
+        time_first_after=None,
+        time_last_before=None,
+        time_last_after=None,
+    ):
+        """
+        A streaming variant of search. Takes the same arguments as search and
+        returns a Result as soon as the response headers arrive; its records
+        attribute is a generator yielding normalized records as they are read
+        off the wire. The status_code, error, quota and cached attributes are
+        available immediately.
+
+        Memory use stays flat when sort=False; sorting by time_last needs the
+        whole response before the first record can be yielded.
+
+        USAGE:::
+
+        result = dnsdb.iter_search(name="fsi.io", sort=False)
+        print(result.status_code)
+        for record in result:
+            print(record)
+
+        :return: Object
+        """
+
+        options = _options(
+            self,
+            name=name,
+            ip=ip,
+            hexadecimal=hexadecimal,
+            type=type,
+            bailiwick=bailiwick,
+            wildcard_left=wildcard_left,
+            wildcard_right=wildcard_right,
+            inverse=inverse,
+            sort=sort,
+            return_limit=return_limit,
+            remote_limit=remote_limit,
+            epoch=epoch,
+            time_first_before=time_first_before,
+            time_first_after=time_first_after,
+            time_last_before=time_last_before,
+            time_last_after=time_last_after,
+        )
 
         uri = utils.build_uri(options)
 
+        cache = None
         if options["cache"] is True:
-            cache = Cache(options["cache_location"])
-
-            cached_result = cache.get(uri)
-
-            if cached_result:
-                data = json.loads(gzip.decompress(cached_result).decode("utf-8"))
-                results = Result(
-                    records=data["records"],
-                    status_code=data["status_code"],
-                    error=data["error"],
-                    quota=data["quota"],
-                    cached=True,
-                )
-            else:
-                results = _query(options, uri)
-                if results.status_code == 200 or results.status_code == 404:
-                    compressed = Result.to_compressed(results)
-                    cache.set(uri, compressed, expire=options["cache_timeout"])
+            cache = self._cache
+
+            results = _cache_get(cache, uri, options)
+
+            if results is not None:
+                if results.status_code == 200:
+                    results.records = utils.iter_post_process(
+                        options, results.records
+                    )
+                return results
+
+        if self.limiter is None:
+            resp, results = _request(options, uri, session=self.session)
         else:
-            results = _query(options, uri)
+            # the limiter paces the request; the stream is read outside it
+            with self.limiter:
+                resp, results = _request(options, uri, session=self.session)
+            self.limiter.update(results.quota)
 
         if results.status_code == 200:
-            results = utils.post_process(options, results)
-            return results
+            records = _iter_records(resp, options["json_decoder"])
+            if cache is not None:
+                records = _cache_on_exhaust(
+                    cache, uri, results, records, options
+                )
+            results.records = utils.iter_post_process(options, records)
+        elif results.status_code == 404 and cache is not None:
+            _cache_set(cache, uri, results, options)
 
         return results
 
@@ -218,8 +696,12 @@ class Dnsdb:
 
         uri = "".join(uri_parts)
 
-        results = _query(options, uri, quota=True)
+        with self._slots:
+            results = _limited_query(
+                self.limiter, options, uri, quota=True, session=self.session
+            )
 
+        _learn_results_max(self, results)
         return results
 
 
@@ -229,10 +711,16 @@ class Result:
     """
 
     def __init__(
-        self, records=None, status_code=None, error=None, quota=None, cached=None
+        self,
+        records=None,
+        status_code=None,
+        error=None,
+        quota=None,
+        cached=None,
+        refresh=None,
     ):
         """
-        :param records: list of dictionaries
+        :param records: list of dictionaries or RecordSet
         :param status_code: integer
             DNSDB status code
         :param error: dictionary
@@ -240,12 +728,101 @@ class Result:
         :param quota: dictionary
             DNSDB quota information
         :param cached: boolean
+        :param refresh: dictionary
+            for an incrementally refreshed result (see Dnsdb cache_refresh):
+            since (the time_last_after of the refresh), fetched (records
+            downloaded), added and updated (RRsets), records (after the
+            merge), records_saved (records not downloaded again), bytes
+            (downloaded) and bytes_saved (estimated against downloading
+            the whole result again). The quota is that of the refresh.
         """
         self.status_code = status_code
         self.records = records
         self.error = error
         self.quota = quota
         self.cached = cached
+        self.refresh = refresh
+
+    @property
+    def records(self):
+        """
+        The records of the result. Records of a deferred result (see defer)
+        are loaded on first access.
+
+        :return: list of dictionaries, RecordSet, iterator or None
+        """
+        if self._load is not None:
+            load = self._load
+            self._records = load()
+            self._load = None
+        return self._records
+
+    @records.setter
+    def records(self, records):
+        self._records = records
+        self._load = None
+        self._count = None
+
+    @property
+    def count(self):
+        """
+        The number of records, known without loading the records of a
+        deferred result
+
+        :return: integer (None for a stream of records)
+        """
+        if self._load is not None:
+            return self._count
+        if self._records is None:
+            return 0
+        if hasattr(self._records, "__len__"):
+            return len(self._records)
+        return None
+
+    @property
+    def deferred(self):
+        """
+        Whether the records are still to be loaded
+
+        :return: boolean
+        """
+        return self._load is not None
+
+    def defer(self, load, count=None):
+        """
+        Defer loading the records until they are first accessed
+
+        :param load: function without arguments returning the records
+        :param count: integer (optional)
+            the number of records load will return
+        :return: None
+        """
+        self._records = None
+        self._load = load
+        self._count = count
+
+    def __iter__(self):
+        """
+        Iterate over the records of the result
+
+        :return: iterator
+        """
+        if self.records is None:
+            return iter(())
+        return iter(self.records)
+
+    def __aiter__(self):
+        """
+        Asynchronously iterate over the records of the result, as returned
+        by AsyncDnsdb.iter_search
+
+        :return: asynchronous iterator
+        """
+        if self.records is None:
+            return _aiter(())
+        if hasattr(self.records, "__aiter__"):
+            return self.records.__aiter__()
+        return _aiter(self.records)
 
     def to_dict(self):
         """
@@ -253,9 +830,13 @@ class Result:
 
         :return: dictionary
         """
+        records = self.records
+        if isinstance(records, RecordSet):
+            records = records.to_dict()
+
         data = dict(
             status_code=self.status_code,
-            records=self.records,
+            records=records,
             error=self.error,
             quota=self.quota,
             cached=self.cached,
@@ -282,40 +863,512 @@ class Result:
         return compressed
 
 
-def _query(options, uri, quota=False):
+async def _aiter(records):
+    """
+    An internal async generator over an iterable of records
+
+    :param records: iterable
+    :return: async generator
+    """
+
+    for record in records:
+        yield record
+
+
+class _Unlimited:
+    """
+    A stand-in for a semaphore when concurrency is not limited
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+def _options(client, now=None, **params):
+    """
+    An internal function to build the pre-processed options dictionary for a
+    search
+
+    :param client: object (Dnsdb or AsyncDnsdb)
+    :param now: integer (optional)
+        epoch relative time filters are resolved against
+    :param params: search parameters (see Dnsdb.search)
+    :return: dictionary
+    """
+
+    options = dict()
+
+    options["name"] = params["name"]
+    options["ip"] = params["ip"]
+    options["hex"] = params["hexadecimal"]
+    options["type"] = params["type"]
+    options["bailiwick"] = params["bailiwick"]
+    options["wildcard_left"] = params["wildcard_left"]
+    options["wildcard_right"] = params["wildcard_right"]
+    options["inverse"] = params["inverse"]
+    options["sort"] = params["sort"]
+    options["return_limit"] = params["return_limit"]
+    options["remote_limit"] = params["remote_limit"]
+    options["epoch"] = params["epoch"]
+    options["time_first_before"] = params["time_first_before"]
+    options["time_first_after"] = params["time_first_after"]
+    options["time_last_before"] = params["time_last_before"]
+    options["time_last_after"] = params["time_last_after"]
+    options["api_key"] = client.api_key
+    options["server"] = client.server
+    options["cache"] = client.cache
+    options["cache_location"] = client.cache_location
+    options["cache_timeout"] = client.cache_timeout
+    options["json_decoder"] = client.json_decoder
+    options["compact"] = client.compact
+    options["results_max"] = client.results_max
+
+    return utils.pre_process(options, now=now)
+
+
+def _learn_results_max(client, results):
+    """
+    An internal function to keep the results_max of a quota response on
+    the client, see Dnsdb
+
+    :param client: object (Dnsdb or AsyncDnsdb)
+    :param results: object
+    :return: None
+    """
+
+    quota = results.quota if isinstance(results.quota, dict) else dict()
+    if quota.get("results_max") is not None:
+        client.results_max = int(quota["results_max"])
+
+
+def _search_params(query):
+    """
+    An internal function to merge a search_many query, or the arguments
+    of an asynchronous search, with the search defaults
+
+    :param query: dictionary
+    :return: dictionary
+    """
+
+    unknown = set(query) - set(SEARCH_DEFAULTS)
+    if unknown:
+        raise TypeError(
+            "unexpected search argument(s): {}".format(", ".join(sorted(unknown)))
+        )
+
+    params = dict(SEARCH_DEFAULTS)
+    params.update(query)
+    return params
+
+
+def _finish(options, results):
+    """
+    An internal function to post process a successful result; the records
+    of a deferred result are post processed when they are loaded
+
+    :param options: dictionary
+    :param results: object
+    :return: object
+    """
+
+    if results.status_code != 200:
+        return results
+
+    if results.deferred:
+        count = results.count
+        if count is not None and options["return_limit"] is not None:
+            count = min(count, options["return_limit"])
+        results.defer(partial(_post_processed, options, results._load), count=count)
+        return results
+
+    return utils.post_process(options, results)
+
+
+def _post_processed(options, load):
+    """
+    An internal function to load and post process the records of a deferred
+    result
+
+    :param options: dictionary
+    :param load: function
+    :return: list (of dictionaries) or RecordSet
+    """
+
+    return utils.post_process(options, Result(records=load())).records
+
+
+def _copy(results):
+    """
+    An internal function to copy a result shared between callers, so each
+    can post process its own copy
+
+    :param results: object
+    :return: object
+    """
+
+    return Result(
+        records=results.records,
+        status_code=results.status_code,
+        error=results.error,
+        quota=results.quota,
+        cached=results.cached,
+        refresh=results.refresh,
+    )
+
+
+def _chunks(items, size):
+    """
+    An internal function to split an iterable into lists of up to size items
+
+    :param items: iterable
+    :param size: integer
+    :return: generator (of lists)
+    """
+
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _error_result(exc):
+    """
+    An internal function to describe a failed query as a Result
+
+    :param exc: Exception
+    :return: object
+    """
+
+    error = {"code": None, "message": "{}: {}".format(type(exc).__name__, exc)}
+    return Result(error=error, cached=False)
+
+
+def _limiter(rate_limit):
+    """
+    An internal function to build the rate limiter of a client
+
+    :param rate_limit: boolean or RateLimiter
+    :return: RateLimiter (None when rate limiting is disabled)
+    """
+
+    if isinstance(rate_limit, RateLimiter):
+        return rate_limit
+    if rate_limit:
+        return RateLimiter()
+    return None
+
+
+def _retry(limiter, results, attempt):
+    """
+    An internal function deciding whether to retry a throttled query; the
+    limiter is paused for the backoff delay when it is retried
+
+    :param limiter: RateLimiter (or None)
+    :param results: object
+    :param attempt: integer
+    :return: boolean
+    """
+
+    if limiter is None or results.status_code not in RETRY_STATUS:
+        return False
+    if attempt >= limiter.max_retries:
+        return False
+
+    limiter.retry_delay(attempt)
+    return True
+
+
+def _limited_query(limiter, options, uri, quota=False, session=None):
+    """
+    An internal function to send a query through the rate limiter and tune
+    it from the quota of the response, see _query
+
+    :param limiter: RateLimiter (or None)
+    :return: object
+    """
+
+    if limiter is None:
+        return _query(options, uri, quota=quota, session=session)
+
+    with limiter:
+        results = _query(options, uri, quota=quota, session=session)
+
+    limiter.update(results.quota)
+    return results
+
+
+def _build_session(pool_connections, pool_maxsize, pool_block, keep_alive):
+    """
+    An internal function to build a pooled HTTP session
+
+    :param pool_connections: integer
+    :param pool_maxsize: integer
+    :param pool_block: boolean
+    :param keep_alive: boolean
+    :return: requests.Session
+    """
+
+    # the HTTP stack is imported on first use: cache hits never need it
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        pool_block=pool_block,
+    )
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    if not keep_alive:
+        session.headers["Connection"] = "close"
+
+    return session
+
+
+def _cache_get(cache, uri, options, lazy=False):
+    """
+    An internal function to load a cached result
+
+    :param cache: ResultCache
+    :param uri: string
+    :param options: dictionary
+    :param lazy: boolean (default: False)
+        defer decoding the records of the result until they are accessed
+    :return: object (None when not cached)
+    """
+
+    return _cache_result(cache.get(uri, options, lazy=lazy))
+
+
+def _cache_result(data):
+    """
+    An internal function to build a Result from cached data
+
+    :param data: dictionary (or None on a miss)
+    :return: object (None on a miss)
+    """
+
+    if not data:
+        return None
+
+    results = Result(
+        records=data["records"],
+        status_code=data["status_code"],
+        error=data["error"],
+        quota=data["quota"],
+        cached=True,
+    )
+
+    if data.get("load") is not None:
+        results.defer(data["load"], count=data["count"])
+
+    return results
+
+
+def _cache_set(cache, uri, results, options):
+    """
+    An internal function to store a result in the cache
+
+    :param cache: ResultCache
+    :param uri: string
+    :param results: object
+    :param options: dictionary
+    :return: None
+    """
+
+    cache.set(uri, Result.to_dict(results), options)
+
+
+def _refresh_query(cache, uri, options):
+    """
+    An internal function to build the query refreshing an expired result
+    kept in the cache: the query of the result, restricted to records seen
+    since shortly before it was stored.
+
+    :param cache: ResultCache
+    :param uri: string
+    :param options: dictionary
+    :return: tuple (string uri, integer since, dictionary data, dictionary
+        metadata) (None when there is no result to refresh)
+    """
+
+    filters = _filters(options)
+    if filters is None:
+        return None
+
+    stale = cache.get_stale(uri)
+    if stale is None:
+        return None
+
+    data, meta = stale
+    if data["status_code"] not in (200, 404) or not meta.get("stored"):
+        return None
+
+    since = int(meta["stored"]) - REFRESH_OVERLAP
+    if filters["time_last_after"] is not None:
+        since = max(since, filters["time_last_after"])
+
+    # from the URI rather than the options, which may not describe the
+    # lookup (see gateway._options)
+    delta = utils.replace_parameter(uri, "time_last_after", since)
+    return delta, since, data, meta
+
+
+def _refreshed(refresh, results):
+    """
+    An internal function merging the response of a refresh query into the
+    expired result it refreshes, see _refresh_query. Failed refreshes are
+    returned as they are.
+
+    :param refresh: tuple
+    :param results: object
+    :return: object
+    """
+
+    if results.status_code != 200 and results.status_code != 404:
+        return results
+
+    _, since, data, meta = refresh
+    delta = results.records if results.status_code == 200 else []
+    records, added, updated = utils.merge_records(data["records"] or [], delta)
+    fetched = len(json.dumps(delta).encode("utf-8")) if delta else 0
+
+    merged = Result(
+        status_code=results.status_code,
+        error=results.error,
+        quota=results.quota,
+        cached=False,
+        refresh=dict(
+            since=since,
+            fetched=len(delta),
+            added=added,
+            updated=updated,
+            records=len(records),
+            records_saved=len(records) - len(delta),
+            bytes=fetched,
+            bytes_saved=max(meta.get("bytes", 0) - fetched, 0),
+        ),
+    )
+
+    if records:
+        merged.status_code = 200
+        merged.error = None
+        merged.records = records
+
+    return merged
+
+
+def _cache_on_exhaust(cache, uri, results, records, options):
+    """
+    An internal generator passing records through and caching the complete
+    result once the stream has been read to the end. Streams abandoned part
+    way through are not cached.
+
+    :param cache: ResultCache
+    :param uri: string
+    :param results: object
+    :param records: iterator
+    :param options: dictionary
+    :return: generator
+    """
+
+    seen = []
+    for record in records:
+        seen.append(record)
+        yield record
+
+    stored = Result(
+        records=seen,
+        status_code=results.status_code,
+        error=results.error,
+        quota=results.quota,
+        cached=False,
+    )
+    _cache_set(cache, uri, stored, options)
+
+
+def _query(options, uri, quota=False, session=None):
     """
     An internal HTTP function to query DNSDB API
 
     :param uri: string
     :param quota: boolean (default: False)
+    :param session: requests.Session (default: None)
+        pooled session to send the request with
     :return: object
     """
 
+    resp, results = _request(options, uri, session=session)
+
+    if results.status_code == 200:
+        if quota is True:
+            response = resp.json()
+            results.quota = utils.get_quota(rate_limit=response["rate"])
+            return results
+
+        # closing the response before the end abandons the rest of the body
+        try:
+            chunks = resp.iter_content(chunk_size=ndjson.READ_SIZE)
+            results.records = ndjson.read_ndjson(
+                chunks, options.get("json_decoder"), limit=_read_limit(options)
+            )
+        finally:
+            resp.close()
+
+    return results
+
+
+def _read_limit(options):
+    """
+    An internal function returning how many records of a response a search
+    needs: without sorting only the first return_limit records are returned,
+    unless the full response is to be cached.
+
+    :param options: dictionary
+    :return: integer (None to read the whole response)
+    """
+
+    if options.get("sort", True) or options.get("cache") is True:
+        return None
+    return options.get("return_limit") or None
+
+
+def _request(options, uri, session=None):
+    """
+    An internal HTTP function to send a query to the DNSDB API; the body of a
+    successful response is left unread on the returned response.
+
+    :param options: dictionary
+    :param uri: string
+    :param session: requests.Session (default: None)
+    :return: tuple (requests.Response, object)
+    """
+
     results = Result()
     error = dict()
     error.update({"code": None, "message": None})
 
     headers = {"Accept": "application/json", "X-API-Key": options["api_key"]}
 
-    resp = requests.get(uri, headers=headers, stream=True)
+    if session is None:
+        import requests
+
+        session = requests
+
+    resp = session.get(uri, headers=headers, stream=True)
     results.status_code = resp.status_code
     results.quota = utils.get_quota(response_headers=resp.headers)
     results.cached = False
 
-    if resp.status_code == 200:
-        records = []
-
-        if quota is True:
-            response = resp.json()
-            results.quota = utils.get_quota(rate_limit=response["rate"])
-            return results
-
-        for line in resp.iter_lines():
-            if line:
-                decoded_line = line.decode("utf-8")
-                records.append(json.loads(decoded_line))
-        results.records = records
-    else:
+    if resp.status_code != 200:
         error["code"] = resp.status_code
 
         if resp.content:
@@ -325,4 +1378,22 @@ def _query(options, uri, quota=False):
 
         results.error = error
 
-    return results
+    return resp, results
+
+
+def _iter_records(resp, decoder=None):
+    """
+    An internal generator yielding decoded records from a streamed response.
+    The response is closed once the stream is exhausted or abandoned.
+
+    :param resp: requests.Response
+    :param decoder: string (default: None)
+        JSON decoder, see ndjson.get_decoder
+    :return: generator
+    """
+
+    try:
+        chunks = resp.iter_content(chunk_size=ndjson.READ_SIZE)
+        yield from ndjson.iter_ndjson(chunks, decoder)
+    finally:
+        resp.close()
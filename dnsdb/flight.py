@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Request coalescing for DNSDB queries
+
+SingleFlight (threads) and AsyncSingleFlight (asyncio) run one call per key
+at a time: callers arriving while a call for the same key is in flight wait
+for it and share its return value (or exception) instead of running their
+own.
+"""
+
+import threading
+
+
+class SingleFlight:
+    """
+    Coalesce identical calls made concurrently from several threads
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+
+        self._calls = dict()
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        """
+        Run func, or wait for the call already in flight for key
+
+        :param key: hashable
+        :param func: function without arguments
+        :return: the return value of func
+        """
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.calls += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = func()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+        return call.value
+
+    def stats(self):
+        """
+        Return the number of calls run and shared
+
+        :return: dictionary
+        """
+
+        return {"calls": self.calls, "shared": self.shared}
+
+
+class AsyncSingleFlight:
+    """
+    Coalesce identical calls made concurrently from several tasks of one
+    event loop
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+
+        self._calls = dict()
+
+    async def do(self, key, func):
+        """
+        Await func(), or the call already in flight for key
+
+        :param key: hashable
+        :param func: coroutine function without arguments
+        :return: the return value of func
+        """
+
+        import asyncio
+
+        future = self._calls.get(key)
+
+        if future is not None:
+            self.shared += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.get_event_loop().create_future()
+        self._calls[key] = future
+        self.calls += 1
+
+        try:
+            value = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            # mark the exception retrieved when nobody is waiting for it
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+        finally:
+            del self._calls[key]
+
+        return value
+
+    def stats(self):
+        """
+        Return the number of calls run and shared
+
+        :return: dictionary
+        """
+
+        return {"calls": self.calls, "shared": self.shared}
+
+
+class _Call:
+    """
+    A call in flight
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+A local caching gateway to the DNSDB API
+
+Gateway is a long-lived HTTP server exposing the DNSDB lookup paths
+(/lookup/rrset/..., /lookup/rdata/... and /lookup/rate_limit) on a local
+address. It answers every lookup through one Dnsdb client, which owns the
+connection pool, the memory and disk cache tiers, request coalescing and
+the rate limiter, so all the tools on a host share one warm process.
+Records are served as NDJSON like the API, with the quota last reported by
+DNSDB in the X-RateLimit-* headers and X-Cache telling hits from misses.
+
+Clients point their server at the gateway; the gateway uses its own API
+key, so it should only listen on addresses reachable by trusted users.
+
+EXAMPLE:::
+
+$ dnsdb serve --port 8053
+
+from dnsdb import Dnsdb
+
+dnsdb = Dnsdb("unused", server="http://127.0.0.1:8053")
+result = dnsdb.search(name="fsi.io")
+"""
+
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+from dnsdb import utils
+from dnsdb.dnsdb import _error_result
+
+logger = logging.getLogger(__name__)
+
+LOOKUP_PREFIXES = ("/lookup/rrset/", "/lookup/rdata/")
+QUOTA_PATH = "/lookup/rate_limit"
+
+
+class Gateway(ThreadingHTTPServer):
+    """
+    A threaded HTTP server answering DNSDB lookups through a Dnsdb client
+    """
+
+    daemon_threads = True
+
+    def __init__(self, client, address=("127.0.0.1", 8053)):
+        """
+        :param client: Dnsdb
+            client the lookups are answered with; enable its cache to
+            share results between the users of the gateway
+        :param address: tuple (host, port) (default: ("127.0.0.1", 8053))
+        """
+
+        self.client = client
+        self.quota = None
+        self.requests = 0
+        self.hits = 0
+        self._lock = threading.Lock()
+
+        super().__init__(address, GatewayHandler)
+
+    @property
+    def url(self):
+        """
+        The URL clients use as their server
+
+        :return: string
+        """
+
+        host, port = self.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def lookup(self, path, query):
+        """
+        Answer a lookup from the cache or DNSDB
+
+        :param path: string
+            the lookup path, e.g. /lookup/rrset/name/fsi.io/ANY
+        :param query: string
+            the query string, e.g. limit=50000&time_last_after=1514764800
+        :return: object
+        """
+
+        client = self.client
+        options = _options(client, query)
+        uri = client.server + path
+        if query:
+            uri += "?" + query
+
+        try:
+            results = client._cached(options, uri)
+            if results is None:
+                results = client._fetch(options, uri)
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.exception("lookup failed: %s", uri)
+            return _error_result(exc)
+
+        self._count(results)
+        return results
+
+    def rate_limit(self):
+        """
+        Query DNSDB for the current quota
+
+        :return: object
+        """
+
+        try:
+            results = self.client.quota()
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.exception("quota query failed")
+            return _error_result(exc)
+
+        self._count(results)
+        return results
+
+    def stats(self):
+        """
+        Return the request counters of the gateway and its client cache
+
+        :return: dictionary
+        """
+
+        with self._lock:
+            stats = {"requests": self.requests, "hits": self.hits}
+        stats["cache"] = self.client.cache_stats()
+        return stats
+
+    def _count(self, results):
+        with self._lock:
+            self.requests += 1
+            if results.cached:
+                self.hits += 1
+            elif results.quota and results.quota.get("remaining") is not None:
+                self.quota = results.quota
+
+
+class GatewayHandler(BaseHTTPRequestHandler):
+    """
+    Serve DNSDB lookups from the Gateway
+    """
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        path, _, query = self.path.partition("?")
+
+        if path == QUOTA_PATH:
+            results = self.server.rate_limit()
+            if results.status_code == 200:
+                body = json.dumps({"rate": results.quota}).encode("utf-8")
+                self._send(200, body, "application/json", results)
+                return
+        elif path.startswith(LOOKUP_PREFIXES):
+            results = self.server.lookup(path, query)
+            if results.status_code == 200:
+                lines = [json.dumps(record) for record in results.records]
+                body = ("\n".join(lines) + "\n").encode("utf-8")
+                self._send(200, body, "application/x-ndjson", results)
+                return
+        else:
+            self._send(404, b"Error: unknown path.\n", "text/plain")
+            return
+
+        status_code = results.status_code or 502
+        message = (results.error or {}).get("message") or "Unavailable"
+        self._send(status_code, (message + "\n").encode("utf-8"), "text/plain", results)
+
+    def _send(self, status_code, body, content_type, results=None):
+        self.send_response(status_code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+
+        if results is not None:
+            self.send_header("X-Cache", "HIT" if results.cached else "MISS")
+
+            quota = self.server.quota if results.cached else results.quota
+            for key in ("limit", "remaining", "reset", "expires"):
+                if quota and quota.get(key) is not None:
+                    header = "X-RateLimit-{}".format(key.capitalize())
+                    self.send_header(header, str(quota[key]))
+
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        logger.info("%s %s", self.address_string(), format % args)
+
+
+def serve(client, host="127.0.0.1", port=8053):
+    """
+    Run a Gateway until interrupted
+
+    :param client: Dnsdb
+    :param host: string (default: "127.0.0.1")
+    :param port: integer (default: 8053)
+    :return: None
+    """
+
+    with Gateway(client, (host, port)) as gateway:
+        logger.warning("dnsdb gateway listening on %s", gateway.url)
+        try:
+            gateway.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            logger.warning("dnsdb gateway stopped: %s", gateway.stats())
+            client.close()
+
+
+def _options(client, query):
+    """
+    An internal function to build the options of a lookup from its query
+    string, as used by the cache and the fetch of the client
+
+    :param client: Dnsdb
+    :param query: string
+    :return: dictionary
+    """
+
+    params = parse_qs(query)
+
+    def param(key):
+        values = params.get(key)
+        return values[0] if values else None
+
+    limit = param("limit")
+
+    options = dict()
+    options["api_key"] = client.api_key
+    options["server"] = client.server
+    options["cache"] = client.cache
+    options["json_decoder"] = client.json_decoder
+    options["results_max"] = client.results_max
+    options["sort"] = True
+    options["remote_limit"] = int(limit) if limit and limit.isdigit() else None
+
+    for key in utils.TIME_FILTERS:
+        options[key] = param(key)
+
+    return options
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming NDJSON parsing of DNSDB responses
+
+DNSDB answers lookups with one JSON record per line. iter_ndjson reads a
+response in large chunks, splits each chunk into lines in one pass and feeds
+the bytes of each line straight to the selected JSON decoder. read_ndjson
+collects a whole response with the cyclic garbage collector paused: records
+never form reference cycles, so collections triggered by allocating millions
+of dictionaries would only rescan the growing result.
+
+Decoders:
+  * json: the standard library (default)
+  * orjson: https://pypi.org/project/orjson/ (if installed)
+  * simdjson: https://pypi.org/project/pysimdjson/ (if installed)
+  * auto: the fastest installed of orjson, simdjson and json
+"""
+
+import gc
+import json
+from itertools import islice
+
+READ_SIZE = 256 * 1024
+DECODERS = ("json", "orjson", "simdjson", "auto")
+
+_decode = json.JSONDecoder().decode
+
+
+def _json_loads(line):
+    """
+    Decode a line with the standard library; decoding UTF-8 up front skips
+    the encoding detection json.loads runs on bytes.
+
+    :param line: bytes
+    :return: dictionary
+    """
+
+    return _decode(line.decode("utf-8"))
+
+
+def get_decoder(name=None):
+    """
+    Return the loads function of a JSON decoder
+
+    :param name: string (optional: default="json")
+        json, orjson, simdjson or auto
+    :return: function
+    """
+
+    if name is None or name == "json":
+        return _json_loads
+
+    if name == "orjson":
+        import orjson
+
+        return orjson.loads
+
+    if name == "simdjson":
+        import simdjson
+
+        return simdjson.loads
+
+    if name == "auto":
+        for candidate in ("orjson", "simdjson"):
+            try:
+                return get_decoder(candidate)
+            except ImportError:
+                continue
+        return _json_loads
+
+    raise ValueError(
+        "Unknown JSON decoder {}, expected one of {}".format(name, ", ".join(DECODERS))
+    )
+
+
+def iter_ndjson(chunks, decoder=None):
+    """
+    Decode NDJSON records from an iterable of byte chunks
+
+    :param chunks: iterable (of bytes)
+    :param decoder: string or function (optional: default="json")
+        decoder name (see get_decoder) or a loads function
+    :return: generator (of dictionaries)
+    """
+
+    loads = decoder if callable(decoder) else get_decoder(decoder)
+    pending = b""
+
+    for chunk in chunks:
+        lines = chunk.split(b"\n")
+        if pending:
+            lines[0] = pending + lines[0]
+        pending = lines.pop()
+
+        for line in lines:
+            if line and line != b"\r":
+                yield loads(line)
+
+    if pending.strip():
+        yield loads(pending)
+
+
+def read_ndjson(chunks, decoder=None, limit=None):
+    """
+    Decode the NDJSON records from an iterable of byte chunks into a list,
+    see iter_ndjson
+
+    :param chunks: iterable (of bytes)
+    :param decoder: string or function (optional: default="json")
+    :param limit: integer (optional: default=None)
+        stop reading after this many records
+    :return: list (of dictionaries)
+    """
+
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return list(islice(iter_ndjson(chunks, decoder), limit))
+    finally:
+        if enabled:
+            gc.enable()
+
+
+async def aiter_ndjson(chunks, decoder=None):
+    """
+    Decode NDJSON records from an async iterable of byte chunks, see
+    iter_ndjson
+
+    :param chunks: async iterable (of bytes)
+    :param decoder: string or function (optional: default="json")
+    :return: async generator (of dictionaries)
+    """
+
+    loads = decoder if callable(decoder) else get_decoder(decoder)
+    pending = b""
+
+    async for chunk in chunks:
+        lines = chunk.split(b"\n")
+        if pending:
+            lines[0] = pending + lines[0]
+        pending = lines.pop()
+
+        for line in lines:
+            if line and line != b"\r":
+                yield loads(line)
+
+    if pending.strip():
+        yield loads(pending)
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+Client side rate limiting for the DNSDB API
+
+RateLimiter is a token bucket which tunes its rate from the quota DNSDB
+reports (the X-RateLimit-* response headers and the rate_limit endpoint),
+spreading the remaining quota evenly over the time until it resets. It
+optionally bounds the number of requests in flight and computes jittered
+exponential backoff delays after 429 and 503 responses.
+
+EXAMPLE:::
+
+from dnsdb import Dnsdb, RateLimiter
+
+dnsdb = Dnsdb(api_key, rate_limit=True)
+dnsdb = Dnsdb(api_key, rate_limit=RateLimiter(max_rate=5, max_concurrency=4))
+print(dnsdb.limiter.state())
+"""
+
+import random
+import threading
+import time
+
+RETRY_STATUS = (429, 503)
+
+
+class RateLimiter:
+    """
+    A token bucket rate limiter driven by DNSDB quota information
+    """
+
+    def __init__(
+        self,
+        max_rate=None,
+        burst=10,
+        max_concurrency=None,
+        max_retries=3,
+        backoff=1.0,
+        max_backoff=60.0,
+    ):
+        """
+        :param max_rate: float (optional: default=None)
+            upper bound in requests per second; None paces from the quota
+            alone and does not pace at all until a quota is known
+        :param burst: integer (optional: default=10)
+            number of requests which may be sent back to back
+        :param max_concurrency: integer (optional: default=None)
+            maximum number of requests in flight across threads
+        :param max_retries: integer (optional: default=3)
+            retries of a query answered with 429 or 503
+        :param backoff: float (optional: default=1.0)
+            base of the exponential backoff in seconds
+        :param max_backoff: float (optional: default=60.0)
+            upper bound of a single backoff delay in seconds
+        """
+
+        self.max_rate = max_rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.rate = max_rate
+        self.limit = None
+        self.remaining = None
+        self.reset = None
+        self.requests = 0
+        self.throttled = 0
+        self.waited = 0.0
+
+        self._tokens = float(burst)
+        self._stamp = time.monotonic()
+        self._paused_until = 0.0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+        if max_concurrency:
+            self._slots = threading.BoundedSemaphore(max_concurrency)
+        else:
+            self._slots = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def acquire(self):
+        """
+        Block until a request may be sent
+
+        :return: None
+        """
+
+        if self._slots is not None:
+            self._slots.acquire()
+
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """
+        Wait without blocking the event loop until a request may be sent.
+        The concurrency bound does not apply, see AsyncDnsdb max_concurrency.
+
+        :return: None
+        """
+
+        import asyncio
+
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def release(self, slot=True):
+        """
+        Mark a request sent with acquire as complete
+
+        :param slot: boolean (default: True)
+        :return: None
+        """
+
+        with self._lock:
+            self._in_flight -= 1
+
+        if slot and self._slots is not None:
+            self._slots.release()
+
+    def update(self, quota):
+        """
+        Tune the rate from DNSDB quota information, as returned by
+        utils.get_quota: the remaining quota is spread over the time left
+        until it resets. An exhausted quota pauses requests until the reset.
+
+        :param quota: dictionary
+        :return: None
+        """
+
+        if not quota:
+            return
+
+        limit = _integer(quota.get("limit"))
+        remaining = _integer(quota.get("remaining"))
+        reset = _integer(quota.get("reset"))
+
+        with self._lock:
+            if limit is not None:
+                self.limit = limit
+            if remaining is not None:
+                self.remaining = remaining
+            if reset is not None:
+                self.reset = reset
+
+            if remaining is None or reset is None:
+                return
+
+            seconds = reset - time.time()
+            if seconds <= 0:
+                return
+
+            self._refill(time.monotonic())
+
+            if remaining <= 0:
+                self._paused_until = max(
+                    self._paused_until, time.monotonic() + seconds
+                )
+                return
+
+            rate = remaining / seconds
+            if self.max_rate:
+                rate = min(rate, self.max_rate)
+            self.rate = rate
+
+    def retry_delay(self, attempt):
+        """
+        The jittered exponential backoff after a 429 or 503 response; all
+        requests through this limiter are paused for the delay.
+
+        :param attempt: integer
+            number of the failed attempt, starting at 0
+        :return: float (seconds)
+        """
+
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+        with self._lock:
+            self.throttled += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+
+        return delay
+
+    def state(self):
+        """
+        Return the current state of the limiter
+
+        :return: dictionary
+        """
+
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            return {
+                "rate": self.rate,
+                "tokens": self._tokens,
+                "burst": self.burst,
+                "in_flight": self._in_flight,
+                "max_concurrency": self.max_concurrency,
+                "paused_for": max(0.0, self._paused_until - now),
+                "limit": self.limit,
+                "remaining": self.remaining,
+                "reset": self.reset,
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "waited": self.waited,
+            }
+
+    def _reserve(self):
+        """
+        Take a token and return how long to wait before using it
+
+        :return: float (seconds)
+        """
+
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+
+            wait = max(0.0, self._paused_until - now)
+
+            if self.rate:
+                self._tokens -= 1
+                if self._tokens < 0:
+                    wait = max(wait, -self._tokens / self.rate)
+
+            self._in_flight += 1
+            self.requests += 1
+            self.waited += wait
+            return wait
+
+    def _refill(self, now):
+        if self.rate:
+            refilled = self._tokens + (now - self._stamp) * self.rate
+            self._tokens = min(self.burst, refilled)
+        self._stamp = now
+
+
+def _integer(value):
+    """
+    Convert a quota value to an integer
+
+    :param value: string, integer or None
+    :return: integer (None when not a number)
+    """
+
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
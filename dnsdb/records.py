@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+Compact representations of DNSDB records
+
+RecordSet stores normalized records column by column: time_first,
+time_last and count in integer arrays, rrname, rrtype and bailiwick as
+indexes into a table of interned strings, and rdata as tuples of interned
+strings. Iterating or indexing a RecordSet yields Record objects, read only
+mappings with __slots__ which behave like the normalized record
+dictionaries; to_dict converts back to those.
+
+EXAMPLE:::
+
+dnsdb = Dnsdb(api_key, compact=True)
+result = dnsdb.search(name="fsi.io", wildcard_left=True)
+print(len(result.records), result.records[0]["rrname"])
+print(result.records.to_dict())
+"""
+
+import sys
+from array import array
+from collections.abc import Mapping
+from dnsdb import utils
+
+FIELDS = (
+    "source",
+    "count",
+    "time_first",
+    "time_last",
+    "rrname",
+    "rrtype",
+    "bailiwick",
+    "rdata",
+)
+SOURCES = ("sensor", "zone")
+
+# marks an absent integer value in the integer columns
+_MISSING = -(2 ** 63)
+
+
+class Record(Mapping):
+    """
+    A normalized DNSDB record with __slots__ storage
+    """
+
+    __slots__ = FIELDS
+
+    def __init__(self, **fields):
+        for field in FIELDS:
+            object.__setattr__(self, field, fields.get(field))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Record is read only")
+
+    def __getitem__(self, key):
+        if key not in FIELDS:
+            raise KeyError(key)
+        value = getattr(self, key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        for field in FIELDS:
+            if getattr(self, field) is not None:
+                yield field
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return "Record({!r})".format(self.to_dict())
+
+    def to_dict(self):
+        """
+        Return the record as a dictionary
+
+        :return: dictionary
+        """
+
+        return {key: self[key] for key in self}
+
+
+class RecordSet:
+    """
+    A columnar, read only sequence of normalized DNSDB records
+    """
+
+    def __init__(self, epoch=True):
+        """
+        :param epoch: boolean (default: True)
+            return timestamps in epoch, otherwise as ISO 8601 strings
+        """
+
+        self.epoch = epoch
+
+        self._source = array("b")
+        self._count = array("q")
+        self._time_first = array("q")
+        self._time_last = array("q")
+        self._rrname = array("L")
+        self._rrtype = array("L")
+        self._bailiwick = array("L")
+        self._rdata = []
+        self._strings = [None]
+        self._index = {None: 0}
+
+    @classmethod
+    def from_records(cls, records, epoch=True):
+        """
+        Build a RecordSet from normalized records with epoch timestamps
+
+        :param records: iterable (of dictionaries)
+        :param epoch: boolean (default: True)
+        :return: RecordSet
+        """
+
+        record_set = cls(epoch=epoch)
+        for record in records:
+            record_set.append(record)
+        return record_set
+
+    def append(self, record):
+        """
+        Add a normalized record with epoch timestamps
+
+        :param record: dictionary
+        :return: None
+        """
+
+        self._source.append(SOURCES.index(record.get("source", "sensor")))
+        self._count.append(_integer(record.get("count")))
+        self._time_first.append(_integer(record.get("time_first")))
+        self._time_last.append(_integer(record.get("time_last")))
+        self._rrname.append(self._intern(record.get("rrname")))
+        self._rrtype.append(self._intern(record.get("rrtype")))
+        self._bailiwick.append(self._intern(record.get("bailiwick")))
+
+        rdata = record.get("rdata")
+        if isinstance(rdata, list):
+            rdata = tuple(sys.intern(value) for value in rdata)
+        self._rdata.append(rdata)
+
+    def __len__(self):
+        return len(self._source)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            record_set = RecordSet(epoch=self.epoch)
+            for position in range(*index.indices(len(self))):
+                record_set.append(self._raw(position))
+            return record_set
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("RecordSet index out of range")
+
+        return Record(**self._fields(index))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield Record(**self._fields(index))
+
+    def __eq__(self, other):
+        if isinstance(other, RecordSet):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __repr__(self):
+        return "RecordSet({} records)".format(len(self))
+
+    def to_dict(self):
+        """
+        Return the records as a list of dictionaries
+
+        :return: list (of dictionaries)
+        """
+
+        return [record.to_dict() for record in self]
+
+    def _intern(self, value):
+        index = self._index.get(value)
+        if index is None:
+            index = len(self._strings)
+            self._strings.append(sys.intern(value))
+            self._index[value] = index
+        return index
+
+    def _raw(self, index):
+        """ the fields of a record with epoch timestamps """
+
+        def integer(column):
+            value = column[index]
+            return None if value == _MISSING else value
+
+        rdata = self._rdata[index]
+        if isinstance(rdata, tuple):
+            rdata = list(rdata)
+
+        return {
+            "source": SOURCES[self._source[index]],
+            "count": integer(self._count),
+            "time_first": integer(self._time_first),
+            "time_last": integer(self._time_last),
+            "rrname": self._strings[self._rrname[index]],
+            "rrtype": self._strings[self._rrtype[index]],
+            "bailiwick": self._strings[self._bailiwick[index]],
+            "rdata": rdata,
+        }
+
+    def _fields(self, index):
+        fields = self._raw(index)
+        if not self.epoch:
+            for key in ("time_first", "time_last"):
+                if fields[key] is not None:
+                    fields[key] = utils.format_timestamp(fields[key])
+        return fields
+
+
+def _integer(value):
+    if value is None:
+        return _MISSING
+    return value
@@ -3,7 +3,25 @@
 Utility functions needed by the DNSDB module
 """
 
-from dateutil.parser import parse
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+TIME_FILTERS = (
+    "time_first_before",
+    "time_first_after",
+    "time_last_before",
+    "time_last_after",
+)
+
+RELATIVE_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+RELATIVE_TIME = re.compile(r"-(\d+)([smhdw])$")
+ISO_TIME = re.compile(
+    r"(\d{4})-?(\d{2})-?(\d{2})"
+    r"(?:[T ](\d{2}):(\d{2})(?::(\d{2})(?:\.(\d{1,6}))?)?)?"
+    r"(Z|[+-]\d{2}:?\d{2})?$"
+)
 
 
 def build_uri(options):
@@ -77,30 +95,91 @@ def build_parameters(options, path):
     return uri
 
 
+def replace_parameter(uri, key, value):
+    """
+    Set a parameter of a URI built by build_uri, replacing its value if
+    present and keeping the other parameters in order
+
+    :param uri: String
+    :param key: String
+    :param value: object
+    :return: String
+    """
+
+    base, _, query = uri.partition("?")
+    parts = [part for part in query.split("&") if part and part.split("=", 1)[0] != key]
+    parts.append("{}={}".format(key, value))
+
+    return "{}?{}".format(base, "&".join(parts))
+
+
 def post_process(options, result):
     """
     Post processing of records; supports:
       1. converting epoch to 8601
       2. sorting of records by last seen
       3. Limiting the number of results returned
+      4. storing the records in a compact RecordSet (options["compact"])
 
     :param options: Dictionary
     :param result: Result Object
     :return: list (of dictionaries)
     """
 
-    records = normalize(result.records)
-    return_limit = options["return_limit"]
+    if options.get("compact"):
+        from dnsdb.records import RecordSet
 
-    if options["sort"]:
-        records = sort(records)
+        records = iter_post_process(dict(options, epoch=True), result.records)
+        result.records = RecordSet.from_records(records, epoch=options["epoch"])
+    else:
+        result.records = list(iter_post_process(options, result.records))
 
-    if not options["epoch"]:
-        records = epoch_to_timestamp(records)
+    return result
 
-    result.records = records[0:return_limit]
 
-    return result
+def iter_post_process(options, records):
+    """
+    Post processing of a stream of records, see post_process. Records are
+    normalized one at a time as they are consumed; without sorting, the
+    timestamps of each record are converted in the same step. When sorting,
+    the whole stream is read before the first record is yielded, keeping
+    only the return_limit most recent records (all of them when
+    return_limit is None), and timestamps are converted for the returned
+    records only.
+
+    :param options: Dictionary
+    :param records: iterable (of dictionaries)
+    :return: generator (of dictionaries)
+    """
+
+    from itertools import islice
+
+    return_limit = options["return_limit"]
+    convert = not options["epoch"]
+
+    if not options["sort"]:
+        for record in islice(records, return_limit):
+            record = normalize_record(record)
+            if convert:
+                record = record_to_timestamp(record)
+            yield record
+        return
+
+    if return_limit is None:
+        # no limit: every record is returned
+        records = sort([normalize_record(record) for record in records])
+    elif hasattr(records, "__len__") and len(records) <= return_limit:
+        # every record is returned: a full sort beats a heap of the same size
+        records = sort([normalize_record(record) for record in records])
+    else:
+        records = sort(
+            (normalize_record(record) for record in records), limit=return_limit
+        )
+
+    for record in records:
+        if convert:
+            record = record_to_timestamp(record)
+        yield record
 
 
 def normalize(records):
@@ -112,37 +191,56 @@ def normalize(records):
     :return: List (of dictionaries)
     """
 
-    normalized = []
+    return [normalize_record(record) for record in records]
 
-    for record in records:
-        normalized_record = dict()
-        normalized_record["source"] = "sensor"
 
-        keys = record.keys()
-        for key in keys:
-            if key == "zone_time_first":
-                normalized_record["time_first"] = record[key]
-                normalized_record["source"] = "zone"
-            elif key == "zone_time_last":
-                normalized_record["time_last"] = record[key]
-                normalized_record["source"] = "zone"
-            else:
-                normalized_record[key] = record[key]
-        normalized.append(normalized_record)
+def normalize_record(record):
+    """
+    Normalize a single record, see normalize
+
+    :param record: Dictionary
+    :return: Dictionary
+    """
 
-    return normalized
+    normalized_record = {"source": "sensor"}
 
+    if "zone_time_first" not in record and "zone_time_last" not in record:
+        normalized_record.update(record)
+        return normalized_record
+
+    keys = record.keys()
+    for key in keys:
+        if key == "zone_time_first":
+            normalized_record["time_first"] = record[key]
+            normalized_record["source"] = "zone"
+        elif key == "zone_time_last":
+            normalized_record["time_last"] = record[key]
+            normalized_record["source"] = "zone"
+        else:
+            normalized_record[key] = record[key]
 
-def sort(records):
+    return normalized_record
+
+
+def sort(records, limit=None):
     """
     Function to sort records by time_last
 
+    When a limit is given only the limit most recent records are kept, using
+    a bounded heap rather than sorting every record. Records with the same
+    time_last keep their original order either way.
+
     :param records: List (of dictionaries)
+    :param limit: Integer (optional)
     :return: List (of dictionaries)
     """
 
+    from heapq import nlargest
     from operator import itemgetter
 
+    if limit is not None:
+        return nlargest(limit, records, key=itemgetter("time_last"))
+
     sorted_results = sorted(records, key=itemgetter("time_last"), reverse=True)
     return sorted_results
 
@@ -155,16 +253,136 @@ def epoch_to_timestamp(records):
     :return: List (of dictionaries)
     """
 
-    from datetime import datetime
-
     for record in records:
-        timestamp_keys = ["time_first", "time_last"]
-        for key in timestamp_keys:
-            if key in record:
-                record[key] = datetime.fromtimestamp(record[key]).isoformat() + "Z"
+        record_to_timestamp(record)
     return records
 
 
+def record_to_timestamp(record):
+    """
+    Convert the epoch timestamps of a single record to ISO 8601 in place,
+    see epoch_to_timestamp
+
+    :param record: Dictionary
+    :return: Dictionary
+    """
+
+    if "time_first" in record:
+        record["time_first"] = format_timestamp(record["time_first"])
+    if "time_last" in record:
+        record["time_last"] = format_timestamp(record["time_last"])
+    return record
+
+
+@lru_cache(maxsize=65536)
+def format_timestamp(epoch):
+    """
+    Convert an epoch timestamp to ISO 8601. Conversions are memoized: the
+    records of a result share many timestamps.
+
+    :param epoch: integer
+    :return: string
+    """
+
+    return datetime.fromtimestamp(epoch).isoformat() + "Z"
+
+
+def filter_records(records, filters):
+    """
+    Apply time filters to raw records client side, matching the server side
+    time fencing of DNSDB: *_before keeps records seen before the value and
+    *_after keeps records seen after it. Zone observations are compared by
+    their zone_time_first and zone_time_last values.
+
+    :param records: List (of dictionaries)
+    :param filters: Dictionary (epoch integers or None)
+    :return: List (of dictionaries)
+    """
+
+    active = [(key, value) for key, value in filters.items() if value is not None]
+
+    if not active:
+        return list(records)
+
+    filtered = []
+
+    for record in records:
+        for key, value in active:
+            field = "time_first" if key.startswith("time_first") else "time_last"
+            seen = record.get(field, record.get("zone_" + field))
+            if seen is None:
+                break
+            if key.endswith("_before") and not seen < value:
+                break
+            if key.endswith("_after") and not seen > value:
+                break
+        else:
+            filtered.append(record)
+
+    return filtered
+
+
+def merge_records(records, delta):
+    """
+    Merge the records of a refresh into the records of an earlier result.
+    Records are matched by RRset (rrname, rrtype, bailiwick, rdata and
+    whether it is a zone observation): a matched record takes the earliest
+    time_first, the latest time_last and the count of the refresh, other
+    records of the refresh are appended.
+
+    :param records: List (of dictionaries)
+    :param delta: List (of dictionaries)
+    :return: tuple (List (of dictionaries), Integer added, Integer updated)
+    """
+
+    merged = {rrset_key(record): record for record in records}
+    added = 0
+    updated = 0
+
+    for record in delta:
+        key = rrset_key(record)
+        previous = merged.get(key)
+
+        if previous is None:
+            merged[key] = record
+            added += 1
+            continue
+
+        record = dict(record)
+        for field in ("time_first", "zone_time_first"):
+            if field in previous and field in record:
+                record[field] = min(previous[field], record[field])
+        for field in ("time_last", "zone_time_last"):
+            if field in previous and field in record:
+                record[field] = max(previous[field], record[field])
+
+        merged[key] = record
+        updated += 1
+
+    return list(merged.values()), added, updated
+
+
+def rrset_key(record):
+    """
+    The identity of the RRset of a raw record, see merge_records
+
+    :param record: Dictionary
+    :return: tuple
+    """
+
+    rdata = record.get("rdata")
+    if isinstance(rdata, list):
+        rdata = tuple(rdata)
+
+    return (
+        record.get("rrname"),
+        record.get("rrtype"),
+        record.get("bailiwick"),
+        rdata,
+        "zone_time_last" in record,
+    )
+
+
 def validate_options(options):
     """
     Validate wildcard options
@@ -308,45 +526,119 @@ def normalize_rate(rate):
     return rate
 
 
-def pre_process(options):
+def pre_process(options, now=None):
     """
     Function to initial the pre-processing of specified options
 
     :param options: dictionary
+    :param now: integer (optional)
+        epoch relative time filters are resolved against, see parse_date
     :return: dictionary
     """
 
     options = validate_options(options)
-
-    if options["epoch"] is False:
-        options = parse_date(options)
+    options = parse_date(options, now=now)
 
     return options
 
 
-def parse_date(options):
+def parse_date(options, now=None):
     """
-    Function to convert human readable date / time to epoch time
+    Function to convert human readable date / time to epoch time, see
+    parse_time. Relative times of all fields resolve against the same now.
 
     :param options: dictionary
+    :param now: integer (optional: default=the current time)
     :return: dictionary
     """
 
-    options_time = [
-        "time_first_before",
-        "time_first_after",
-        "time_last_before",
-        "time_last_after",
-    ]
+    if now is None:
+        now = int(time.time())
 
-    for time_field in options_time:
+    for time_field in TIME_FILTERS:
         if options[time_field]:
-            dt = parse(options[time_field])
-            options[time_field] = int(dt.timestamp())
+            options[time_field] = parse_time(options[time_field], now)
 
     return options
 
 
+def parse_time(value, now=None):
+    """
+    Convert a time filter to epoch time. Common forms are parsed directly:
+      * epoch integers, or strings of digits (negative values are left to
+        DNSDB, which takes them as seconds before the time of the query);
+        strings of 4 or 8 digits are the dates yyyy and yyyymmdd instead
+      * relative offsets: -30s, -15m, -24h, -7d, -2w
+      * ISO 8601 dates and times: 2019-01-01, 20190101, 2019-01-01T00:00:00Z,
+        2019-01-01 12:00:00+02:00
+    Anything else is parsed by dateutil. Times without a timezone are local.
+
+    :param value: integer or string
+    :param now: integer (optional: default=the current time)
+        epoch relative offsets are resolved against
+    :return: integer
+    """
+
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, float):
+        return int(value)
+
+    value = value.strip()
+
+    relative = RELATIVE_TIME.match(value)
+    if relative:
+        if now is None:
+            now = int(time.time())
+        return now - int(relative.group(1)) * RELATIVE_UNITS[relative.group(2)]
+
+    return _parse_absolute(value)
+
+
+@lru_cache(maxsize=1024)
+def _parse_absolute(value):
+    """
+    Parse an epoch or absolute date / time string, see parse_time
+
+    :param value: string
+    :return: integer
+    """
+
+    # 2016 and 20160101 are dates, not seconds after the epoch
+    date = value.isdigit() and len(value) in (4, 8)
+    if value.lstrip("-").isdigit() and not date:
+        return int(value)
+
+    match = ISO_TIME.match(value)
+    if match is None:
+        from dateutil.parser import parse
+
+        return int(parse(value).timestamp())
+
+    year, month, day, hour, minute, second, fraction, zone = match.groups()
+    microsecond = int(fraction.ljust(6, "0")) if fraction else 0
+    tzinfo = None
+    if zone == "Z":
+        tzinfo = timezone.utc
+    elif zone:
+        sign = -1 if zone[0] == "-" else 1
+        digits = zone[1:].replace(":", "")
+        offset = timedelta(hours=int(digits[:2]), minutes=int(digits[2:]))
+        tzinfo = timezone(sign * offset)
+
+    dt = datetime(
+        int(year),
+        int(month),
+        int(day),
+        int(hour or 0),
+        int(minute or 0),
+        int(second or 0),
+        microsecond,
+        tzinfo=tzinfo,
+    )
+    return int(dt.timestamp())
+
+
 def debug(result):
     """
     Function to debug output using the console / ipython.
@@ -0,0 +1,244 @@
+import fnmatch
+import json
+import os
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+class FakeDnsdbHandler(BaseHTTPRequestHandler):
+    """
+    A minimal stand-in for the DNSDB API which serves NDJSON records from
+    the ``routes`` dictionary of its server.
+    """
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests.append(self.path)
+
+        if self.server.delay:
+            time.sleep(self.server.delay)
+
+        if self.server.statuses:
+            status = self.server.statuses.pop(0)
+            self._send(status, b"Error: rate limit exceeded\n", "text/plain")
+            return
+
+        if self.path.startswith("/lookup/rate_limit"):
+            body = json.dumps({"rate": self.server.rate}).encode("utf-8")
+            self._send(200, body, "application/json")
+            return
+
+        path = self.path.split("?")[0]
+        records = self.server.routes.get(path)
+
+        if records is None:
+            body = b"Error: no results found for query.\n"
+            self._send(404, body, "text/plain")
+            return
+
+        limit = _limit(self.path)
+        lines = [json.dumps(record) for record in records[:limit]]
+        body = ("\n".join(lines) + "\n").encode("utf-8")
+        self._send(200, body, "application/x-ndjson")
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-RateLimit-Limit", str(self.server.rate["limit"]))
+        self.send_header("X-RateLimit-Remaining", str(self.server.rate["remaining"]))
+        self.send_header("X-RateLimit-Reset", str(self.server.rate["reset"]))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _limit(path):
+    for part in path.split("?", 1)[-1].split("&"):
+        if part.startswith("limit="):
+            return int(part[len("limit=") :])
+    return None
+
+
+@pytest.fixture
+def fake_dnsdb():
+    """
+    Start a local stand-in DNSDB server; yields the server object, its URL
+    is available as ``server.url``.
+    """
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeDnsdbHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connections = 0
+    server.requests = []
+    server.routes = dict()
+    server.delay = 0
+    server.statuses = []
+    server.rate = {"limit": 1000, "remaining": 999, "reset": 1551830400}
+    server.url = "http://127.0.0.1:{}".format(server.server_address[1])
+
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    """
+    A minimal stand-in for a Redis server, speaking the commands of
+    dnsdb.backends.RedisBackend over RESP. Commands are recorded in the
+    ``commands`` list of its server.
+    """
+
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for _ in range(int(line[1:])):
+                size = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(size + 2)[:-2])
+
+            command = args[0].upper().decode("ascii")
+            with self.server.lock:
+                self.server.commands.append(args)
+                reply = self._execute(command, args[1:])
+            self.wfile.write(reply)
+
+    def _execute(self, command, args):
+        if self.server.password is not None:
+            if command == "AUTH":
+                self.authenticated = args[-1].decode("utf-8") == self.server.password
+                if not self.authenticated:
+                    return b"-WRONGPASS invalid password\r\n"
+                return b"+OK\r\n"
+            if not getattr(self, "authenticated", False):
+                return b"-NOAUTH Authentication required\r\n"
+
+        data = self.server.data
+        now = time.time()
+        for key, (_, expires) in list(data.items()):
+            if expires is not None and expires <= now:
+                del data[key]
+
+        if command in ("PING", "AUTH", "SELECT"):
+            return b"+OK\r\n"
+        if command == "GET":
+            return _bulk(data.get(args[0], (None, None))[0])
+        if command == "MGET":
+            values = [data.get(key, (None, None))[0] for key in args]
+            return b"*%d\r\n" % len(values) + b"".join(map(_bulk, values))
+        if command == "SET":
+            expires = None
+            if len(args) == 4 and args[2].upper() == b"PX":
+                expires = now + int(args[3]) / 1000
+            data[args[0]] = (args[1], expires)
+            return b"+OK\r\n"
+        if command == "DEL":
+            return b":%d\r\n" % sum(data.pop(key, None) is not None for key in args)
+        if command == "INCRBY":
+            value, expires = data.get(args[0], (b"0", None))
+            try:
+                value = int(value) + int(args[1])
+            except ValueError:
+                return b"-ERR value is not an integer\r\n"
+            data[args[0]] = (str(value).encode("ascii"), expires)
+            return b":%d\r\n" % value
+        if command == "PTTL":
+            if args[0] not in data:
+                return b":-2\r\n"
+            expires = data[args[0]][1]
+            if expires is None:
+                return b":-1\r\n"
+            return b":%d\r\n" % int((expires - now) * 1000)
+        if command == "SCAN":
+            pattern = args[args.index(b"MATCH") + 1].decode("utf-8")
+            keys = [
+                key
+                for key in data
+                if fnmatch.fnmatchcase(key.decode("utf-8"), pattern)
+            ]
+            keys = b"*%d\r\n" % len(keys) + b"".join(map(_bulk, keys))
+            return b"*2\r\n" + _bulk(b"0") + keys
+        if command == "INFO":
+            size = sum(len(key) + len(value) for key, (value, _) in data.items())
+            return _bulk(b"# Memory\r\nused_memory:%d\r\n" % size)
+        return b"-ERR unknown command\r\n"
+
+
+def _bulk(value):
+    if value is None:
+        return b"$-1\r\n"
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+@pytest.fixture
+def fake_redis():
+    """
+    Start a local stand-in Redis server; yields the server object, its URL
+    is available as ``server.url``.
+    """
+
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), FakeRedisHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.commands = []
+    server.data = dict()
+    server.password = None
+    server.url = "redis://127.0.0.1:{}/0".format(server.server_address[1])
+
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(params=["disk", "sqlite", "redis"])
+def cache_location(request, tmp_path):
+    """
+    The location of a cache in each backend: a directory, a SQLite
+    database and a Redis server (a stand-in unless DNSDB_TEST_REDIS_URL is
+    set, in which case the keys of the cache are removed first)
+    """
+
+    if request.param == "disk":
+        return str(tmp_path / "cache")
+
+    if request.param == "sqlite":
+        return "sqlite:///" + str(tmp_path / "cache.db")
+
+    url = os.environ.get("DNSDB_TEST_REDIS_URL")
+    if url is None:
+        return request.getfixturevalue("fake_redis").url
+
+    from dnsdb.backends import RedisBackend
+
+    backend = RedisBackend(url)
+    for key in list(backend):
+        backend.delete(key)
+    backend.close()
+    return url
@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from dnsdb import AsyncDnsdb
+from tests.test_client import RECORDS
+
+pytest.importorskip("aiohttp")
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_search(fake_dnsdb):
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/ANY"] = RECORDS
+
+    async def main():
+        async with AsyncDnsdb("12345", server=fake_dnsdb.url) as dnsdb:
+            results = await asyncio.gather(
+                *[dnsdb.search(name="www.fsi.io") for _ in range(5)]
+            )
+            quota = await dnsdb.quota()
+        return results, quota
+
+    results, quota = run(main())
+
+    for result in results:
+        assert result.status_code == 200
+        assert result.records[0]["time_last"] == "2018-09-26T23:53:37Z"
+    assert quota.quota["remaining"] == 999
+
+
+def test_search_without_return_limit(fake_dnsdb):
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/ANY"] = RECORDS
+
+    async def main():
+        async with AsyncDnsdb("12345", server=fake_dnsdb.url) as dnsdb:
+            return [
+                await dnsdb.search(name="www.fsi.io", return_limit=None, sort=sort)
+                for sort in (True, False)
+            ]
+
+    sorted_result, unsorted = run(main())
+
+    assert sorted_result.records[0]["time_last"] == "2018-09-26T23:53:37Z"
+    assert len(sorted_result.records) == 2
+    assert len(unsorted.records) == 2
+
+
+def test_search_not_found(fake_dnsdb):
+    async def main():
+        async with AsyncDnsdb("12345", server=fake_dnsdb.url) as dnsdb:
+            return await dnsdb.search(name="missing.fsi.io")
+
+    result = run(main())
+
+    assert result.status_code == 404
+    assert result.error["message"] == "Error: no results found for query."
+
+
+def test_iter_search(fake_dnsdb, tmp_path):
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/ANY"] = RECORDS
+
+    async def main():
+        dnsdb = AsyncDnsdb(
+            "12345", server=fake_dnsdb.url, cache=True, cache_location=str(tmp_path)
+        )
+        async with dnsdb:
+            result = await dnsdb.iter_search(name="www.fsi.io", sort=False, epoch=True)
+            streamed = [record async for record in result]
+            cached = await dnsdb.iter_search(name="www.fsi.io", sort=False, epoch=True)
+            return streamed, cached, [record async for record in cached]
+
+    streamed, cached, replayed = run(main())
+
+    assert [record["time_last"] for record in streamed] == [1417729108, 1538006017]
+    assert cached.cached is True
+    assert replayed == streamed
+    assert len(fake_dnsdb.requests) == 1
+
+
+def test_search_rejects_unknown_argument():
+    with pytest.raises(TypeError):
+        run(AsyncDnsdb("12345").search(domain="fsi.io"))
+
+
+def test_search_coalesces_identical_queries(fake_dnsdb):
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/ANY"] = RECORDS
+    fake_dnsdb.delay = 0.1
+
+    async def main():
+        async with AsyncDnsdb("12345", server=fake_dnsdb.url) as dnsdb:
+            return await asyncio.gather(
+                *[dnsdb.search(name="www.fsi.io") for _ in range(5)]
+            )
+
+    results = run(main())
+
+    assert len(fake_dnsdb.requests) == 1
+    assert len({id(result.records) for result in results}) == 5
@@ -0,0 +1,200 @@
+import time
+
+import pytest
+
+from dnsdb import Dnsdb
+from dnsdb.backends import RedisError, SQLiteBackend, open_backend
+from dnsdb.cache import INDEX_PREFIX, ResultCache
+from tests.test_client import RECORDS
+
+DATA = {"records": RECORDS, "status_code": 200, "error": None, "quota": None}
+
+
+def limited(limit):
+    """ options of a query with a limit, for an API key of a known maximum """
+    return {"remote_limit": limit, "results_max": 1000}
+
+
+def round_trips(monkeypatch, backend):
+    calls = []
+    send = backend._send
+
+    def counted(commands):
+        calls.append(len(commands))
+        return send(commands)
+
+    monkeypatch.setattr(backend, "_send", counted)
+    return calls
+
+
+def test_backend_operations(cache_location):
+    backend = open_backend(cache_location)
+    entry = {"meta": {"count": 2, "codec": "json+none"}, "body": b"\x00[]"}
+
+    backend.set("entry", entry, expire=60)
+    backend.set_many([("index", {"uri": {"limit": 10}}), ("legacy", b"\x1f\x8b")])
+
+    assert backend.get("entry") == entry
+    value, expire_time = backend.get("entry", expire_time=True)
+    assert value == entry
+    assert time.time() + 50 < expire_time <= time.time() + 60
+    assert backend.get("index", expire_time=True) == ({"uri": {"limit": 10}}, None)
+    assert backend.get("missing", 0) == 0
+    assert backend.get_many(["entry", "missing", "legacy"]) == {
+        "entry": entry,
+        "legacy": b"\x1f\x8b",
+    }
+
+    assert backend.incr("counter", 3) == 3
+    assert backend.incr("counter") == 4
+    assert backend.get("counter") == 4
+    assert sorted(backend) == ["counter", "entry", "index", "legacy"]
+
+    assert backend.delete("legacy") is True
+    assert backend.delete("legacy") is False
+    backend.close()
+
+
+def test_backend_expiry(cache_location):
+    backend = open_backend(cache_location)
+    backend.set("short", 1, expire=0.05)
+    backend.set("expired", 1, expire=0)
+    backend.set("kept", 1, expire=60)
+
+    assert backend.get("expired") is None
+    time.sleep(0.1)
+    assert backend.get("short") is None
+    assert backend.get_many(["short", "expired", "kept"]) == {"kept": 1}
+    backend.expire()
+    assert list(backend) == ["kept"]
+    backend.close()
+
+
+def test_result_cache_backends(cache_location):
+    cache = ResultCache(cache_location, timeout=60)
+    cache.set("uri?limit=10", DATA, options=limited(10))
+    cache.set("other", DATA)
+    cache.close()
+
+    # shared by every client of the location
+    cache = ResultCache(cache_location, timeout=60)
+    assert cache.get("uri?limit=10")["records"] == RECORDS
+    narrower = cache.get("uri?limit=1", options=limited(1))
+    assert narrower["records"] == RECORDS[:1]
+
+    found = cache.get_many(
+        [("other", None), ("missing", None), ("uri?limit=5", limited(5))]
+    )
+    assert found[0]["records"] == RECORDS
+    assert found[1] is None
+    assert found[2]["records"] == RECORDS
+    assert cache.stats()["hits"] == 4
+    assert cache.stats()["misses"] == 1
+
+    summary = cache.summary()
+    assert summary["entries"] == 2
+    assert summary["found"] == 2
+    cache.close()
+
+    assert ResultCache(cache_location).summary()["hits"] == 4
+
+
+def test_result_cache_timeout(cache_location):
+    cache = ResultCache(cache_location, timeout=0.2)
+    cache.set("uri", DATA, options=limited(10))
+    assert cache.get("uri") is not None
+
+    time.sleep(0.3)
+    assert cache.get("uri") is None
+    assert cache.disk.get(INDEX_PREFIX + "uri") is None
+    cache.close()
+
+
+def test_redis_bulk_reads_and_writes(fake_redis, monkeypatch):
+    cache = ResultCache(fake_redis.url, write_queue=8)
+    calls = round_trips(monkeypatch, cache.disk)
+
+    for number in range(4):
+        cache.set("uri-{}".format(number), DATA, options=limited(10))
+    cache.flush()
+    # results and their indexes, batched by the writer
+    assert len(calls) <= 3 * 4
+
+    del calls[:]
+    keys = [("uri-{}".format(number), None) for number in range(4)]
+    assert all(data is not None for data in cache.get_many(keys))
+    assert calls == [8]
+    cache.close()
+
+
+def test_redis_authentication(fake_redis):
+    fake_redis.password = "secret"
+    url = fake_redis.url.replace("redis://", "redis://:wrong@")
+    backend = open_backend(url)
+
+    for _ in range(2):
+        # the unauthenticated connection is closed rather than reused
+        with pytest.raises(RedisError):
+            backend.get("key")
+        assert backend._socket is None
+
+    auths = [args for args in fake_redis.commands if args[0] == b"AUTH"]
+    assert len(auths) == 2
+    assert [args[0] for args in fake_redis.commands].count(b"GET") == 0
+
+    backend = open_backend(fake_redis.url.replace("redis://", "redis://:secret@"))
+    backend.set("key", 1)
+    assert backend.get("key") == 1
+    backend.close()
+
+
+def test_search_many_reads_cache_in_one_round_trip(
+    fake_dnsdb, fake_redis, monkeypatch
+):
+    names = ["www.fsi.io", "fsi.io", "mail.fsi.io"]
+    for name in names:
+        fake_dnsdb.routes["/lookup/rrset/name/{}/ANY".format(name)] = RECORDS
+
+    dnsdb = Dnsdb(
+        "12345", server=fake_dnsdb.url, cache=True, cache_location=fake_redis.url
+    )
+    queries = [{"name": name} for name in names]
+
+    with dnsdb:
+        assert len(list(dnsdb.search_many(queries))) == 3
+
+        calls = round_trips(monkeypatch, dnsdb._cache.disk)
+        results = [result for _, result in dnsdb.search_many(queries)]
+        assert len(calls) == 1
+
+    assert all(result.cached for result in results)
+    assert len(fake_dnsdb.requests) == 3
+
+
+def test_sqlite_eviction(tmp_path):
+    path = str(tmp_path / "cache.db")
+    backend = SQLiteBackend(path, size_limit=4000)
+    backend.incr("counter")
+
+    for number in range(10):
+        backend.set("key-{}".format(number), b"x" * 999)
+
+    assert backend.get("key-0") is None
+    assert backend.get("key-9") is not None
+    assert backend.get("counter") == 1
+    assert sorted(backend) == ["counter", "key-6", "key-7", "key-8", "key-9"]
+    # the size limit is checked against a total kept by triggers
+    backend.set("key-9", b"x" * 499)
+    backend.delete("key-8")
+    backend.set("expired", b"x", expire=0)
+    backend.expire()
+    assert backend._stored() == 1000 * 2 + 500  # values are tagged by a byte
+    backend.close()
+
+    # kept by the database
+    backend = SQLiteBackend(path, eviction_policy="none")
+    assert backend.size_limit == 4000
+    backend.set("key-10", b"x" * 999)
+    assert backend.cull() == 0
+    backend.close()
+    assert SQLiteBackend(path).eviction_policy == "none"
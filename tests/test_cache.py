@@ -0,0 +1,520 @@
+import gzip
+import io
+import json
+import threading
+import time
+
+import pytest
+
+from dnsdb import Dnsdb
+from dnsdb import cache as cache_module
+from dnsdb.cache import MemoryCache, ResultCache, covers
+from tests.test_client import RECORDS
+
+DATA = {
+    "records": RECORDS,
+    "status_code": 200,
+    "error": None,
+    "quota": None,
+    "cached": False,
+}
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache(max_entries=2, max_bytes=1000)
+    cache.set("a", 1, 10)
+    cache.set("b", 2, 10)
+    assert cache.get("a") == 1
+    cache.set("c", 3, 10)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_memory_cache_bytes_limit():
+    cache = MemoryCache(max_entries=10, max_bytes=100)
+    cache.set("a", 1, 60)
+    cache.set("b", 2, 60)
+    cache.set("huge", 3, 101)
+
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert cache.get("huge") is None
+    assert cache.stats()["bytes"] == 60
+
+
+def test_memory_cache_expiry():
+    cache = MemoryCache()
+    cache.set("a", 1, 10, expire_time=time.time() - 1)
+
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_result_cache_tiers(tmp_path):
+    cache = ResultCache(str(tmp_path), memory_entries=10)
+    cache.set("uri", DATA)
+    cache.memory.clear()
+
+    assert cache.get("uri")["records"] == RECORDS
+    assert cache.get("uri")["records"] == RECORDS
+    assert cache.get("missing") is None
+
+    stats = cache.stats()
+    assert stats["disk"] == {"hits": 1, "misses": 1}
+    assert stats["memory"]["hits"] == 1
+    assert stats["memory"]["misses"] == 2
+    cache.close()
+
+
+def test_search_memory_tier(fake_dnsdb, tmp_path):
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/ANY"] = RECORDS
+    dnsdb = Dnsdb(
+        "12345",
+        server=fake_dnsdb.url,
+        cache=True,
+        cache_location=str(tmp_path),
+        memory_cache_entries=10,
+    )
+
+    with dnsdb:
+        first = dnsdb.search(name="www.fsi.io")
+        for _ in range(3):
+            result = dnsdb.search(name="www.fsi.io")
+            assert result.cached is True
+            assert result.records == first.records
+        stats = dnsdb.cache_stats()
+
+    assert stats["memory"]["hits"] == 3
+    assert stats["disk"] == {"hits": 0, "misses": 1}
+    assert len(fake_dnsdb.requests) == 1
+
+
+def test_covers():
+    filters = {
+        "time_first_before": None,
+        "time_first_after": None,
+        "time_last_before": None,
+        "time_last_after": 100,
+    }
+    meta = {"truncated": False, "filters": dict(filters, time_last_after=50)}
+
+    assert covers(meta, filters)
+    assert not covers(dict(meta, truncated=True), filters)
+    assert not covers(meta, dict(filters, time_last_after=10))
+    assert not covers(meta, dict(filters, time_last_after=None))
+    assert covers(dict(meta, filters=dict(filters, time_last_after=None)), filters)
+
+
+def test_legacy_entry_is_readable(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    cache.disk.set("uri", gzip.compress(json.dumps(DATA).encode("utf-8")))
+
+    assert cache.get("uri")["records"] == RECORDS
+    cache.close()
+
+
+def test_search_subsumed_by_larger_limit_and_window(fake_dnsdb, tmp_path):
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/ANY"] = RECORDS
+    dnsdb = Dnsdb(
+        "12345",
+        server=fake_dnsdb.url,
+        cache=True,
+        cache_location=str(tmp_path),
+        results_max=1000000,
+    )
+
+    with dnsdb:
+        dnsdb.search(name="www.fsi.io", epoch=True)
+
+        result = dnsdb.search(name="www.fsi.io", epoch=True, remote_limit=1)
+        assert result.cached is True
+        assert len(result.records) == 1
+
+        result = dnsdb.search(
+            name="www.fsi.io", epoch=True, time_last_after=1417729108
+        )
+        assert result.cached is True
+        assert [record["count"] for record in result.records] == [4838]
+
+        result = dnsdb.search(
+            name="www.fsi.io", epoch=True, time_first_before=1381267249
+        )
+        assert result.cached is True
+        assert result.status_code == 404
+
+        assert dnsdb.cache_stats()["subsumed"] == 3
+
+    assert len(fake_dnsdb.requests) == 1
+
+
+def test_search_truncated_result_is_not_subsumed(fake_dnsdb, tmp_path):
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/ANY"] = RECORDS
+    dnsdb = Dnsdb(
+        "12345",
+        server=fake_dnsdb.url,
+        cache=True,
+        cache_location=str(tmp_path),
+        results_max=1000000,
+    )
+
+    with dnsdb:
+        dnsdb.search(name="www.fsi.io", epoch=True, remote_limit=2)
+        result = dnsdb.search(
+            name="www.fsi.io", epoch=True, time_last_after=1417729108
+        )
+        assert result.cached is False
+
+    assert len(fake_dnsdb.requests) == 2
+
+
+def test_search_capped_by_results_max_is_not_subsumed(fake_dnsdb, tmp_path):
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/ANY"] = RECORDS
+
+    # the server returned results_max records: more may exist
+    for results_max in (2, None):
+        dnsdb = Dnsdb(
+            "12345",
+            server=fake_dnsdb.url,
+            cache=True,
+            cache_location=str(tmp_path / str(results_max)),
+            results_max=results_max,
+        )
+        with dnsdb:
+            dnsdb.search(name="www.fsi.io", epoch=True, remote_limit=100)
+            result = dnsdb.search(name="www.fsi.io", epoch=True, remote_limit=1)
+            assert result.cached is False
+
+    assert len(fake_dnsdb.requests) == 4
+
+
+def test_search_results_max_learned_from_quota(fake_dnsdb, tmp_path):
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/ANY"] = RECORDS
+    fake_dnsdb.rate["results_max"] = 1000000
+    dnsdb = Dnsdb(
+        "12345", server=fake_dnsdb.url, cache=True, cache_location=str(tmp_path)
+    )
+
+    with dnsdb:
+        dnsdb.quota()
+        assert dnsdb.results_max == 1000000
+
+        dnsdb.search(name="www.fsi.io", epoch=True)
+        result = dnsdb.search(name="www.fsi.io", epoch=True, remote_limit=1)
+        assert result.cached is True
+
+
+RDATA_RECORDS = [
+    {
+        "count": 10,
+        "time_first": 1381267249,
+        "time_last": 1417729108,
+        "rrname": "www.fsi.io.",
+        "rrtype": "A",
+        "rdata": "104.244.14.108",
+    },
+    {
+        "count": 20,
+        "time_first": 1433657594,
+        "time_last": 1538006017,
+        "rrname": "mail.fsi.io.",
+        "rrtype": "A",
+        "rdata": "104.244.14.20",
+    },
+]
+
+WILDCARD_RECORDS = [
+    dict(RECORDS[1], rrname="www.fsi.io."),
+    dict(RECORDS[1], rrname="mail.fsi.io.", rdata=["104.244.14.20"]),
+    dict(RECORDS[1], rrname="a.mail.fsi.io.", rdata=["104.244.14.21"]),
+]
+
+
+def test_search_contained_in_cidr(fake_dnsdb, tmp_path):
+    fake_dnsdb.routes["/lookup/rdata/ip/104.244.14.0,24"] = RDATA_RECORDS
+    dnsdb = Dnsdb(
+        "12345",
+        server=fake_dnsdb.url,
+        cache=True,
+        cache_location=str(tmp_path),
+        results_max=1000000,
+    )
+
+    with dnsdb:
+        dnsdb.search(ip="104.244.14.0/24")
+
+        result = dnsdb.search(ip="104.244.14.108")
+        assert result.cached is True
+        assert [record["rrname"] for record in result.records] == ["www.fsi.io."]
+
+        result = dnsdb.search(ip="104.244.14.16/28")
+        assert [record["rrname"] for record in result.records] == ["mail.fsi.io."]
+
+        result = dnsdb.search(ip="104.244.14.200")
+        assert result.status_code == 404
+        assert dnsdb.cache_stats()["contained"] == 3
+
+    assert len(fake_dnsdb.requests) == 1
+
+
+def test_search_contained_in_wildcard(fake_dnsdb, tmp_path):
+    fake_dnsdb.routes["/lookup/rrset/name/*.fsi.io/A"] = WILDCARD_RECORDS
+    dnsdb = Dnsdb(
+        "12345",
+        server=fake_dnsdb.url,
+        cache=True,
+        cache_location=str(tmp_path),
+        results_max=1000000,
+    )
+
+    with dnsdb:
+        dnsdb.search(name="fsi.io", type="A", wildcard_left=True)
+
+        result = dnsdb.search(name="mail.fsi.io", type="A")
+        assert result.cached is True
+        assert [record["rrname"] for record in result.records] == ["mail.fsi.io."]
+
+        result = dnsdb.search(name="mail.fsi.io", type="A", wildcard_left=True)
+        assert [record["rrname"] for record in result.records] == ["a.mail.fsi.io."]
+
+        # a different rrtype is not contained
+        result = dnsdb.search(name="mail.fsi.io", type="MX")
+        assert result.cached is False
+
+    assert len(fake_dnsdb.requests) == 2
+
+
+def test_search_rdata_name_not_contained_in_wildcard(fake_dnsdb, tmp_path):
+    mx_records = [
+        dict(RECORDS[1], rrname="fsi.io.", rrtype="MX", rdata=["10 mail.fsi.io."]),
+        dict(RECORDS[1], rrname="fsi.io.", rrtype="MX", rdata=["20 mx.fsi.io."]),
+    ]
+    fake_dnsdb.routes["/lookup/rdata/name/*.fsi.io/MX"] = mx_records
+    fake_dnsdb.routes["/lookup/rdata/name/mail.fsi.io/MX"] = mx_records[:1]
+    dnsdb = Dnsdb(
+        "12345",
+        server=fake_dnsdb.url,
+        cache=True,
+        cache_location=str(tmp_path),
+        results_max=1000000,
+    )
+
+    with dnsdb:
+        dnsdb.search(name="fsi.io", type="MX", inverse=True, wildcard_left=True)
+
+        result = dnsdb.search(name="mail.fsi.io", type="MX", inverse=True)
+        assert result.cached is False
+        assert result.status_code == 200
+        assert [record["rdata"] for record in result.records] == [["10 mail.fsi.io."]]
+        assert dnsdb.cache_stats()["contained"] == 0
+
+    assert len(fake_dnsdb.requests) == 2
+
+
+def test_search_not_contained_in_truncated_result(fake_dnsdb, tmp_path):
+    fake_dnsdb.routes["/lookup/rdata/ip/104.244.14.0,24"] = RDATA_RECORDS
+    dnsdb = Dnsdb(
+        "12345",
+        server=fake_dnsdb.url,
+        cache=True,
+        cache_location=str(tmp_path),
+        results_max=1000000,
+    )
+
+    with dnsdb:
+        dnsdb.search(ip="104.244.14.0/24", remote_limit=2)
+        result = dnsdb.search(ip="104.244.14.108")
+        assert result.cached is False
+
+    assert len(fake_dnsdb.requests) == 2
+
+
+def test_search_cache_hit_is_lazy(fake_dnsdb, tmp_path, monkeypatch):
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/ANY"] = RECORDS
+    loads = []
+    load = cache_module._load
+    monkeypatch.setattr(
+        cache_module, "_load", lambda *args: loads.append(1) or load(*args)
+    )
+    dnsdb = Dnsdb(
+        "12345", server=fake_dnsdb.url, cache=True, cache_location=str(tmp_path)
+    )
+
+    with dnsdb:
+        expected = dnsdb.search(name="www.fsi.io", return_limit=1).records
+        result = dnsdb.search(name="www.fsi.io", return_limit=1)
+
+        assert result.cached is True
+        assert result.status_code == 200
+        assert result.deferred
+        assert result.count == 1
+        assert loads == []
+
+        assert result.records == expected
+        assert not result.deferred
+        assert result.records == expected
+        assert loads == [1]
+
+
+def test_search_cache_refresh(fake_dnsdb, tmp_path):
+    path = "/lookup/rrset/name/www.fsi.io/ANY"
+    fake_dnsdb.routes[path] = RECORDS
+    updated = dict(RECORDS[1], count=5000, time_last=1600000000)
+    added = dict(RECORDS[0], rdata=["104.244.14.108"], time_last=1600000001)
+    dnsdb = Dnsdb(
+        "12345",
+        server=fake_dnsdb.url,
+        cache=True,
+        cache_location=str(tmp_path),
+        cache_timeout=0,
+        cache_refresh=True,
+    )
+
+    with dnsdb:
+        result = dnsdb.search(name="www.fsi.io", epoch=True)
+        assert result.refresh is None
+        stored = time.time()
+
+        # the stand-in ignores time filters: serve the delta
+        fake_dnsdb.routes[path] = [updated, added]
+        result = dnsdb.search(name="www.fsi.io", epoch=True)
+
+        assert result.cached is False
+        assert result.quota["remaining"] == "999"
+        assert [record["count"] for record in result.records] == [57, 5000, 57]
+        assert result.records[1]["time_first"] == RECORDS[1]["time_first"]
+        assert result.refresh["fetched"] == 2
+        assert result.refresh["added"] == 1
+        assert result.refresh["updated"] == 1
+        assert result.refresh["records"] == 3
+        assert result.refresh["records_saved"] == 1
+        assert abs(result.refresh["since"] - (stored - 300)) < 5
+
+        # nothing new: the merged result is kept
+        del fake_dnsdb.routes[path]
+        result = dnsdb.search(name="www.fsi.io", epoch=True)
+        assert result.status_code == 200
+        assert len(result.records) == 3
+        assert result.refresh["fetched"] == 0
+        assert result.refresh["bytes_saved"] > 0
+
+    first, refresh = fake_dnsdb.requests[:2]
+    assert "time_last_after" not in first
+    assert "time_last_after=" in refresh
+
+
+def test_stale_result_is_not_answered(tmp_path):
+    cache = ResultCache(str(tmp_path), timeout=0, stale_timeout=60)
+    cache.set("uri", DATA)
+
+    assert cache.get("uri") is None
+    data, meta = cache.get_stale("uri")
+    assert data["records"] == RECORDS
+    assert meta["count"] == 2
+    cache.close()
+
+
+def test_write_behind(tmp_path):
+    cache = ResultCache(str(tmp_path), write_queue=4)
+    cache.set("uri", DATA)
+
+    # answered from the queue until written
+    assert cache.get("uri")["records"] == RECORDS
+    cache.flush()
+    assert cache.stats()["writes"]["written"] == 1
+    cache.close()
+
+    cache = ResultCache(str(tmp_path))
+    assert cache.get("uri")["records"] == RECORDS
+    cache.close()
+
+
+def test_write_behind_drops_when_full(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path), write_queue=1)
+    started = threading.Event()
+    release = threading.Event()
+    store_many = cache._store_many
+
+    def blocked_store_many(items):
+        started.set()
+        release.wait(5)
+        store_many(items)
+
+    monkeypatch.setattr(cache, "_store_many", blocked_store_many)
+
+    cache.set("one", DATA)
+    started.wait(5)
+    cache.set("two", DATA)
+    cache.set("three", DATA)
+
+    writes = cache.stats()["writes"]
+    assert writes["depth"] == 1
+    assert writes["dropped"] == 1
+    assert cache.get("three") is None
+
+    release.set()
+    cache.close()
+
+    assert cache.stats()["writes"]["written"] == 2
+    assert cache.get("two")["records"] == RECORDS
+    cache.close()
+
+
+def test_search_write_behind(fake_dnsdb, tmp_path):
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/ANY"] = RECORDS
+    dnsdb = Dnsdb(
+        "12345",
+        server=fake_dnsdb.url,
+        cache=True,
+        cache_location=str(tmp_path),
+        cache_write_queue=8,
+    )
+
+    with dnsdb:
+        expected = dnsdb.search(name="www.fsi.io").records
+        result = dnsdb.search(name="www.fsi.io")
+        assert result.cached is True
+        assert result.records == expected
+
+    assert dnsdb.cache_stats()["writes"]["written"] == 1
+    assert len(fake_dnsdb.requests) == 1
+
+
+def test_prune_and_load(tmp_path):
+    cache = ResultCache(str(tmp_path / "source"), timeout=60)
+    cache.set("old", DATA)
+    cache.set("new", DATA, options={"remote_limit": 10})
+    stream = io.StringIO()
+    assert cache.dump(stream) == 2
+
+    pruned = cache.prune(older_than=30, now=time.time() + 45)
+    assert pruned["aged"] == 2
+    cache.close()
+
+    # entries keep their expiry time and are indexed again
+    cache = ResultCache(str(tmp_path / "target"), timeout=60)
+    stream.seek(0)
+    assert cache.load(stream, now=time.time() + 30) == {"loaded": 2, "skipped": 0}
+    assert cache.disk.get(cache_module.INDEX_PREFIX + "new") is not None
+    stream.seek(0)
+    assert cache.load(stream, now=time.time() + 90) == {"loaded": 0, "skipped": 2}
+    assert cache.get("old")["records"] == RECORDS
+    cache.close()
+
+
+def test_eviction_settings(tmp_path):
+    cache = ResultCache(
+        str(tmp_path), size_limit=2 ** 20, eviction_policy="least-recently-used"
+    )
+    assert cache.disk.size_limit == 2 ** 20
+    cache.close()
+
+    # kept by the store
+    cache = ResultCache(str(tmp_path))
+    assert cache.disk.eviction_policy == "least-recently-used"
+    cache.close()
+
+    with pytest.raises(ValueError):
+        ResultCache(str(tmp_path), eviction_policy="random")
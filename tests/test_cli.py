@@ -0,0 +1,252 @@
+import copy
+import io
+import json
+import subprocess
+import sys
+
+import pytest
+
+from dnsdb.cli import utils
+from dnsdb.records import RecordSet
+from dnsdb.utils import normalize
+from tests.test_client import RECORDS
+
+
+def run_cli(fake_dnsdb, *args):
+    command = [
+        sys.executable,
+        "-m",
+        "dnsdb.cli.cli",
+        "--apikey",
+        "12345",
+        "--server",
+        fake_dnsdb.url,
+        "--config",
+        "/nonexistent/dnsdb.ini",
+    ]
+    return subprocess.Popen(
+        command + list(args),
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+
+def test_no_sort_streams_in_server_order(fake_dnsdb):
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/ANY"] = RECORDS
+
+    process = run_cli(fake_dnsdb, "--name", "www.fsi.io", "--no-sort", "--epoch")
+    stdout, stderr = process.communicate(timeout=30)
+
+    assert process.returncode == 0, stderr
+    lines = [json.loads(line) for line in stdout.decode("utf-8").splitlines()]
+    assert [record["time_last"] for record in lines] == [1417729108, 1538006017]
+
+
+def test_closed_stdout_exits_quietly(fake_dnsdb):
+    records = [dict(RECORDS[0], count=index) for index in range(50000)]
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/ANY"] = records
+
+    process = run_cli(
+        fake_dnsdb, "--name", "www.fsi.io", "--no-sort", "--return-limit", "50000"
+    )
+    assert json.loads(process.stdout.readline())["count"] == 0
+    process.stdout.close()
+    stderr = process.stderr.read()
+    process.wait(timeout=30)
+
+    assert process.returncode == 0
+    assert b"Traceback" not in stderr
+
+
+@pytest.mark.parametrize(
+    "line, query",
+    [
+        ("fsi.io\n", {"name": "fsi.io"}),
+        ("104.244.14.108", {"ip": "104.244.14.108"}),
+        ("104.244.14.0/24", {"ip": "104.244.14.0/24"}),
+        ("2620:11c:f008::108", {"ip": "2620:11c:f008::108"}),
+        ("*.fsi.io", {"name": "*.fsi.io", "wildcard_left": True}),
+        ("fsi.*", {"name": "fsi.*", "wildcard_right": True}),
+        ('{"name": "fsi.io", "type": "A"}', {"name": "fsi.io", "type": "A"}),
+        ("  ", None),
+        ("# comment", None),
+    ],
+)
+def test_parse_query(line, query):
+    assert utils.parse_query(line) == query
+
+
+def test_batch(fake_dnsdb):
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/ANY"] = RECORDS
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/A"] = RECORDS
+    fake_dnsdb.routes["/lookup/rdata/ip/66.160.140.76"] = RECORDS[:1]
+    lines = [
+        "# triage",
+        "www.fsi.io",
+        "66.160.140.76",
+        "missing.fsi.io",
+        '{"name": "www.fsi.io", "type": "A", "return_limit": 1}',
+        "{not json",
+        '{"nmae": "fsi.io"}',
+    ]
+
+    process = run_cli(fake_dnsdb, "--batch", "-", "--epoch", "--max-workers", "3")
+    stdout, stderr = process.communicate("\n".join(lines).encode(), timeout=30)
+
+    assert process.returncode == 1
+    records = [json.loads(line) for line in stdout.decode("utf-8").splitlines()]
+    tags = sorted(record["query"] for record in records)
+    assert tags == [
+        "66.160.140.76",
+        "www.fsi.io",
+        "www.fsi.io",
+        '{"name": "www.fsi.io", "type": "A", "return_limit": 1}',
+    ]
+
+    stderr = stderr.decode("utf-8").splitlines()
+    summary = json.loads(stderr[-1])
+    assert summary["queries"] == 6
+    assert summary["found"] == 3
+    assert summary["not_found"] == 1
+    assert summary["failed"] == 2
+    assert summary["records"] == 4
+    assert summary["requests"] == 4
+    assert summary["quota_remaining"] == "999"
+    assert any("nmae" in line for line in stderr)
+
+
+def test_batch_csv(fake_dnsdb, tmp_path):
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/ANY"] = RECORDS
+    batch = tmp_path / "queries.txt"
+    batch.write_text("www.fsi.io\n")
+
+    process = run_cli(fake_dnsdb, "--batch", str(batch), "-f", "csv", "--epoch")
+    stdout, _ = process.communicate(timeout=30)
+
+    assert process.returncode == 0
+    assert stdout.decode("utf-8").splitlines() == [
+        "query,time_last,time_first,source,count,bailiwick,rrname,rrtype,rdata",
+        "www.fsi.io,1538006017,1433657594,sensor,4838,"
+        "fsi.io.,www.fsi.io.,A,104.244.13.104",
+        "www.fsi.io,1417729108,1381267249,sensor,57,"
+        "fsi.io.,www.fsi.io.,A,66.160.140.76",
+    ]
+
+
+def test_writer_csv_fixed_header_and_rdata_rows():
+    stream = io.StringIO()
+    records = [
+        {"source": "zone", "rrname": "fsi.io.", "rrtype": "NS", "rdata": ["a.", "b."]},
+        {"rrname": "fsi.io.", "rrtype": "A", "rdata": "104.244.13.104"},
+    ]
+    original = copy.deepcopy(records)
+
+    writer = utils.Writer("csv", stream=stream)
+    writer.write(iter(records))
+    writer.flush()
+
+    assert records == original
+    assert stream.getvalue().splitlines() == [
+        "time_last,time_first,source,count,bailiwick,rrname,rrtype,rdata",
+        ",,zone,,,fsi.io.,NS,a.",
+        ",,zone,,,fsi.io.,NS,b.",
+        ",,,,,fsi.io.,A,104.244.13.104",
+    ]
+
+
+def test_writer_json_tagged_and_buffered(monkeypatch):
+    monkeypatch.setattr(utils, "BUFFER_RECORDS", 2)
+    stream = io.StringIO()
+    writes = []
+    monkeypatch.setattr(stream, "write", writes.append)
+
+    writer = utils.Writer("json", stream=stream, tagged=True)
+    writer.write(RECORDS + RECORDS[:1], tag="www.fsi.io")
+    assert len(writes) == 1
+    writer.flush()
+
+    lines = [json.loads(line) for line in "".join(writes).splitlines()]
+    assert len(writes) == 2
+    expected = [dict({"query": "www.fsi.io"}, **record) for record in RECORDS]
+    assert lines == expected + expected[:1]
+    assert list(lines[0])[0] == "query"
+
+
+def test_writer_record_set():
+    records = RecordSet.from_records(normalize(copy.deepcopy(RECORDS)))
+    stream = io.StringIO()
+
+    writer = utils.Writer("jsonp", stream=stream)
+    writer.write(records)
+    writer.flush()
+
+    assert stream.getvalue() == "".join(
+        json.dumps(record, indent=4) + "\n" for record in records.to_dict()
+    )
+
+
+def test_serve_help():
+    process = subprocess.run(
+        [sys.executable, "-m", "dnsdb.cli.cli", "serve", "--help"],
+        stdout=subprocess.PIPE,
+        timeout=30,
+    )
+
+    assert process.returncode == 0
+    assert b"--upstream" in process.stdout
+
+
+def run_cache(*args):
+    command = [sys.executable, "-m", "dnsdb.cli.cli", "cache"] + list(args)
+    return subprocess.run(command, capture_output=True, timeout=30)
+
+
+def test_cache_warm_stats_export_import(fake_dnsdb, tmp_path):
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/ANY"] = RECORDS
+    queries = tmp_path / "queries.txt"
+    queries.write_text("www.fsi.io\nmissing.fsi.io\n")
+    source = str(tmp_path / "source")
+    target = str(tmp_path / "target")
+    exported = str(tmp_path / "cache.jsonl")
+    common = ["--config", "/nonexistent/dnsdb.ini", "--cache-location"]
+
+    warm = common + [source, "--apikey", "12345", "--server", fake_dnsdb.url]
+    process = run_cache("warm", str(queries), *warm)
+    assert process.returncode == 0, process.stderr
+    assert json.loads(process.stdout)["fetched"] == 2
+
+    process = run_cache("warm", str(queries), *warm)
+    assert json.loads(process.stdout)["cached"] == 2
+    assert len(fake_dnsdb.requests) == 2
+
+    stats = json.loads(run_cache("stats", *common, source).stdout)
+    assert stats["entries"] == 2
+    assert stats["found"] == 1
+    assert stats["not_found"] == 1
+    assert stats["records"] == 2
+    assert stats["hit_ratio"] == 0.5
+    assert stats["ages"]["<15m"] == 2
+    assert stats["codecs"] == {"records+zlib:1": 2}
+
+    process = run_cache("export", exported, *common, source)
+    assert json.loads(process.stderr) == {"exported": 2}
+    process = run_cache("import", exported, *common, target)
+    assert json.loads(process.stderr) == {"loaded": 2, "skipped": 0}
+
+    stats = json.loads(run_cache("stats", *common, target).stdout)
+    assert stats["entries"] == 2
+    assert stats["hit_ratio"] is None
+
+    process = run_cache("prune", "--size-limit", "1K", *common, target)
+    assert process.returncode == 0, process.stderr
+    assert json.loads(process.stdout)["evicted"] >= 2
+    assert json.loads(run_cache("stats", *common, target).stdout)["entries"] == 0
+
+
+@pytest.mark.parametrize(
+    "value, size",
+    [("1024", 1024), ("500M", 500 * 1024 ** 2), ("1.5g", 3 * 1024 ** 3 // 2)],
+)
+def test_parse_size(value, size):
+    assert utils.parse_size(value) == size
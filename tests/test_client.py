@@ -0,0 +1,201 @@
+import threading
+
+from dnsdb import Dnsdb
+
+RECORDS = [
+    {
+        "count": 57,
+        "time_first": 1381267249,
+        "time_last": 1417729108,
+        "rrname": "www.fsi.io.",
+        "rrtype": "A",
+        "bailiwick": "fsi.io.",
+        "rdata": ["66.160.140.76"],
+    },
+    {
+        "count": 4838,
+        "time_first": 1433657594,
+        "time_last": 1538006017,
+        "rrname": "www.fsi.io.",
+        "rrtype": "A",
+        "bailiwick": "fsi.io.",
+        "rdata": ["104.244.13.104"],
+    },
+]
+
+
+def test_search_reuses_connection(fake_dnsdb):
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/ANY"] = RECORDS
+
+    with Dnsdb("12345", server=fake_dnsdb.url) as dnsdb:
+        for _ in range(5):
+            result = dnsdb.search(name="www.fsi.io", epoch=True)
+            assert result.status_code == 200
+            assert result.records[0]["time_last"] == 1538006017
+        result = dnsdb.quota()
+        assert result.quota["remaining"] == 999
+
+    assert len(fake_dnsdb.requests) == 6
+    assert fake_dnsdb.connections == 1
+
+
+def test_search_without_keep_alive(fake_dnsdb):
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/ANY"] = RECORDS
+
+    with Dnsdb("12345", server=fake_dnsdb.url, keep_alive=False) as dnsdb:
+        for _ in range(3):
+            dnsdb.search(name="www.fsi.io")
+
+    assert fake_dnsdb.connections == 3
+
+
+def test_search_shared_across_threads(fake_dnsdb):
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/ANY"] = RECORDS
+    status_codes = []
+
+    def worker(dnsdb):
+        for _ in range(10):
+            status_codes.append(dnsdb.search(name="www.fsi.io").status_code)
+
+    with Dnsdb("12345", server=fake_dnsdb.url, pool_maxsize=4) as dnsdb:
+        threads = [threading.Thread(target=worker, args=(dnsdb,)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert status_codes == [200] * 40
+    assert fake_dnsdb.connections <= 4
+
+
+def test_close_is_idempotent(fake_dnsdb):
+    dnsdb = Dnsdb("12345", server=fake_dnsdb.url)
+    dnsdb.close()
+    assert dnsdb.search(name="missing.fsi.io").status_code == 404
+    dnsdb.close()
+    dnsdb.close()
+
+
+def test_iter_search_streams_records(fake_dnsdb):
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/ANY"] = RECORDS
+
+    with Dnsdb("12345", server=fake_dnsdb.url) as dnsdb:
+        result = dnsdb.iter_search(name="www.fsi.io", sort=False, epoch=True)
+        assert result.status_code == 200
+        assert result.quota["remaining"] == "999"
+        assert result.cached is False
+
+        records = iter(result)
+        first = next(records)
+        assert first["source"] == "sensor"
+        assert first["time_last"] == 1417729108
+        assert [record["count"] for record in records] == [4838]
+
+
+def test_iter_search_sorted(fake_dnsdb):
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/ANY"] = RECORDS
+
+    with Dnsdb("12345", server=fake_dnsdb.url) as dnsdb:
+        result = dnsdb.iter_search(name="www.fsi.io")
+        records = list(result)
+
+    assert records == dnsdb.search(name="www.fsi.io").records
+    assert records[0]["time_last"] == "2018-09-26T23:53:37Z"
+
+
+def test_search_without_return_limit(fake_dnsdb):
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/ANY"] = RECORDS
+
+    with Dnsdb("12345", server=fake_dnsdb.url) as dnsdb:
+        sorted_records = dnsdb.search(name="www.fsi.io", return_limit=None).records
+        unsorted = dnsdb.search(name="www.fsi.io", return_limit=None, sort=False)
+
+    assert [record["time_last"] for record in sorted_records] == [
+        "2018-09-26T23:53:37Z",
+        "2014-12-04T21:38:28Z",
+    ]
+    assert len(unsorted.records) == 2
+
+
+def test_iter_search_not_found(fake_dnsdb):
+    with Dnsdb("12345", server=fake_dnsdb.url) as dnsdb:
+        result = dnsdb.iter_search(name="missing.fsi.io")
+
+    assert result.status_code == 404
+    assert result.error["code"] == 404
+    assert list(result) == []
+
+
+def test_iter_search_caches_exhausted_stream(fake_dnsdb, tmp_path):
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/ANY"] = RECORDS
+    dnsdb = Dnsdb(
+        "12345", server=fake_dnsdb.url, cache=True, cache_location=str(tmp_path)
+    )
+
+    with dnsdb:
+        streamed = list(dnsdb.iter_search(name="www.fsi.io"))
+        result = dnsdb.iter_search(name="www.fsi.io")
+        assert result.cached is True
+        assert list(result) == streamed
+
+    assert len(fake_dnsdb.requests) == 1
+
+
+def test_search_many(fake_dnsdb):
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/ANY"] = RECORDS
+    fake_dnsdb.routes["/lookup/rdata/ip/104.244.13.104"] = RECORDS[1:]
+
+    queries = [
+        {"name": "www.fsi.io"},
+        {"ip": "104.244.13.104", "epoch": True},
+        {"name": "missing.fsi.io"},
+        {"name": "www.fsi.io", "wildcard_left": True, "wildcard_right": True},
+        {"domain": "fsi.io"},
+    ]
+
+    with Dnsdb("12345", server=fake_dnsdb.url, max_concurrency=2) as dnsdb:
+        results = list(dnsdb.search_many(queries, max_workers=4))
+
+    assert len(results) == len(queries)
+    by_query = {repr(query): result for query, result in results}
+
+    assert by_query[repr(queries[0])].records[0]["time_last"] == (
+        "2018-09-26T23:53:37Z"
+    )
+    assert by_query[repr(queries[1])].records[0]["time_last"] == 1538006017
+    assert by_query[repr(queries[2])].status_code == 404
+    assert by_query[repr(queries[3])].status_code is None
+    assert "wildcard_left" in by_query[repr(queries[3])].error["message"]
+    assert "domain" in by_query[repr(queries[4])].error["message"]
+    assert len(fake_dnsdb.requests) == 3
+
+
+def test_search_many_checks_cache_first(fake_dnsdb, tmp_path):
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/ANY"] = RECORDS
+    dnsdb = Dnsdb(
+        "12345", server=fake_dnsdb.url, cache=True, cache_location=str(tmp_path)
+    )
+
+    with dnsdb:
+        dnsdb.search(name="www.fsi.io")
+        queries = [{"name": "www.fsi.io"}] * 20
+        results = [result for _, result in dnsdb.search_many(queries)]
+
+    assert all(result.cached for result in results)
+    assert len(fake_dnsdb.requests) == 1
+
+
+def test_search_unsorted_stops_at_return_limit(fake_dnsdb):
+    records = [dict(RECORDS[0], count=index) for index in range(10000)]
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/ANY"] = records
+
+    with Dnsdb("12345", server=fake_dnsdb.url) as dnsdb:
+        result = dnsdb.search(name="www.fsi.io", sort=False, return_limit=3)
+        assert [record["count"] for record in result.records] == [0, 1, 2]
+        assert result.quota["remaining"] == "999"
+
+        # the abandoned connection is not returned to the pool
+        result = dnsdb.search(name="www.fsi.io", return_limit=3)
+        assert len(result.records) == 3
+
+    assert fake_dnsdb.connections == 2
@@ -0,0 +1,100 @@
+import pytest
+
+from dnsdb.cache import ResultCache
+from dnsdb.codecs import LEGACY, get_codec
+from tests.test_client import RECORDS
+
+MIXED = RECORDS + [
+    {
+        "count": 3,
+        "zone_time_first": 1300000000,
+        "zone_time_last": 1400000000,
+        "rrname": "fsi.io.",
+        "rrtype": "NS",
+        "rdata": ["ns1.fsi.io.", "ns2.fsi.io."],
+    },
+    {"count": 1, "rrname": "fsi.io.", "rrtype": "TXT", "rdata": []},
+]
+
+
+@pytest.mark.parametrize(
+    "name",
+    [
+        LEGACY,
+        "json+gzip:1",
+        "json+zlib:1",
+        "json+none",
+        "records+none",
+        "records+zlib:1",
+        "records+gzip:6",
+        "msgpack+none",
+        "json+zstd:3",
+        "json+lz4",
+    ],
+)
+def test_codec_round_trip(name):
+    try:
+        codec = get_codec(name)
+    except ImportError:
+        pytest.skip("optional codec library not installed")
+
+    assert codec.name == name
+    for records in (MIXED, [], None):
+        body, size = codec.encode(records)
+        assert codec.decode(body) == (records, size)
+
+
+@pytest.mark.parametrize(
+    "records",
+    [[{}, {}], [{}, {"rrname": "fsi.io."}, {}], [{"rrname": "fsi.io."}, {}]],
+)
+def test_records_codec_empty_records(records):
+    codec = get_codec("records+none")
+    body, size = codec.encode(records)
+
+    assert codec.decode(body) == (records, size)
+
+
+def test_get_codec_names():
+    assert get_codec("zlib:1").name == "json+zlib:1"
+    assert get_codec("records+zlib").level is None
+
+    for name in ("json+brotli", "yaml+gzip", "json+gzip:fast"):
+        with pytest.raises(ValueError):
+            get_codec(name)
+
+
+@pytest.mark.parametrize(
+    "records",
+    [
+        [{"rrname": "fsi.io.", "count": 2 ** 70}],
+        [{"rrname": "fsi.io.", "rdata": [1, 2]}],
+        [{"rrname": "fsi.io.", "flag": True}],
+        [{"rdata": "fsi.io."}, {"rdata": ["fsi.io."]}],
+    ],
+)
+def test_records_codec_falls_back_to_json(records):
+    codec = get_codec("records+none")
+    body, _ = codec.encode(records)
+
+    assert body[:1] == b"J"
+    assert codec.decode(body)[0] == records
+
+
+def test_entries_of_other_codecs_stay_readable(tmp_path):
+    data = {"records": MIXED, "status_code": 200, "error": None, "quota": None}
+
+    cache = ResultCache(str(tmp_path), codec="json+gzip:9")
+    cache.set("uri", data)
+    cache.close()
+
+    # entries from before codecs were tagged
+    cache = ResultCache(str(tmp_path))
+    entry = cache.disk.get("uri")
+    del entry["meta"]["codec"]
+    cache.disk.set("untagged", entry)
+
+    assert cache.codec.name == "records+zlib:1"
+    assert cache.get("uri")["records"] == MIXED
+    assert cache.get("untagged")["records"] == MIXED
+    cache.close()
@@ -472,3 +472,152 @@ def test_human_date_two():
 
     options = utils.pre_process(options)
     assert options["time_last_after"] == 1528855536
+
+
+def test_iter_post_process_stream():
+
+    options = get_options()
+    options["sort"] = False
+    options["return_limit"] = 1
+
+    records = utils.iter_post_process(options, iter(RECORDS))
+    assert next(records)["time_last"] == "2014-12-04T21:38:28Z"
+    assert list(records) == []
+
+
+def test_sort_limit_matches_full_sort():
+
+    records = [
+        {"time_last": time_last, "rrname": "{}.fsi.io.".format(index)}
+        for index, time_last in enumerate([5, 3, 9, 3, 1, 9, 7, 5, 3])
+    ]
+
+    for limit in range(len(records) + 2):
+        assert utils.sort(records, limit=limit) == utils.sort(records)[:limit]
+
+
+def test_filter_records():
+
+    zone_record = {
+        "zone_time_first": 1300000000,
+        "zone_time_last": 1400000000,
+        "rrname": "fsi.io.",
+    }
+    records = RECORDS + [zone_record]
+
+    filters = {
+        "time_first_before": None,
+        "time_first_after": None,
+        "time_last_before": None,
+        "time_last_after": 1417729108,
+    }
+    assert utils.filter_records(records, filters) == [RECORDS[1]]
+
+    filters["time_last_after"] = None
+    filters["time_first_before"] = 1381267250
+    assert utils.filter_records(records, filters) == [RECORDS[0], zone_record]
+
+
+def test_merge_records():
+
+    zone_record = dict(RECORDS[1], zone_time_first=1300000000)
+    zone_record["zone_time_last"] = zone_record.pop("time_last")
+    del zone_record["time_first"]
+    updated = dict(RECORDS[1], count=5000, time_first=1500000000)
+    updated["time_last"] = 1600000000
+    added = dict(RECORDS[0], rdata=["104.244.14.108"])
+
+    merged, added_count, updated_count = utils.merge_records(
+        RECORDS + [zone_record], [updated, added]
+    )
+
+    assert merged == [
+        RECORDS[0],
+        dict(RECORDS[1], count=5000, time_last=1600000000),
+        zone_record,
+        added,
+    ]
+    assert (added_count, updated_count) == (1, 1)
+    assert RECORDS[1]["count"] == 4838
+
+
+def test_normalize_record_keeps_key_order():
+
+    zone_record = {
+        "count": 3,
+        "zone_time_first": 1300000000,
+        "zone_time_last": 1400000000,
+        "rrname": "fsi.io.",
+    }
+
+    assert list(utils.normalize_record(zone_record)) == [
+        "source",
+        "count",
+        "time_first",
+        "time_last",
+        "rrname",
+    ]
+    assert list(utils.normalize_record(RECORDS[0])) == ["source"] + list(RECORDS[0])
+
+
+def test_format_timestamp_memoized():
+
+    from datetime import datetime
+
+    utils.format_timestamp.cache_clear()
+    for epoch in (1381267249, 1417729108, 1381267249):
+        assert utils.format_timestamp(epoch) == (
+            datetime.fromtimestamp(epoch).isoformat() + "Z"
+        )
+    assert utils.format_timestamp.cache_info().hits == 1
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (1546300800, 1546300800),
+        ("1546300800", 1546300800),
+        (-604800, -604800),
+        ("-604800", -604800),
+        ("-7d", 1546300800 - 7 * 86400),
+        ("-24h", 1546300800 - 86400),
+        ("-15m", 1546300800 - 900),
+        ("-2w", 1546300800 - 14 * 86400),
+        ("2018-06-13T02:05:36Z", 1528855536),
+        ("2018-06-13T04:05:36+02:00", 1528855536),
+        ("2018-06-13 02:05:36.250Z", 1528855536),
+    ],
+)
+def test_parse_time(value, expected):
+
+    assert utils.parse_time(value, now=1546300800) == expected
+
+
+def test_parse_time_local_and_fallback():
+
+    from dateutil.parser import parse
+
+    values = ("2019-01-01", "2019-01-01T12:30", "20160101T12", "2016", "Jan 1 2019")
+    for value in values:
+        assert utils.parse_time(value) == int(parse(value).timestamp())
+
+
+def test_parse_time_yyyymmdd_is_a_date():
+
+    from datetime import datetime
+
+    assert utils.parse_time("20160101") == int(datetime(2016, 1, 1).timestamp())
+    assert utils.parse_time("20160101T00:00:00Z") == 1451606400
+    assert utils.parse_time("1451606400") == 1451606400
+
+
+def test_parse_date_resolves_relative_times_against_one_now():
+
+    options = get_options()
+    options["time_first_after"] = "-7d"
+    options["time_last_after"] = "-7d"
+    options["epoch"] = True
+
+    options = utils.pre_process(options, now=1546300800)
+    assert options["time_first_after"] == 1546300800 - 7 * 86400
+    assert options["time_last_after"] == options["time_first_after"]
@@ -0,0 +1,111 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from dnsdb import Dnsdb
+from dnsdb.flight import AsyncSingleFlight, SingleFlight
+from tests.test_client import RECORDS
+
+
+def test_single_flight_shares_result():
+    flight = SingleFlight()
+    started = threading.Event()
+    calls = []
+    values = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        time.sleep(0.1)
+        return "value"
+
+    def follower():
+        started.wait()
+        values.append(flight.do("key", slow))
+
+    threads = [threading.Thread(target=follower) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    values.append(flight.do("key", slow))
+    for thread in threads:
+        thread.join()
+
+    assert calls == [1]
+    assert values == ["value"] * 6
+    assert flight.stats() == {"calls": 1, "shared": 5}
+
+
+def test_single_flight_shares_exception():
+    flight = SingleFlight()
+    started = threading.Event()
+    errors = []
+
+    def failing():
+        started.set()
+        time.sleep(0.1)
+        raise ValueError("boom")
+
+    def follower():
+        started.wait()
+        try:
+            flight.do("key", failing)
+        except ValueError as exc:
+            errors.append(exc)
+
+    thread = threading.Thread(target=follower)
+    thread.start()
+    with pytest.raises(ValueError):
+        flight.do("key", failing)
+    thread.join()
+
+    assert len(errors) == 1
+    # the key is free again once the call completed
+    assert flight.do("key", lambda: "again") == "again"
+
+
+def test_async_single_flight_shares_result():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "value"
+
+    async def main():
+        return await asyncio.gather(*[flight.do("key", slow) for _ in range(5)])
+
+    assert asyncio.run(main()) == ["value"] * 5
+    assert calls == [1]
+
+
+def test_search_coalesces_identical_queries(fake_dnsdb, tmp_path):
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/ANY"] = RECORDS
+    fake_dnsdb.delay = 0.2
+    barrier = threading.Barrier(8)
+    results = []
+
+    dnsdb = Dnsdb(
+        "12345", server=fake_dnsdb.url, cache=True, cache_location=str(tmp_path)
+    )
+
+    def worker(epoch):
+        barrier.wait()
+        results.append(dnsdb.search(name="www.fsi.io", epoch=epoch))
+
+    with dnsdb:
+        threads = [
+            threading.Thread(target=worker, args=(index % 2 == 0,))
+            for index in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert len(fake_dnsdb.requests) == 1
+    assert sorted(str(result.records[0]["time_last"]) for result in results) == (
+        ["1538006017"] * 4 + ["2018-09-26T23:53:37Z"] * 4
+    )
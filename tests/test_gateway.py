@@ -0,0 +1,114 @@
+import threading
+
+import pytest
+import requests
+
+from dnsdb import Dnsdb
+from dnsdb.gateway import Gateway
+from tests.test_client import RECORDS
+
+
+@pytest.fixture
+def gateway(fake_dnsdb, tmp_path):
+    client = Dnsdb(
+        "12345",
+        server=fake_dnsdb.url,
+        cache=True,
+        cache_location=str(tmp_path),
+        memory_cache_entries=16,
+        results_max=1000000,
+    )
+    server = Gateway(client, ("127.0.0.1", 0))
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.05}
+    )
+    thread.start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+    thread.join()
+    client.close()
+
+
+def test_gateway_serves_and_caches_lookups(fake_dnsdb, gateway):
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/ANY"] = RECORDS
+
+    with Dnsdb("unused", server=gateway.url) as dnsdb:
+        first = dnsdb.search(name="www.fsi.io", epoch=True)
+        second = dnsdb.search(name="www.fsi.io", epoch=True)
+        missing = dnsdb.search(name="missing.fsi.io")
+
+    assert first.status_code == 200
+    assert second.records == first.records
+    assert [record["time_last"] for record in first.records] == [1538006017, 1417729108]
+    assert second.quota["remaining"] == "999"
+    assert missing.status_code == 404
+    assert missing.error["message"] == "Error: no results found for query."
+
+    lookups = [path for path in fake_dnsdb.requests if "www.fsi.io" in path]
+    assert len(lookups) == 1
+    assert gateway.stats()["hits"] == 1
+
+
+def test_gateway_headers_and_subsumption(fake_dnsdb, gateway):
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/ANY"] = RECORDS
+    url = gateway.url + "/lookup/rrset/name/www.fsi.io/ANY"
+
+    resp = requests.get(url + "?limit=100")
+    assert resp.headers["X-Cache"] == "MISS"
+    assert resp.headers["X-RateLimit-Remaining"] == "999"
+    assert resp.headers["Content-Type"] == "application/x-ndjson"
+    assert len(resp.text.splitlines()) == 2
+
+    resp = requests.get(url + "?limit=100&time_last_after=1500000000")
+    assert resp.headers["X-Cache"] == "HIT"
+    assert resp.headers["X-RateLimit-Remaining"] == "999"
+    assert len(resp.text.splitlines()) == 1
+
+    assert len(fake_dnsdb.requests) == 1
+
+
+def test_gateway_quota_and_unknown_path(gateway):
+    with Dnsdb("unused", server=gateway.url) as dnsdb:
+        assert dnsdb.quota().quota["remaining"] == 999
+
+    assert requests.get(gateway.url + "/other").status_code == 404
+
+
+def test_gateway_cache_refresh(fake_dnsdb, tmp_path):
+    path = "/lookup/rrset/name/www.fsi.io/ANY"
+    fake_dnsdb.routes[path] = RECORDS
+    added = dict(RECORDS[0], rdata=["104.244.14.108"], time_last=1600000001)
+    client = Dnsdb(
+        "12345",
+        server=fake_dnsdb.url,
+        cache=True,
+        cache_location=str(tmp_path),
+        cache_timeout=0,
+        cache_refresh=True,
+    )
+    server = Gateway(client, ("127.0.0.1", 0))
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.05}
+    )
+    thread.start()
+
+    try:
+        url = server.url + path + "?limit=100"
+        assert len(requests.get(url).text.splitlines()) == 2
+
+        # expired at once: refreshed with the records seen since it was stored
+        fake_dnsdb.routes[path] = [added]
+        resp = requests.get(url)
+        assert resp.status_code == 200
+        assert len(resp.text.splitlines()) == 3
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+        client.close()
+
+    refresh = fake_dnsdb.requests[1]
+    assert refresh.startswith(path + "?limit=100&time_last_after=")
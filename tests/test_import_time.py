@@ -0,0 +1,70 @@
+import subprocess
+import sys
+
+from dnsdb import Dnsdb
+from tests.test_client import RECORDS
+
+HEAVY = ("requests", "urllib3", "dateutil", "diskcache", "aiohttp", "asyncio")
+
+# cumulative import time of the CLI entry point, in microseconds
+CLI_BUDGET = 100000
+
+
+def run_python(code):
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        timeout=60,
+    )
+    assert process.returncode == 0, process.stderr.decode("utf-8")
+    return process.stdout.decode("utf-8"), process.stderr.decode("utf-8")
+
+
+def imported(importtime):
+    """ the top level packages listed in -X importtime output """
+    packages = set()
+    for line in importtime.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            packages.add(line.rsplit("|", 1)[1].strip().split(".")[0])
+    return packages
+
+
+def cumulative(importtime, module):
+    for line in importtime.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[1])
+    raise AssertionError("{} not imported".format(module))
+
+
+def test_cli_import_budget():
+    _, importtime = run_python("import dnsdb.cli.cli")
+
+    assert not imported(importtime) & set(HEAVY)
+    assert cumulative(importtime, "dnsdb.cli.cli") < CLI_BUDGET
+
+
+def test_client_import_is_light():
+    _, importtime = run_python("from dnsdb import Dnsdb, Result, RecordSet")
+
+    assert not imported(importtime) & set(HEAVY)
+
+
+def test_cache_hit_does_not_import_http_stack(fake_dnsdb, tmp_path):
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/ANY"] = RECORDS
+    with Dnsdb(
+        "12345", server=fake_dnsdb.url, cache=True, cache_location=str(tmp_path)
+    ) as dnsdb:
+        assert dnsdb.search(name="www.fsi.io").cached is False
+
+    code = """
+import sys
+from dnsdb import Dnsdb
+with Dnsdb("12345", server={!r}, cache=True, cache_location={!r}) as dnsdb:
+    result = dnsdb.search(name="www.fsi.io")
+    print(result.cached, len(result.records), "requests" in sys.modules)
+""".format(fake_dnsdb.url, str(tmp_path))
+
+    stdout, _ = run_python(code)
+    assert stdout.split() == ["True", "2", "False"]
@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+from dnsdb import ndjson
+from tests.test_client import RECORDS
+
+BODY = "".join(json.dumps(record) + "\n" for record in RECORDS).encode("utf-8")
+
+
+def chunked(body, size):
+    return [body[start : start + size] for start in range(0, len(body), size)]
+
+
+@pytest.mark.parametrize("size", [1, 7, 64, len(BODY)])
+def test_iter_ndjson_chunk_boundaries(size):
+    assert list(ndjson.iter_ndjson(chunked(BODY, size))) == RECORDS
+
+
+def test_iter_ndjson_crlf_and_missing_final_newline():
+    body = BODY.replace(b"\n", b"\r\n").rstrip()
+    assert list(ndjson.iter_ndjson(chunked(body, 10))) == RECORDS
+
+
+def test_iter_ndjson_blank_lines():
+    body = b"\n\n" + BODY.replace(b"\n", b"\n\n")
+    assert list(ndjson.iter_ndjson([body])) == RECORDS
+
+
+def test_aiter_ndjson():
+    import asyncio
+
+    async def chunks():
+        for chunk in chunked(BODY, 5):
+            yield chunk
+
+    async def main():
+        return [record async for record in ndjson.aiter_ndjson(chunks())]
+
+    assert asyncio.run(main()) == RECORDS
+
+
+def test_get_decoder():
+    assert ndjson.get_decoder()(b'{"a": "\xc3\xa9"}') == {"a": "\u00e9"}
+    assert ndjson.get_decoder("auto")(b'{"a": 1}') == {"a": 1}
+
+    with pytest.raises(ValueError):
+        ndjson.get_decoder("yaml")
+
+
+def test_read_ndjson_restores_gc():
+    import gc
+
+    assert ndjson.read_ndjson(chunked(BODY, 16)) == RECORDS
+    assert gc.isenabled()
+
+
+def test_orjson_decoder():
+    pytest.importorskip("orjson")
+    assert list(ndjson.iter_ndjson(chunked(BODY, 16), "orjson")) == RECORDS
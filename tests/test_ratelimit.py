@@ -0,0 +1,93 @@
+import time
+
+from dnsdb import Dnsdb, RateLimiter
+from tests.test_client import RECORDS
+
+
+def test_rate_from_quota():
+    limiter = RateLimiter()
+    reset = int(time.time()) + 1000
+    limiter.update({"limit": "5000", "remaining": "2000", "reset": str(reset)})
+
+    state = limiter.state()
+    assert 1.9 < state["rate"] <= 2.01
+    assert state["remaining"] == 2000
+    assert state["limit"] == 5000
+
+
+def test_rate_capped_by_max_rate():
+    limiter = RateLimiter(max_rate=1)
+    limiter.update({"remaining": 1000000, "reset": int(time.time()) + 10})
+
+    assert limiter.state()["rate"] == 1
+
+
+def test_unknown_quota_is_not_paced():
+    limiter = RateLimiter(burst=1)
+    limiter.update({"limit": None, "remaining": None, "reset": None})
+
+    for _ in range(20):
+        assert limiter._reserve() == 0
+    assert limiter.state()["rate"] is None
+
+
+def test_burst_then_paced():
+    limiter = RateLimiter(max_rate=10, burst=2)
+
+    assert limiter._reserve() == 0
+    assert limiter._reserve() == 0
+    assert 0.05 < limiter._reserve() <= 0.1
+    assert 0.15 < limiter._reserve() <= 0.2
+
+
+def test_exhausted_quota_pauses_until_reset():
+    limiter = RateLimiter()
+    limiter.update({"remaining": 0, "reset": int(time.time()) + 60})
+
+    assert limiter.state()["paused_for"] > 50
+
+
+def test_retry_delay_is_jittered_and_bounded():
+    limiter = RateLimiter(backoff=1.0, max_backoff=4.0)
+    delays = [limiter.retry_delay(attempt) for attempt in range(10)]
+
+    assert all(0 <= delay <= 4.0 for delay in delays)
+    assert limiter.state()["throttled"] == 10
+
+
+def test_search_retries_throttled_queries(fake_dnsdb):
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/ANY"] = RECORDS
+    fake_dnsdb.statuses = [429, 503]
+    limiter = RateLimiter(backoff=0.01)
+
+    with Dnsdb("12345", server=fake_dnsdb.url, rate_limit=limiter) as dnsdb:
+        result = dnsdb.search(name="www.fsi.io")
+
+    assert result.status_code == 200
+    assert len(fake_dnsdb.requests) == 3
+    state = dnsdb.limiter.state()
+    assert state["throttled"] == 2
+    assert state["remaining"] == 999
+    assert state["in_flight"] == 0
+
+
+def test_search_gives_up_after_max_retries(fake_dnsdb):
+    fake_dnsdb.statuses = [429] * 5
+    limiter = RateLimiter(backoff=0.01, max_retries=2)
+
+    with Dnsdb("12345", server=fake_dnsdb.url, rate_limit=limiter) as dnsdb:
+        result = dnsdb.search(name="www.fsi.io")
+
+    assert result.status_code == 429
+    assert len(fake_dnsdb.requests) == 3
+
+
+def test_quota_updates_limiter(fake_dnsdb):
+    fake_dnsdb.rate = {"limit": 1000, "remaining": 500, "reset": int(time.time()) + 500}
+
+    with Dnsdb("12345", server=fake_dnsdb.url, rate_limit=True) as dnsdb:
+        dnsdb.quota()
+        state = dnsdb.limiter.state()
+
+    assert state["remaining"] == 500
+    assert 0.9 < state["rate"] <= 1.01
@@ -0,0 +1,88 @@
+import copy
+import json
+
+import pytest
+
+from dnsdb import Dnsdb, Result
+from dnsdb import utils
+from dnsdb.records import Record, RecordSet
+
+from tests.test_client import RECORDS
+
+ZONE_RECORD = {
+    "count": 3,
+    "zone_time_first": 1381267249,
+    "zone_time_last": 1417729108,
+    "rrname": "fsi.io.",
+    "rrtype": "NS",
+    "rdata": ["ns1.fsi.io.", "ns2.fsi.io."],
+}
+
+
+def post_process(records, **options):
+    options = dict(dict(sort=True, epoch=False, return_limit=10000), **options)
+    return utils.post_process(options, Result(records=copy.deepcopy(records))).records
+
+
+@pytest.mark.parametrize("epoch", [True, False])
+def test_record_set_matches_dictionaries(epoch):
+    records = RECORDS + [ZONE_RECORD]
+
+    expected = post_process(records, epoch=epoch)
+    actual = post_process(records, epoch=epoch, compact=True)
+
+    assert isinstance(actual, RecordSet)
+    assert len(actual) == 3
+    assert actual.to_dict() == expected
+    assert [dict(record) for record in actual] == expected
+    assert actual == expected
+
+
+def test_record_set_indexing():
+    records = post_process(RECORDS + [ZONE_RECORD], epoch=True, compact=True)
+
+    assert records[0]["time_last"] == 1538006017
+    assert records[-1]["source"] == "zone"
+    assert "bailiwick" not in records[-1]
+    assert records[-1].get("bailiwick") is None
+    assert records[-1]["rdata"] == ["ns1.fsi.io.", "ns2.fsi.io."]
+    assert records[1:].to_dict() == records.to_dict()[1:]
+
+    with pytest.raises(IndexError):
+        records[3]
+
+
+def test_record_set_interns_strings():
+    records = RecordSet.from_records(utils.normalize(copy.deepcopy(RECORDS)))
+
+    assert records._strings == [None, "www.fsi.io.", "A", "fsi.io."]
+
+
+def test_record_is_read_only():
+    record = Record(rrname="fsi.io.", count=1)
+
+    assert dict(record) == {"count": 1, "rrname": "fsi.io."}
+    with pytest.raises(AttributeError):
+        record.count = 2
+    with pytest.raises(AttributeError):
+        record.extra = 1
+
+
+def test_result_to_json_with_record_set():
+    records = post_process(RECORDS, compact=True)
+    result = Result(records=records, status_code=200)
+
+    assert json.loads(result.to_json())["records"] == records.to_dict()
+
+
+def test_search_compact(fake_dnsdb):
+    fake_dnsdb.routes["/lookup/rrset/name/www.fsi.io/ANY"] = RECORDS
+
+    with Dnsdb("12345", server=fake_dnsdb.url) as dnsdb:
+        expected = dnsdb.search(name="www.fsi.io").records
+
+    with Dnsdb("12345", server=fake_dnsdb.url, compact=True) as dnsdb:
+        result = dnsdb.search(name="www.fsi.io")
+
+    assert isinstance(result.records, RecordSet)
+    assert result.records.to_dict() == expected